@@ -0,0 +1,220 @@
+import csv
+import math
+
+from brand_matcher import BrandMatcher, DEFAULT_BRANDS
+from call_metrics import timed
+from checkpoint_journal import open_journal
+from collect_responses import load_queries
+from query_runner import run_queries
+from response_cache import ResponseCache
+
+# ===========================
+# CONFIG
+# ===========================
+# A query stops once every brand's 95% Wilson interval is at most +/- TARGET_HALF_WIDTH,
+# which takes about n = Z^2 * p * (1 - p) / TARGET_HALF_WIDTH^2 samples for the brand whose
+# true mention rate p is closest to 0.5. At +/-0.15 that is, by the rate of that brand:
+#   p = 0 or 1: 9    p = 0.1: 18    p = 0.2: 26    p = 0.3: 33    p = 0.5: 39
+# MAX_SAMPLES sits above the worst case, so the cap only binds on unlucky draws, and
+# queries where every brand is rarely (or always) mentioned stop after a handful of calls.
+TARGET_HALF_WIDTH = 0.15
+MIN_SAMPLES = 3             # samples per query before the stopping rule is applied
+MAX_SAMPLES = 50            # hard cap per query
+MAX_IN_FLIGHT_PER_QUERY = 2  # samples of one query running at the same time
+MAX_CONSECUTIVE_ERRORS = 3   # a query is given up after this many failed samples in a row
+Z = 1.959963984540054       # 95% confidence
+
+SAMPLE_FIELDNAMES = ["query_id", "sample", "query_text", "topic", "response_text"]
+RATE_FIELDNAMES = ["query_id", "topic", "brand", "samples", "mentions", "rate", "ci_low", "ci_high"]
+
+
+def wilson_interval(mentions, n, z=Z):
+    """Wilson score interval for a binomial proportion; (0, 1) without data"""
+    if n == 0:
+        return 0.0, 1.0
+    p = mentions / n
+    denom = 1 + z * z / n
+    center = (p + z * z / (2 * n)) / denom
+    half = z * math.sqrt(p * (1 - p) / n + z * z / (4 * n * n)) / denom
+    return max(0.0, center - half), min(1.0, center + half)
+
+
+def rates_path(output_file):
+    return output_file + ".rates.csv"
+
+
+class AdaptiveSampler:
+    """Decides which query to sample next, one call at a time.
+
+    Every answer is scanned with the same BrandMatcher as extract_mentions.py. A query
+    stays open while the widest per-brand Wilson interval of its mention rates is
+    wider than +/- target (after min_samples, up to max_samples). Among open queries,
+    the next call goes to the one with the widest interval, so calls are spent where
+    they shrink the uncertainty most instead of N times on every query.
+
+    Failed samples count towards max_samples, and a query that fails
+    MAX_CONSECUTIVE_ERRORS times in a row is closed. `max_calls` defaults to what fixed
+    sampling at the cap would cost, so a run always ends.
+    """
+
+    def __init__(self, queries, brands=None, target=TARGET_HALF_WIDTH, min_samples=MIN_SAMPLES,
+                 max_samples=MAX_SAMPLES, max_calls=None):
+        self.matcher = BrandMatcher(brands or DEFAULT_BRANDS)
+        self.queries = {q["query_id"]: q for q in queries}
+        self.order = [q["query_id"] for q in queries]
+        self.target = target
+        self.min_samples = min_samples
+        self.max_samples = max_samples
+        self.max_calls = max_calls if max_calls is not None else len(self.order) * max_samples
+        self.calls = 0
+        self.errors = 0
+        n_brands = len(self.matcher.brands)
+        self.n = {qid: 0 for qid in self.order}
+        self.failed = {qid: 0 for qid in self.order}
+        self.error_streak = {qid: 0 for qid in self.order}
+        self.counts = {qid: [0] * n_brands for qid in self.order}
+        self.in_flight = {qid: 0 for qid in self.order}
+        self.next_sample = {qid: 0 for qid in self.order}
+
+    def add(self, row):
+        """Count one answered sample (from a finished call or a resumed journal)"""
+        qid = row["query_id"]
+        if qid not in self.n:
+            return
+        self.next_sample[qid] = max(self.next_sample[qid], int(row["sample"]) + 1)
+        if row["response_text"].startswith("ERROR:"):
+            self.errors += 1
+            self.failed[qid] += 1
+            self.error_streak[qid] += 1
+            return
+        self.error_streak[qid] = 0
+        self.n[qid] += 1
+        for i, flag in enumerate(self.matcher.mention_flags(row["response_text"])):
+            self.counts[qid][i] += flag
+
+    def half_width(self, qid):
+        n = self.n[qid]
+        widths = [(hi - lo) / 2 for lo, hi in (wilson_interval(m, n) for m in self.counts[qid])]
+        return max(widths) if widths else 0.0
+
+    def attempts(self, qid):
+        """Samples taken so far, answered or failed"""
+        return self.n[qid] + self.failed[qid]
+
+    def gave_up(self, qid):
+        return self.error_streak[qid] >= MAX_CONSECUTIVE_ERRORS
+
+    def is_open(self, qid):
+        n = self.n[qid]
+        if self.attempts(qid) >= self.max_samples or self.gave_up(qid):
+            return False
+        return n < self.min_samples or self.half_width(qid) > self.target
+
+    def refill(self):
+        """Next query to sample, as a one-item list (empty when nothing is worth a call now)"""
+        if self.calls >= self.max_calls:
+            return []
+        best, best_key = None, None
+        for qid in self.order:
+            n, running = self.n[qid], self.in_flight[qid]
+            if (not self.is_open(qid) or self.attempts(qid) + running >= self.max_samples
+                    or running >= MAX_IN_FLIGHT_PER_QUERY):
+                continue
+            if n + running >= self.min_samples and running:
+                continue    # wait for the answer in flight before judging this query again
+            key = (n + running < self.min_samples, self.half_width(qid), -n)
+            if best_key is None or key > best_key:
+                best, best_key = qid, key
+        if best is None:
+            return []
+        self.in_flight[best] += 1
+        self.calls += 1
+        sample = self.next_sample[best]
+        self.next_sample[best] += 1
+        return [{**self.queries[best], "sample": sample}]
+
+    def on_result(self, row):
+        self.in_flight[row["query_id"]] -= 1
+        self.add(row)
+
+    def rates(self):
+        """Per (query, brand) rows of RATE_FIELDNAMES"""
+        out = []
+        for qid in self.order:
+            n = self.n[qid]
+            for brand, m in zip(self.matcher.brands, self.counts[qid]):
+                lo, hi = wilson_interval(m, n)
+                out.append({"query_id": qid, "topic": self.queries[qid]["topic"], "brand": brand,
+                            "samples": n, "mentions": m, "rate": f"{m / n:.4f}" if n else "",
+                            "ci_low": f"{lo:.4f}", "ci_high": f"{hi:.4f}"})
+        return out
+
+
+def run_adaptive(provider, queries_file, output_file=None, brands=None, target=TARGET_HALF_WIDTH,
+                 min_samples=MIN_SAMPLES, max_samples=MAX_SAMPLES, max_calls=None, **runner_kwargs):
+    """Repeatedly sample every query until its mention-rate intervals are narrow enough.
+
+    Samples go to `<output>` (one row per query and sample, journaled so an interrupted run
+    resumes); per-brand rates with Wilson intervals go to `<output>.rates.csv`.
+    """
+    output_file = output_file or provider.default_output.replace(".csv", "_samples.csv")
+    queries = load_queries(queries_file)
+    sampler = AdaptiveSampler(queries, brands, target, min_samples, max_samples, max_calls)
+
+    journal, existing = open_journal(output_file, SAMPLE_FIELDNAMES, ("query_id", "sample"))
+    for row in existing.values():
+        sampler.add(row)
+    if existing:
+        print(f"Resuming with {len(existing)} samples from {journal.path}")
+    open_before = sum(sampler.is_open(qid) for qid in sampler.order)
+    print(f"{open_before}/{len(queries)} queries need more samples with {provider.name} ({provider.model}); "
+          f"target +/-{target} per brand, {min_samples}-{max_samples} samples per query")
+
+    def on_result(row):
+        if not row["response_text"].startswith("ERROR:"):
+            journal.append(row)
+        sampler.on_result(row)
+
+    provider.preflight()
+    kwargs = {
+        "max_in_flight": provider.max_in_flight,
+        "requests_per_minute": provider.requests_per_minute,
+        "tokens_per_minute": provider.tokens_per_minute,
+    }
+    kwargs.update({k: v for k, v in runner_kwargs.items() if v is not None})
+    cache = ResponseCache()
+    try:
+        run_queries(
+            [], provider.complete, provider.is_rate_limit, provider.is_auth_error,
+            on_result=on_result,
+            previously_completed=len(existing),
+            cache=cache,
+            provider=provider.name,
+            model=provider.model,
+            params=provider.params,
+            refill=sampler.refill,
+            **kwargs,
+        )
+    finally:
+        journal.close()
+        print(cache.summary())
+        cache.close()
+        with timed(runner_kwargs.get("metrics"), "compact"):
+            journal.compact(output_file, sampler.order)
+            with open(rates_path(output_file), "w", newline="", encoding="utf-8") as f:
+                writer = csv.DictWriter(f, fieldnames=RATE_FIELDNAMES)
+                writer.writeheader()
+                writer.writerows(sampler.rates())
+
+    total = sum(sampler.n.values())
+    still_open = [qid for qid in sampler.order if sampler.is_open(qid)]
+    given_up = [qid for qid in sampler.order if sampler.gave_up(qid)]
+    print(f"\n✓ {sampler.calls} samples requested this run ({sampler.errors} errors), {total} samples in total; "
+          f"fixed sampling at the cap would need {len(queries) * max_samples}")
+    if still_open:
+        print(f"  {len(still_open)} queries did not reach the target (call budget exhausted)")
+    if given_up:
+        print(f"  {len(given_up)} queries given up after {MAX_CONSECUTIVE_ERRORS} failed samples in a row: "
+              f"{', '.join(given_up[:10])}")
+    print(f"  Samples in {output_file}, rates in {rates_path(output_file)}")
+    return output_file
@@ -0,0 +1,75 @@
+import argparse
+import time
+
+import pandas as pd
+
+from clogit import ConditionalLogit, average_marginal_effects, format_margins
+from features import FeaturePipeline
+from schema import read_table
+
+# ===========================
+# CONFIG
+# ===========================
+DATASET_FILE = "data/dataset.csv"
+
+# Python counterpart of the pooled model in ../analysis.do:
+#   clogit mention z_social_buzz z_articles z_review_index z_seo i.source_id, ///
+#       group(query_id) vce(cluster query_id) or
+#   margins, dydx(*)
+LEVERS = ["z_social_buzz", "z_articles", "z_review_index", "z_seo"]
+GROUP_COL = "query_id"
+SOURCE_COL = "source"
+
+INPUT_COLS = ["query_id", "source", "brand", "topic", "mention", "avgrating_b_g2", "reviewcount_b_g2",
+              "lighthouse_seo_b", "listicle_topic_hits_bt", "reddit_topic_hits_bt",
+              "youtube_topic_hits_bt", "linkedin_topic_hits_bt", "domain_topic_hits_bt"]
+
+
+def load_model_data(path=DATASET_FILE):
+    """The constructor's output (CSV or Parquet), restricted to the columns the model uses"""
+    if path.endswith(".csv"):
+        return read_table("dataset", path, usecols=INPUT_COLS)
+    return pd.read_parquet(path, columns=INPUT_COLS)
+
+
+def source_dummies(sources):
+    """i.source: one indicator per source except the first in sort order (Stata's base level)"""
+    levels = sorted(pd.unique(sources))
+    return pd.DataFrame({f"{level}.{SOURCE_COL}": (sources == level).astype(float) for level in levels[1:]},
+                        index=sources.index)
+
+
+def design(df, pipeline=None):
+    """Outcome, regressor matrix (levers + source indicators), names and groups"""
+    levers = (pipeline or FeaturePipeline()).transform(df, LEVERS)
+    X = pd.concat([levers, source_dummies(df[SOURCE_COL])], axis=1)
+    return df["mention"].to_numpy(float), X.to_numpy(float), list(X.columns), df[GROUP_COL].to_numpy()
+
+
+def fit_model(df):
+    y, X, names, groups = design(df)
+    model = ConditionalLogit(y, X, groups, names)
+    result = model.fit()
+    factors = [name for name in names if name.endswith(f".{SOURCE_COL}")]
+    return result, average_marginal_effects(result, factors)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Pooled conditional logit of brand mentions (analysis.do, section 5-6)")
+    parser.add_argument("--dataset", default=DATASET_FILE, help="dataset.csv or dataset.parquet")
+    parser.add_argument("--coef", action="store_true", help="report coefficients instead of odds ratios")
+    args = parser.parse_args(argv)
+
+    df = load_model_data(args.dataset)
+    start = time.perf_counter()
+    result, margins = fit_model(df)
+    elapsed = time.perf_counter() - start
+
+    print(result.summary(odds_ratios=not args.coef))
+    print()
+    print(format_margins(margins))
+    print(f"\nEstimated in {elapsed:.2f}s ({result.iterations} Newton iterations)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,80 @@
+import random
+import re
+import time
+
+from brand_matcher import BrandMatcher
+
+# ===========================
+# CONFIG
+# ===========================
+BRAND_COUNTS = [7, 50, 200, 1000]
+N_TEXTS = 300
+WORDS_PER_TEXT = 400    # roughly a multi-KB LLM answer
+SEED = 0
+
+SYLLABLES = ["ka", "lo", "pass", "vault", "key", "guard", "safe", "nord",
+             "bit", "dash", "lock", "zen", "pro", "max", "sec", "net"]
+FILLER = ("the a password manager is best for security and price with sync "
+          "across devices family plan free tier browser extension").split()
+
+
+def make_brands(rng, n_brands):
+    """Synthetic two-part brand names with optional-space aliases, like "bit ?warden"."""
+    brands = {}
+    while len(brands) < n_brands:
+        first = "".join(rng.choice(SYLLABLES) for _ in range(rng.randint(1, 2)))
+        second = "".join(rng.choice(SYLLABLES) for _ in range(rng.randint(1, 2)))
+        aliases = [f"{first} ?{second}"]
+        if rng.random() < 0.2:
+            aliases.append(first)            # short alias that prefixes the long one
+        if rng.random() < 0.1:
+            aliases.append(f"{first}[- ]{second}")  # character class, still expanded into the trie
+        if rng.random() < 0.01:
+            aliases.append(f"{first}\\W?{second}")  # non-literal alias, regex fallback path
+        brands[(first + second).capitalize()] = aliases
+    return brands
+
+
+def make_texts(rng, brands, n_texts):
+    vocab = FILLER * 20 + ["".join(rng.choice(SYLLABLES) for _ in range(3)) for _ in range(2000)]
+    names = list(brands)
+    texts = []
+    for _ in range(n_texts):
+        words = [rng.choice(vocab) for _ in range(WORDS_PER_TEXT)]
+        for brand in rng.sample(names, min(4, len(names))):
+            mention = rng.choice(brands[brand]).replace(" ?", rng.choice(["", " "])).replace("[- ]", "-").replace("\\W?", "-")
+            if rng.random() < 0.3:
+                mention = mention.upper()
+            words.insert(rng.randrange(len(words)), mention)
+        texts.append(" ".join(words))
+    return texts
+
+
+def per_brand_flags(patterns, text):
+    """The original extract_mentions.py approach: one regex search per brand"""
+    return [1 if pattern.search(text) else 0 for pattern in patterns]
+
+
+def main():
+    rng = random.Random(SEED)
+    print(f"{'brands':>7} {'per-brand (s)':>14} {'matcher (s)':>12} {'speedup':>8}  identical")
+    for n_brands in BRAND_COUNTS:
+        brands = make_brands(rng, n_brands)
+        texts = make_texts(rng, brands, N_TEXTS)
+        patterns = [re.compile(r"\b(?:" + "|".join(aliases) + r")\b", re.IGNORECASE)
+                    for aliases in brands.values()]
+
+        start = time.perf_counter()
+        expected = [per_brand_flags(patterns, text) for text in texts]
+        t_naive = time.perf_counter() - start
+
+        start = time.perf_counter()
+        matcher = BrandMatcher(brands)
+        got = [matcher.mention_flags(text) for text in texts]
+        t_matcher = time.perf_counter() - start
+
+        print(f"{n_brands:>7} {t_naive:>14.3f} {t_matcher:>12.3f} {t_naive / t_matcher:>7.1f}x  {expected == got}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,326 @@
+import argparse
+import csv
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import time
+
+import numpy as np
+
+from benchmark_matcher import make_brands
+
+# ===========================
+# CONFIG
+# ===========================
+# name -> (queries per source, brands); every scale has len(SOURCES) responses per query
+# and writes queries x sources x brands rows to mentions and dataset. dataset.csv repeats
+# the response text on every brand row, so wide and large need several GB with the pandas
+# engine; --engine duckdb builds it out of core
+SCALES = {
+    "smoke": (500, 7),
+    "medium": (25000, 50),
+    "wide": (2500, 1000),        # 5k responses x 10^3 brands
+    "large": (500000, 20),       # 10^6 responses
+}
+SOURCES = ["chatgpt", "gemini"]
+TOPICS = ["Price", "Security", "Fit/Use"]
+STEPS = ["extract", "construct", "fit"]
+SEED = 0
+WORDS_PER_RESPONSE = 150
+MENTIONS_PER_RESPONSE = 4      # average brands named per answer, whatever the brand count
+GENERATE_CHUNK = 10000         # queries generated at a time
+
+BENCH_DIR = "benchmark_data"   # synthetic corpora, one directory per scale
+RESULTS_FILE = "data/benchmark_results.jsonl"
+REGRESSION_TOLERANCE = 0.25    # slower than the recent median by more than this is flagged
+BASELINE_RUNS = 5
+
+SCRIPTS_DIR = os.path.dirname(os.path.abspath(__file__))
+FILLER = ("the a password manager is best for security and price with sync across devices family "
+          "plan free tier browser extension open source audit vault sharing autofill support").split()
+QUERY_TEMPLATES = ["Which password manager is best for {}?", "What is the most reliable option for {}?",
+                   "Compare password managers for {}", "Recommend a password manager for {}"]
+
+
+# ===========================
+# SYNTHETIC CORPUS
+# ===========================
+
+def _sigmoid(x):
+    return 1 / (1 + np.exp(-x))
+
+
+def _mention_text(rng, aliases):
+    """One surface form of a brand, as benchmark_matcher.make_texts writes it"""
+    text = rng.choice(aliases).replace(" ?", rng.choice(["", " "])).replace("[- ]", "-").replace("\\W?", "-")
+    return text.upper() if rng.random() < 0.1 else text
+
+
+def _write_csv(path, header, rows):
+    with open(path, "w", newline="", encoding="utf-8") as f:
+        writer = csv.writer(f)
+        writer.writerow(header)
+        writer.writerows(rows)
+
+
+def generate(root, n_queries, n_brands, seed=SEED):
+    """Write a deterministic synthetic corpus under root/data in the layout of the real one.
+
+    Brand features and topic hits are drawn first; whether a response names a brand is
+    then drawn from a logit in those features plus a source effect, so the fitted model
+    has real signal. Responses insert the brand aliases into filler text.
+    """
+    rng = random.Random(seed)
+    np_rng = np.random.default_rng(seed)
+    data_dir = os.path.join(root, "data")
+    os.makedirs(data_dir, exist_ok=True)
+
+    brands = make_brands(rng, n_brands)
+    names = list(brands)
+    _write_csv(os.path.join(data_dir, "brands.csv"), ["brand", "alias"],
+               [(brand, alias) for brand, aliases in brands.items() for alias in aliases])
+
+    rating_tp = np.round(np_rng.uniform(3.0, 5.0, n_brands), 1)
+    rating_g2 = np.round(np_rng.uniform(3.5, 5.0, n_brands), 1)
+    reviews_tp = np_rng.lognormal(6, 1.5, n_brands).astype(int) + 1
+    reviews_g2 = np_rng.lognormal(5, 1.2, n_brands).astype(int) + 1
+    seo = np_rng.integers(60, 101, n_brands)
+    _write_csv(os.path.join(data_dir, "brand_features.csv"),
+               ["brand", "avgrating_b_tp", "reviewcount_b_tp", "avgrating_b_g2", "reviewcount_b_g2", "lighthouse_seo_b"],
+               [(b, f"{rating_tp[i]:.1f}".replace(".", ","), reviews_tp[i], f"{rating_g2[i]:.1f}".replace(".", ","),
+                 reviews_g2[i], seo[i]) for i, b in enumerate(names)])
+
+    hits = np_rng.lognormal([1.5, 8, 6, 6, 6], 1.2, (n_brands, len(TOPICS), 5)).astype(int)
+    _write_csv(os.path.join(data_dir, "topic_brand_hits.csv"),
+               ["brand", "topic", "listicle_topic_hits_bt", "reddit_topic_hits_bt", "youtube_topic_hits_bt",
+                "linkedin_topic_hits_bt", "domain_topic_hits_bt"],
+               [(b, topic, *hits[i, t]) for i, b in enumerate(names) for t, topic in enumerate(TOPICS)])
+
+    # Mention propensity per (brand, topic): standardized log buzz and reviews, a brand effect
+    def z(x):
+        return (x - x.mean()) / (x.std() or 1)
+
+    buzz = z(np.log1p(hits[:, :, 1:4].sum(axis=2)))
+    review = z(rating_g2 * np.log1p(reviews_g2))[:, None]
+    rate = min(0.5, MENTIONS_PER_RESPONSE / n_brands)
+    base = np.log(rate) - np.log1p(-rate)
+    logit_bt = base + 0.6 * buzz + 0.4 * review + np_rng.normal(0, 0.5, (n_brands, 1))
+    source_effect = {source: 0.3 * k for k, source in enumerate(SOURCES)}
+
+    queries = [(q, QUERY_TEMPLATES[q % len(QUERY_TEMPLATES)].format(TOPICS[q % len(TOPICS)].lower()) + f" #{q}",
+                TOPICS[q % len(TOPICS)]) for q in range(1, n_queries + 1)]
+    _write_csv(os.path.join(data_dir, "queries.csv"), ["query_id", "query_text", "topic"], queries)
+
+    manifest = []
+    for source in SOURCES:
+        path = os.path.join(data_dir, f"responses_{source}.csv")
+        with open(path, "w", newline="", encoding="utf-8") as f:
+            writer = csv.writer(f)
+            writer.writerow(["query_id", "query_text", "topic", "response_text"])
+            for lo in range(0, n_queries, GENERATE_CHUNK):
+                chunk = queries[lo:lo + GENERATE_CHUNK]
+                topic_idx = np.array([TOPICS.index(q[2]) for q in chunk])
+                p = _sigmoid(logit_bt[:, topic_idx].T + source_effect[source])
+                named = np_rng.random(p.shape) < p
+                for (qid, text, topic), row in zip(chunk, named):
+                    words = rng.choices(FILLER, k=WORDS_PER_RESPONSE)
+                    for b in np.flatnonzero(row):
+                        words.insert(rng.randrange(len(words) + 1), _mention_text(rng, brands[names[b]]))
+                    writer.writerow([qid, text, topic, " ".join(words)])
+        manifest.append([source, f"data/responses_{source}.csv", f"data/mentions_{source}.csv"])
+    _write_csv(os.path.join(data_dir, "sources.csv"), ["source", "responses_file", "mentions_file"], manifest)
+
+
+def ensure_corpus(scale, n_queries, n_brands, seed=SEED, bench_dir=BENCH_DIR):
+    """Corpus directory for these parameters, generated unless an identical one exists;
+    returns (root, seconds spent generating or None)"""
+    root = os.path.abspath(os.path.join(bench_dir, scale))
+    params = {"queries": n_queries, "brands": n_brands, "sources": SOURCES, "seed": seed,
+              "words": WORDS_PER_RESPONSE, "mentions_per_response": MENTIONS_PER_RESPONSE}
+    params_file = os.path.join(root, "params.json")
+    if os.path.exists(params_file):
+        with open(params_file, encoding="utf-8") as f:
+            if json.load(f) == params:
+                return root, None
+    start = time.perf_counter()
+    generate(root, n_queries, n_brands, seed)
+    with open(params_file, "w", encoding="utf-8") as f:
+        json.dump(params, f)
+    return root, time.perf_counter() - start
+
+
+# ===========================
+# TIMED STEPS
+# ===========================
+
+class StepFailed(Exception):
+    def __init__(self, message, output):
+        super().__init__(message)
+        self.output = output
+
+
+def run_step(args, cwd):
+    """Run one script in cwd; returns wall seconds, CPU seconds and peak RSS in MB of the
+    process and the workers it waited for (CPU and memory are None where os.wait4 is missing)"""
+    start = time.perf_counter()
+    proc = subprocess.Popen([sys.executable, *args], cwd=cwd, stdout=subprocess.PIPE,
+                            stderr=subprocess.STDOUT, text=True)
+    output = proc.stdout.read()
+    proc.stdout.close()
+    cpu = rss_mb = None
+    if hasattr(os, "wait4"):
+        _, status, usage = os.wait4(proc.pid, 0)
+        proc.returncode = os.waitstatus_to_exitcode(status)
+        cpu = usage.ru_utime + usage.ru_stime
+        # ru_maxrss is in KB on Linux, bytes on macOS
+        rss_mb = usage.ru_maxrss / (1024 * 1024 if sys.platform == "darwin" else 1024)
+    else:
+        proc.wait()
+    wall = time.perf_counter() - start
+    if proc.returncode != 0:
+        # A negative code is the killing signal, typically 9 from the out-of-memory killer
+        reason = f"killed by signal {-proc.returncode}" if proc.returncode < 0 else f"exit code {proc.returncode}"
+        raise StepFailed(f"{os.path.basename(args[0])} failed ({reason})", output)
+    return wall, cpu, rss_mb
+
+
+def step_commands(step, engine):
+    script = lambda name: os.path.join(SCRIPTS_DIR, name)
+    if step == "extract":
+        return [[script("extract_mentions.py"), "--responses", f"data/responses_{s}.csv",
+                 "--mentions", f"data/mentions_{s}.csv", "--brands", "data/brands.csv", "--full"]
+                for s in SOURCES]
+    if step == "construct":
+        # Runs from the corpus directory, so the constructor's data/... defaults point into it
+        return [[script("dataset_constructor.py"), "--sources", "data/sources.csv", "--engine", engine]]
+    if step == "fit":
+        return [[script("analysis.py"), "--dataset", "data/dataset.csv"]]
+    raise ValueError(step)
+
+
+def benchmark(scale, n_queries, n_brands, steps=STEPS, engine="pandas", seed=SEED):
+    root, gen_seconds = ensure_corpus(scale, n_queries, n_brands, seed)
+    result = {
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "commit": _git_commit(),
+        "host": platform.node(),
+        "python": platform.python_version(),
+        "cpus": os.cpu_count(),
+        "scale": scale,
+        "queries": n_queries,
+        "responses": n_queries * len(SOURCES),
+        "brands": n_brands,
+        "engine": engine,
+        "seed": seed,
+        "generate_s": None if gen_seconds is None else round(gen_seconds, 3),
+        "steps": {},
+    }
+    for step in steps:
+        timing = {"seconds": 0.0, "cpu_s": 0.0, "peak_rss_mb": 0.0}
+        try:
+            for args in step_commands(step, engine):
+                wall, cpu, rss_mb = run_step(args, root)
+                timing["seconds"] += wall
+                timing["cpu_s"] = None if cpu is None else timing["cpu_s"] + cpu
+                timing["peak_rss_mb"] = None if rss_mb is None else max(timing["peak_rss_mb"], rss_mb)
+        except StepFailed as e:
+            # Later steps need this one's output; the failure itself is the result
+            result["steps"][step] = {"error": str(e)}
+            print(f"  {step:<10} {e}")
+            print("    " + "\n    ".join(e.output.strip().splitlines()[-5:]))
+            break
+        result["steps"][step] = {k: None if v is None else round(v, 3) for k, v in timing.items()}
+        rss = "" if timing["peak_rss_mb"] is None else f", peak {timing['peak_rss_mb']:.0f} MB"
+        print(f"  {step:<10} {timing['seconds']:>9.2f}s{rss}")
+    return result
+
+
+def _git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=SCRIPTS_DIR,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+# ===========================
+# RESULTS
+# ===========================
+
+def load_results(path=RESULTS_FILE):
+    if not os.path.exists(path):
+        return []
+    with open(path, encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def regressions(result, history, tolerance=REGRESSION_TOLERANCE, runs=BASELINE_RUNS):
+    """(step, seconds, baseline) for steps slower than the median of the last `runs`
+    comparable results by more than tolerance; seconds is None for a step that failed"""
+    comparable = [r for r in history if all(r.get(k) == result[k] for k in
+                                            ("scale", "queries", "brands", "engine", "host", "cpus"))][-runs:]
+    found = []
+    for step, timing in result["steps"].items():
+        past = sorted(r["steps"][step]["seconds"] for r in comparable if "seconds" in r["steps"].get(step, {}))
+        if "error" in timing:
+            if past:
+                found.append((step, None, past[len(past) // 2]))
+            continue
+        if not past:
+            continue
+        baseline = past[len(past) // 2]
+        if timing["seconds"] > baseline * (1 + tolerance):
+            found.append((step, timing["seconds"], baseline))
+    return found
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Offline benchmark of mention extraction, dataset construction "
+                                                 "and model fitting on a synthetic corpus")
+    parser.add_argument("--scale", choices=list(SCALES), default="smoke")
+    parser.add_argument("--queries", type=int, help="queries per source (overrides the scale)")
+    parser.add_argument("--brands", type=int, help="number of brands (overrides the scale)")
+    parser.add_argument("--steps", default=",".join(STEPS), help=f"comma-separated subset of {','.join(STEPS)}")
+    parser.add_argument("--engine", choices=["pandas", "duckdb"], default="pandas", help="dataset_constructor engine")
+    parser.add_argument("--seed", type=int, default=SEED)
+    parser.add_argument("--results", default=RESULTS_FILE, help="JSONL file the run is appended to")
+    parser.add_argument("--no-record", action="store_true", help="do not append this run to the results file")
+    parser.add_argument("--check", action="store_true", help="exit with status 1 if a step regressed")
+    args = parser.parse_args(argv)
+
+    n_queries, n_brands = SCALES[args.scale]
+    n_queries = args.queries or n_queries
+    n_brands = args.brands or n_brands
+    steps = [s for s in args.steps.split(",") if s]
+    unknown = [s for s in steps if s not in STEPS]
+    if unknown:
+        parser.error(f"unknown steps {unknown}")
+
+    scale = args.scale if (args.queries, args.brands) == (None, None) else f"{args.scale}-custom"
+    print(f"Benchmark '{scale}': {n_queries * len(SOURCES)} responses, {n_brands} brands "
+          f"({n_queries * len(SOURCES) * n_brands} mention rows)")
+    result = benchmark(scale, n_queries, n_brands, steps, args.engine, args.seed)
+    if result["generate_s"] is not None:
+        print(f"  (corpus generated in {result['generate_s']:.1f}s)")
+
+    history = load_results(args.results)
+    slow = regressions(result, history)
+    for step, seconds, baseline in slow:
+        took = "failed" if seconds is None else f"took {seconds:.2f}s"
+        print(f"⚠ {step} {took} vs a recent median of {baseline:.2f}s")
+    if not args.no_record:
+        if os.path.dirname(args.results):
+            os.makedirs(os.path.dirname(args.results), exist_ok=True)
+        with open(args.results, "a", encoding="utf-8") as f:
+            f.write(json.dumps(result) + "\n")
+        print(f"Recorded in {args.results}")
+    failed = any("error" in timing for timing in result["steps"].values())
+    if failed or (args.check and slow):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
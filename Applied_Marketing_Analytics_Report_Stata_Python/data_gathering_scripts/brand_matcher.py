@@ -0,0 +1,254 @@
+import csv
+import functools
+import hashlib
+import json
+import re
+
+# Brand -> alias regex fragments. Each alias is matched as \b(?:alias)\b, case-insensitive,
+# so "1 ?password" matches "1Password" and "1 password".
+DEFAULT_BRANDS = {
+    "1Password": [r"1 ?password"],
+    "Bitwarden": [r"bit ?warden"],
+    "LastPass": [r"last ?pass"],
+    "Dashlane": [r"dash ?lane"],
+    "Keeper": [r"keeper"],
+    "NordPass": [r"nord ?pass"],
+    "RoboForm": [r"robo ?form"],
+}
+
+MAX_LITERAL_VARIANTS = 64   # aliases with more optional characters fall back to a plain regex
+_REGEX_META = set(".^$*+{}[]|()")
+
+
+def load_brands(path):
+    """Read brand aliases from a CSV with `brand,alias` columns (one row per alias).
+
+    An empty alias means the brand name itself, matched literally.
+    """
+    brands = {}
+    with open(path, newline="", encoding="utf-8") as f:
+        for row in csv.DictReader(f):
+            alias = (row.get("alias") or "").strip() or re.escape(row["brand"])
+            brands.setdefault(row["brand"], []).append(alias)
+    return brands
+
+
+def _literal_variants(fragment):
+    """Expand a regex fragment made of literal characters, simple classes like `[- ]`
+    and single-character `?` into every string it can match; None if it uses any
+    other regex syntax"""
+    atoms = []
+    i = 0
+    while i < len(fragment):
+        c = fragment[i]
+        if c == "\\":
+            if i + 1 >= len(fragment) or fragment[i + 1].isalnum():
+                return None  # \b, \d, \w, ... are not literals
+            chars = [fragment[i + 1]]
+            i += 2
+        elif c == "[":
+            end = fragment.find("]", i + 2)
+            chars = list(fragment[i + 1:end])
+            # Ranges, negation, escapes and nested syntax are left to the regex engine
+            if end < 0 or chars[0] == "^" or any(ch in "\\[-" for ch in chars[1:-1]):
+                return None
+            i = end + 1
+        elif c in _REGEX_META or c == "?":
+            return None
+        else:
+            chars = [c]
+            i += 1
+        optional = i < len(fragment) and fragment[i] == "?"
+        if optional:
+            i += 1
+            if i < len(fragment) and fragment[i] in "?+":
+                return None  # lazy/possessive quantifiers
+        atoms.append((chars, optional))
+
+    variants = [""]
+    for chars, optional in atoms:
+        variants = [v + ch for v in variants for ch in chars] + (variants if optional else [])
+        if len(variants) > MAX_LITERAL_VARIANTS:
+            return None
+    if "" in variants:
+        return None  # an alias that can match nothing needs real \b semantics
+    return variants
+
+
+@functools.lru_cache(maxsize=None)
+def _cased_chars():
+    """Every character with another case form (all of them lie below U+1F000)"""
+    return "".join(c for c in map(chr, range(0x1F000)) if c.lower() != c or c.upper() != c or c.casefold() != c)
+
+
+@functools.lru_cache(maxsize=None)
+def fold_char(c):
+    """The one character standing for c's class of characters equal under re.IGNORECASE.
+
+    That is not always c.lower(): "İ".lower() is two characters, "ſ" and the Kelvin sign
+    match "s" and "k", and "µ" matches "μ". The class is found by the regex engine
+    itself; ASCII characters fold to their lowercase.
+    """
+    if c.isascii():
+        return c.lower()
+    same = re.findall(re.escape(c), _cased_chars(), re.IGNORECASE)
+    return min(same, key=lambda x: (x != x.lower(), x)) if same else c
+
+
+def fold_case(text):
+    """text with every character replaced by fold_char()"""
+    return text.lower() if text.isascii() else "".join(map(fold_char, text))
+
+
+def _trie_regex(node):
+    """Regex equivalent of a character trie, shared prefixes factored out"""
+    alternatives = [re.escape(c) + _trie_regex(child) for c, child in sorted(node.items()) if c != ""]
+    if not alternatives:
+        return ""
+    body = alternatives[0] if len(alternatives) == 1 else "(?:" + "|".join(alternatives) + ")"
+    if "" in node:
+        body = "(?:" + body + ")?"
+    return body
+
+
+def _is_word(c):
+    # Same definition of a word character as \b in Python's re (str patterns)
+    return c.isalnum() or c == "_"
+
+
+class BrandMatcher:
+    """Finds which brands a text mentions, scanning it once for all brands.
+
+    Literal aliases (plain characters, simple classes like `[- ]` and optional `?`
+    characters, e.g. "1 ?password") are expanded into a character trie. A single regex
+    shaped like that trie finds every word-boundary position where some alias starts,
+    and walking the trie from there yields all brands matching at that position. The result is the same as running
+    `re.search(r"\\b(?:alias)\\b", text, re.IGNORECASE)` per brand, but the cost no longer
+    grows with the number of brands. Aliases using other regex syntax are searched
+    separately.
+    """
+
+    def __init__(self, brands=None):
+        brands = brands or DEFAULT_BRANDS
+        self.brands = list(brands)
+        self.aliases = {brand: list(aliases) for brand, aliases in brands.items()}
+        self.trie = {}
+        self.regex_brands = []   # (brand index, compiled pattern) for non-literal aliases
+        self.max_literal = 0     # longest literal alias variant, in characters
+
+        for i, brand in enumerate(self.brands):
+            complex_aliases = []
+            for alias in self.aliases[brand]:
+                variants = _literal_variants(alias)
+                if variants is None:
+                    complex_aliases.append(alias)
+                    continue
+                for variant in variants:
+                    self.max_literal = max(self.max_literal, len(variant))
+                    node = self.trie
+                    for c in variant:
+                        node = node.setdefault(fold_char(c), {})
+                    node.setdefault("", set()).add(i)
+            if complex_aliases:
+                pattern = re.compile(r"\b(?:" + "|".join(complex_aliases) + r")\b", re.IGNORECASE)
+                self.regex_brands.append((i, pattern))
+
+        # Changes whenever a brand or alias is added, removed, renamed or reordered
+        self.version = hashlib.sha256(
+            json.dumps([[brand, self.aliases[brand]] for brand in self.brands]).encode("utf-8")
+        ).hexdigest()[:16]
+
+        self.candidates = None
+        if self.trie:
+            self.candidates = re.compile(r"\b(?=" + _trie_regex(self.trie) + r"\b)", re.IGNORECASE)
+
+    def _walk(self, text, pos, found):
+        """Add every brand with a literal alias matching text[pos:] up to a word boundary"""
+        node = self.trie
+        n = len(text)
+        while True:
+            if "" in node and (pos == n or _is_word(text[pos - 1]) != _is_word(text[pos])):
+                found |= node[""]
+            if pos >= n:
+                return
+            node = node.get(fold_char(text[pos]))
+            if node is None:
+                return
+            pos += 1
+
+    def find(self, text):
+        """Set of indices (into self.brands) of the brands mentioned in text"""
+        found = set()
+        if self.candidates is not None:
+            for m in self.candidates.finditer(text):
+                self._walk(text, m.start(), found)
+                if len(found) == len(self.brands):
+                    return found
+        for i, pattern in self.regex_brands:
+            if i not in found and pattern.search(text):
+                found.add(i)
+        return found
+
+    def mention_flags(self, text):
+        """0/1 mention flag per brand, in self.brands order"""
+        found = self.find(text)
+        return [1 if i in found else 0 for i in range(len(self.brands))]
+
+    def scanner(self):
+        """An incremental scan for text that arrives in pieces (see StreamScan)"""
+        return StreamScan(self)
+
+
+class StreamScan:
+    """BrandMatcher.find() over a text fed piece by piece, e.g. a streamed LLM answer.
+
+    A literal alias starting at some position is decided once the max_literal
+    characters after it have arrived (the character after an alias settles the word
+    boundary), so `feed()` reports brands as soon as they are certain, even when an alias
+    is split across pieces. Only a short undecided tail is kept for rescanning, so the
+    text is scanned about once in total. `finish()` decides the tail and runs the
+    non-literal aliases over the full text; its result equals `find()` on the joined text.
+    """
+
+    def __init__(self, matcher):
+        self.matcher = matcher
+        self.parts = []
+        self.found = set()
+        self.window = ""   # undecided tail, preceded by one character of left context
+        self.start = 0     # first undecided position in window (0 only at the start of the text)
+
+    def _scan(self, end):
+        """Decide the positions of window[self.start:end]; return the brands found there"""
+        matcher = self.matcher
+        new = set()
+        if end <= self.start:
+            return new
+        if matcher.candidates is not None and len(self.found) < len(matcher.brands):
+            # Same string, so \b before self.start still sees the left context character
+            for m in matcher.candidates.finditer(self.window, self.start):
+                if m.start() >= end:
+                    break
+                found = set()
+                matcher._walk(self.window, m.start(), found)
+                new |= found - self.found
+                self.found |= found
+        self.window = self.window[end - 1:]
+        self.start = 1
+        return new
+
+    def feed(self, piece):
+        """Add a piece of text; return the indices of brands first found with it"""
+        self.parts.append(piece)
+        self.window += piece
+        return self._scan(len(self.window) - self.matcher.max_literal)
+
+    def finish(self):
+        """Set of indices of every brand mentioned in the whole text"""
+        self._scan(len(self.window))
+        text = None
+        for i, pattern in self.matcher.regex_brands:
+            if i not in self.found:
+                text = "".join(self.parts) if text is None else text
+                if pattern.search(text):
+                    self.found.add(i)
+        return self.found
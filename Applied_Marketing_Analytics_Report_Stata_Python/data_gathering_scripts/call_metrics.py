@@ -0,0 +1,144 @@
+import contextlib
+import json
+import math
+import time
+import uuid
+
+# ===========================
+# CONFIG
+# ===========================
+QUANTILES = [0.5, 0.95, 0.99]
+# Retry classes, from the providers' is_rate_limit / is_auth_error
+ERROR_CLASSES = ["rate_limit", "auth", "other"]
+
+
+def metrics_path(output_file):
+    return output_file + ".metrics.jsonl"
+
+
+def quantile(values, q):
+    """Nearest-rank quantile; None without values"""
+    if not values:
+        return None
+    values = sorted(values)
+    return values[max(0, math.ceil(q * len(values)) - 1)]
+
+
+def new_call(query_id, sample=None, provider=None, model=None):
+    """Empty record for one query; the runner fills it in and passes it to CallMetrics.record()"""
+    call = {
+        "event": "call", "query_id": query_id, "provider": provider, "model": model,
+        "status": None, "cached": False, "attempts": 0,
+        "retries": {c: 0 for c in ERROR_CLASSES},
+        "limiter_wait_s": 0.0, "network_s": 0.0, "backoff_s": 0.0, "write_s": 0.0, "total_s": 0.0,
+        "latency_s": None, "prompt_tokens": None, "completion_tokens": None, "total_tokens": None,
+    }
+    if sample is not None:
+        call["sample"] = sample
+    return call
+
+
+class CallMetrics:
+    """Structured per-call measurements of one collection run, appended to a JSONL file.
+
+    The runner adds one "call" record per query (cached, answered or failed) with the
+    wall time split into rate-limiter waits, network time and retry backoff, token
+    usage and retries per error class. Named phases (e.g. compacting the journal into
+    the CSV) are timed with `phase()`. `close()` appends a "summary" record with
+    latency quantiles and throughput. Records of several runs share the file and are
+    told apart by their run id.
+    """
+
+    def __init__(self, path=None, provider=None, model=None):
+        self.path = path
+        self.run_id = uuid.uuid4().hex[:12]
+        self.provider = provider
+        self.model = model
+        self.calls = []
+        self.phases = {}
+        self.started = time.perf_counter()
+        self.f = open(path, "a", encoding="utf-8") if path else None
+
+    def _write(self, record):
+        if self.f is not None:
+            self.f.write(json.dumps({"run": self.run_id, **record}, ensure_ascii=False) + "\n")
+            self.f.flush()
+
+    def record(self, call):
+        for key in ("limiter_wait_s", "network_s", "backoff_s", "write_s", "total_s", "latency_s"):
+            if call[key] is not None:
+                call[key] = round(call[key], 4)
+        self.calls.append(call)
+        self._write(call)
+
+    @contextlib.contextmanager
+    def phase(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            self.phases[name] = self.phases.get(name, 0.0) + elapsed
+            self._write({"event": "phase", "phase": name, "seconds": round(elapsed, 4)})
+
+    def summary(self):
+        wall = time.perf_counter() - self.started
+        answered = [c for c in self.calls if not c["cached"] and c["latency_s"] is not None]
+        latencies = [c["latency_s"] for c in answered]
+        totals = [c["total_s"] for c in self.calls if not c["cached"]]
+        tokens = sum(c["total_tokens"] or 0 for c in answered)
+        return {
+            "event": "summary",
+            "provider": self.provider,
+            "model": self.model,
+            "wall_s": round(wall, 3),
+            "calls": len(self.calls),
+            "cached": sum(c["cached"] for c in self.calls),
+            "errors": sum(c["status"] != "ok" for c in self.calls),
+            "attempts": sum(c["attempts"] for c in self.calls),
+            "retries": {k: sum(c["retries"][k] for c in self.calls) for k in ERROR_CLASSES},
+            "latency_s": {f"p{round(q * 100)}": quantile(latencies, q) for q in QUANTILES},
+            "total_s": {f"p{round(q * 100)}": quantile(totals, q) for q in QUANTILES},
+            "limiter_wait_s": round(sum(c["limiter_wait_s"] for c in self.calls), 3),
+            "network_s": round(sum(c["network_s"] for c in self.calls), 3),
+            "backoff_s": round(sum(c["backoff_s"] for c in self.calls), 3),
+            "write_s": round(sum(c["write_s"] for c in self.calls), 3),
+            "phases_s": {k: round(v, 3) for k, v in self.phases.items()},
+            "calls_per_minute": round(len(self.calls) / wall * 60, 2) if wall > 0 else None,
+            "tokens_per_minute": round(tokens / wall * 60) if wall > 0 else None,
+        }
+
+    def close(self):
+        """Write and return the run summary"""
+        summary = self.summary()
+        self._write(summary)
+        if self.f is not None:
+            self.f.close()
+            self.f = None
+        return summary
+
+
+def format_summary(summary):
+    """Human-readable lines for a summary record"""
+    def q(d):
+        return " / ".join("-" if v is None else f"{v:.2f}" for v in d.values())
+
+    retries = ", ".join(f"{n} {k}" for k, n in summary["retries"].items())
+    lines = [
+        f"metrics: {summary['calls']} calls ({summary['cached']} cached, {summary['errors']} errors) "
+        f"in {summary['wall_s']:.1f}s = {summary['calls_per_minute']} calls/min, "
+        f"{summary['tokens_per_minute']} tokens/min",
+        f"  latency p50/p95/p99 {q(summary['latency_s'])}s per call, "
+        f"{q(summary['total_s'])}s incl. waits and retries",
+        f"  time in network {summary['network_s']:.1f}s, rate limiter {summary['limiter_wait_s']:.1f}s, "
+        f"retry backoff {summary['backoff_s']:.1f}s, result writes {summary['write_s']:.1f}s (summed over calls)",
+        f"  {summary['attempts']} attempts, retries: {retries}",
+    ]
+    if summary["phases_s"]:
+        lines.append("  " + ", ".join(f"{k} {v:.2f}s" for k, v in summary["phases_s"].items()))
+    return lines
+
+
+def timed(metrics, name):
+    """metrics.phase(name), or a no-op without metrics"""
+    return metrics.phase(name) if metrics is not None else contextlib.nullcontext()
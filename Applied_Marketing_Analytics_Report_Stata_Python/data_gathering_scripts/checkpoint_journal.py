@@ -0,0 +1,127 @@
+import csv
+import json
+import os
+
+FIELDNAMES = ["query_id", "query_text", "topic", "response_text"]
+
+
+def journal_path(output_file):
+    """Journal that backs a given responses CSV"""
+    return output_file + ".journal.jsonl"
+
+
+class Journal:
+    """Append-only JSONL checkpoint with one fsync'd record per completed query.
+
+    The journal is the source of truth while a run is in progress; the responses CSV
+    is only materialized from it by `compact()`. A crash can at worst leave a torn
+    last line, which `replay()` drops instead of losing earlier records.
+
+    Records are keyed by `key_fields`: query_id by default, query_id and sample for
+    repeated sampling.
+    """
+
+    def __init__(self, path, fieldnames=FIELDNAMES, key_fields=("query_id",)):
+        self.path = path
+        self.fieldnames = list(fieldnames)
+        self.key_fields = tuple(key_fields)
+        self.f = None
+
+    def key(self, row):
+        if len(self.key_fields) == 1:
+            return row[self.key_fields[0]]
+        return tuple(row[k] for k in self.key_fields)
+
+    def replay(self):
+        """Return {key: row} for every complete record (later records win)"""
+        rows = {}
+        if not os.path.exists(self.path):
+            return rows
+
+        good_end = 0
+        with open(self.path, "rb") as f:
+            for line in f:
+                if not line.endswith(b"\n"):
+                    break  # torn write from a crash
+                try:
+                    row = json.loads(line)
+                except ValueError:
+                    break
+                rows[self.key(row)] = row
+                good_end += len(line)
+
+        # Drop a torn tail so the next append starts on a clean line
+        if good_end < os.path.getsize(self.path):
+            print(f"⚠ Dropping incomplete last record from {self.path}")
+            with open(self.path, "r+b") as f:
+                f.truncate(good_end)
+        return rows
+
+    def _open(self):
+        if self.f is None:
+            self.f = open(self.path, "a", encoding="utf-8")
+
+    def append(self, row):
+        """Durably record one finished query"""
+        self.append_many([row])
+
+    def append_many(self, rows):
+        """Durably record several rows with a single fsync"""
+        self._open()
+        for row in rows:
+            self.f.write(json.dumps({k: row.get(k, "") for k in self.fieldnames}, ensure_ascii=False) + "\n")
+        self.f.flush()
+        os.fsync(self.f.fileno())
+
+    def close(self):
+        if self.f is not None:
+            self.f.close()
+            self.f = None
+
+    def ordered_rows(self, query_order=None):
+        """Every journaled row, ordered by `query_order` ids"""
+        rows = list(self.replay().values())
+        if query_order is not None:
+            position = {qid: i for i, qid in enumerate(query_order)}
+            # Rows that are not in queries.csv anymore are kept first, as in older runs
+            # Further key fields (e.g. the sample index) order the records of one query
+            rows.sort(key=lambda r: (position.get(r["query_id"], -1),)
+                      + tuple(int(r[k]) for k in self.key_fields[1:]))
+        return rows
+
+    def compact(self, output_file, query_order=None):
+        """Materialize the journal as a CSV (atomically replaced), ordered by `query_order` ids"""
+        rows = self.ordered_rows(query_order)
+        write_csv_atomic(output_file, self.fieldnames, rows)
+        return len(rows)
+
+
+def write_csv_atomic(path, fieldnames, rows):
+    """Write rows to path via a temporary file, so readers never see a partial CSV;
+    keys outside fieldnames are left out"""
+    tmp_file = path + ".tmp"
+    with open(tmp_file, "w", newline="", encoding="utf-8") as f:
+        writer = csv.DictWriter(f, fieldnames=fieldnames, extrasaction="ignore")
+        writer.writeheader()
+        writer.writerows(rows)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_file, path)
+
+
+def open_journal(output_file, fieldnames=FIELDNAMES, key_fields=("query_id",)):
+    """Open the journal for `output_file` and return it with the rows completed so far.
+
+    A responses CSV written before journals existed is imported once, so older runs
+    still resume where they stopped.
+    """
+    journal = Journal(journal_path(output_file), fieldnames, key_fields)
+    existing = journal.replay()
+    if not existing and os.path.exists(output_file):
+        with open(output_file, "r", newline="", encoding="utf-8") as f:
+            legacy_rows = list(csv.DictReader(f))
+        if legacy_rows:
+            print(f"Importing {len(legacy_rows)} rows from existing {output_file} into {journal.path}")
+            journal.append_many(legacy_rows)
+            existing = {journal.key(row): row for row in legacy_rows}
+    return journal, existing
@@ -0,0 +1,349 @@
+import math
+
+import numpy as np
+
+# ===========================
+# CONFIG
+# ===========================
+MAX_ITER = 50
+TOLERANCE = 1e-12        # convergence when g' (-H)^-1 g falls below this
+CHUNK_GROUPS = 20000     # groups evaluated at once; bounds memory for the exact-likelihood recursion
+WARM_START_GROUPS = 20000  # larger samples start Newton from a fit on this many random groups
+Z_95 = 1.959963984540054
+
+
+def normal_pvalue(z):
+    """Two-sided p-value of a standard normal statistic"""
+    return np.array([math.erfc(abs(v) / math.sqrt(2)) for v in np.atleast_1d(z)])
+
+
+def chi2_pvalue(x, df):
+    """Upper tail of a chi-squared distribution with integer degrees of freedom"""
+    half = x / 2
+    if df % 2 == 0:
+        return math.exp(-half) * sum(half ** i / math.factorial(i) for i in range(df // 2))
+    tail = math.erfc(math.sqrt(half))
+    return tail + math.exp(-half) * sum(half ** (i + 0.5) / math.gamma(i + 1.5) for i in range(df // 2))
+
+
+class ConditionalLogit:
+    """Conditional (fixed-effects) logit, as Stata's `clogit y x, group(g)`.
+
+    The likelihood is the exact conditional one: with k positives among the n rows of a
+    group, each group contributes exp(sum of x'b over the positives) divided by the sum of
+    exp(sum of x'b) over all k-subsets of its rows. That denominator is built with prefix
+    and suffix recursions over the rows, vectorized across all groups of the same size;
+    groups with a single positive reduce to a plain log-sum-exp. Groups with k > n/2 are evaluated on the complement (flipped outcome,
+    negated x), which gives the same likelihood with a shorter recursion.
+
+    Groups where every row has the same outcome carry no information and are dropped,
+    as are rows with missing values.
+    """
+
+    def __init__(self, y, X, groups, names=None, clusters=None):
+        y = np.asarray(y, dtype=float)
+        X = np.asarray(X, dtype=float)
+        groups = np.asarray(groups)
+        if X.ndim == 1:
+            X = X[:, None]
+        self.names = list(names) if names is not None else [f"x{j + 1}" for j in range(X.shape[1])]
+
+        complete = ~np.isnan(X).any(axis=1) & ~np.isnan(y)
+        group_ids, group_index = np.unique(groups[complete], return_inverse=True)
+        positives = np.bincount(group_index, weights=y[complete] != 0)
+        sizes = np.bincount(group_index)
+        informative = (positives > 0) & (positives < sizes)
+
+        keep = np.flatnonzero(complete)[informative[group_index]]
+        self.sample = np.zeros(len(y), dtype=bool)      # estimation sample, in input order
+        self.sample[keep] = True
+        self.n_dropped_groups = int((~informative).sum())
+        self.group_ids = group_ids[informative]
+        self.n_groups = len(self.group_ids)
+        self.n_obs = len(keep)
+        if self.n_groups == 0:
+            raise ValueError("no group has both positive and negative outcomes")
+
+        # Cluster of each retained group (default: the group itself, as vce(cluster group))
+        renumber = np.cumsum(informative) - 1
+        g = renumber[group_index[informative[group_index]]]
+        if clusters is None:
+            self.cluster_of_group = np.arange(self.n_groups)
+        else:
+            cluster_ids, c = np.unique(np.asarray(clusters)[keep], return_inverse=True)
+            self.cluster_of_group = np.zeros(self.n_groups, dtype=int)
+            self.cluster_of_group[g] = c
+        self.n_clusters = int(self.cluster_of_group.max()) + 1
+
+        self.X = X[keep]
+        self.y = y[keep] != 0
+        self.row_group = g
+        self._buckets = self._bucket(self.X, self.y, g)
+
+    def _bucket(self, X, y, g):
+        """Dense blocks of groups with the same (size, positives); X is stored rows-first,
+        as (rows, groups, vars), so each step of the recursions reads contiguous memory"""
+        order = np.argsort(g, kind="stable")
+        X, y, g = X[order], y[order], g[order]
+        starts = np.flatnonzero(np.r_[True, g[1:] != g[:-1]])
+        sizes = np.diff(np.r_[starts, len(g)])
+        positives = np.add.reduceat(y.astype(int), starts)
+
+        buckets = []
+        for n in np.unique(sizes):
+            for k in np.unique(positives[sizes == n]):
+                members = np.flatnonzero((sizes == n) & (positives == k))
+                flip = k > n - k
+                rows = (starts[members][:, None] + np.arange(n)).ravel()
+                Xb = X[rows].reshape(len(members), n, -1)
+                yb = y[rows].reshape(len(members), n)
+                if flip:
+                    Xb, yb = -Xb, ~yb
+                for lo in range(0, len(members), CHUNK_GROUPS):
+                    hi = lo + CHUNK_GROUPS
+                    buckets.append({
+                        "groups": g[starts[members[lo:hi]]],
+                        "k": int(n - k if flip else k),
+                        "X": np.ascontiguousarray(Xb[lo:hi].transpose(1, 0, 2)),
+                        "x_pos": (Xb[lo:hi] * yb[lo:hi, :, None]).sum(axis=1),
+                    })
+        return buckets
+
+    @staticmethod
+    def _bucket_terms(bucket, beta, hessian):
+        """Per-group log-likelihood, score and (optionally) Hessian for one block"""
+        X, k = bucket["X"], bucket["k"]
+        xb = X @ beta
+        c = xb.max(axis=0)
+        w = np.exp(xb - c)
+
+        if k == 1:
+            # Single positive: log-sum-exp over the group's rows
+            total = w.sum(axis=0)
+            pi = w / total
+            mean = np.einsum("ng,ngj->gj", pi, X)
+            ll = bucket["x_pos"] @ beta - (np.log(total) + c)
+            hess = None
+            if hessian:
+                second = np.einsum("ngj,ngl->gjl", pi[:, :, None] * X, X)
+                hess = -(second - mean[:, :, None] * mean[:, None, :])
+            return ll, bucket["x_pos"] - mean, hess
+
+        # Exact denominator: e_k(w), the sum over k-subsets of the product of their weights.
+        # Prefix and suffix recursions give, for every row i, L_i = e_{k-1}(w without i);
+        # then Pr(i is a positive) = w_i L_i / e_k, and E[T T'] for the sufficient statistic
+        # T = sum of x over the positives follows from the derivatives of L_i, so the
+        # Hessian never needs second-derivative recursions.
+        n, G, P = X.shape
+        prefix = np.zeros((n + 1, k, G))    # prefix[j, a] = e_a(w of rows before j)
+        suffix = np.zeros((n + 1, k, G))    # suffix[j, a] = e_a(w of rows from j on)
+        prefix[0, 0] = suffix[n, 0] = 1.0
+        if hessian:
+            d_prefix = np.zeros((n + 1, k, G, P))
+            d_suffix = np.zeros((n + 1, k, G, P))
+            step = np.empty((k - 1, G, P))
+        for j in range(n):
+            top = min(j + 1, k - 1)     # highest level that can be non-zero after j + 1 rows
+            for e, d, cur, nxt, row in ((prefix, d_prefix if hessian else None, j, j + 1, j),
+                                         (suffix, d_suffix if hessian else None, n - j, n - 1 - j, n - 1 - j)):
+                e[nxt] = e[cur]
+                e[nxt, 1:top + 1] += w[row] * e[cur, :top]
+                if hessian:
+                    t = np.multiply(e[cur, :top, :, None], X[row], out=step[:top])
+                    t += d[cur, :top]
+                    t *= w[row, :, None]
+                    np.add(d[cur, 1:top + 1], t, out=d[nxt, 1:top + 1])
+
+        # L_i = sum over a of e_a(rows before i) * e_{k-1-a}(rows after i)
+        after = suffix[1:, ::-1]
+        L = np.einsum("nag,nag->ng", prefix[:n], after)
+        wL = w * L
+        e_k = wL.sum(axis=0) / k
+        pi = wL / e_k
+        mean = np.einsum("ng,ngj->gj", pi, X)
+        ll = bucket["x_pos"] @ beta - (np.log(e_k) + k * c)
+        hess = None
+        if hessian:
+            # Second moment E[T T'] = sum_i (w_i / e_k) x_i (L_i x_i + dL_i)'
+            dL = L[:, :, None] * X
+            for a in range(k):
+                dL += d_prefix[:n, a] * after[:, a, :, None]
+                dL += prefix[:n, a, :, None] * d_suffix[1:, k - 1 - a]
+            second = np.matmul(((w / e_k)[:, :, None] * X).transpose(1, 2, 0), dL.transpose(1, 0, 2))
+            second = (second + second.transpose(0, 2, 1)) / 2
+            hess = -(second - mean[:, :, None] * mean[:, None, :])
+        return ll, bucket["x_pos"] - mean, hess
+
+    def loglike(self, beta, weights=None, hessian=True):
+        """Log-likelihood, per-group scores (n_groups x k) and Hessian at beta.
+
+        `weights` multiplies each group's contribution (e.g. cluster-bootstrap counts).
+        """
+        beta = np.asarray(beta, dtype=float)
+        P = len(beta)
+        ll = 0.0
+        scores = np.zeros((self.n_groups, P))
+        hess = np.zeros((P, P)) if hessian else None
+        for bucket in self._buckets:
+            w = 1.0 if weights is None else weights[bucket["groups"]]
+            ll_g, score_g, hess_g = self._bucket_terms(bucket, beta, hessian)
+            ll += float(np.sum(w * ll_g))
+            scores[bucket["groups"]] = score_g
+            if hessian:
+                hess += np.einsum("g,gjl->jl", np.broadcast_to(w, len(ll_g)), hess_g)
+        return ll, scores, hess
+
+    def null_loglike(self):
+        """Log-likelihood at beta = 0: minus the log number of k-subsets, summed over groups"""
+        return -sum(math.log(math.comb(b["X"].shape[0], b["k"])) * len(b["groups"]) for b in self._buckets)
+
+    def fit(self, start=None, weights=None, max_iter=MAX_ITER, tol=TOLERANCE, cov=True):
+        """Newton-Raphson with step halving; returns a ClogitResult with cluster-robust covariance.
+
+        Without `start`, large samples first fit a random subset of WARM_START_GROUPS groups,
+        so the full-sample iterations begin close to the optimum.
+        """
+        if start is None and weights is None and self.n_groups > WARM_START_GROUPS:
+            chosen = np.zeros(self.n_groups, dtype=bool)
+            chosen[np.random.default_rng(0).choice(self.n_groups, WARM_START_GROUPS, replace=False)] = True
+            rows = chosen[self.row_group]
+            subset = ConditionalLogit(self.y[rows], self.X[rows], self.row_group[rows], self.names)
+            start = subset.fit(max_iter=max_iter, cov=False).params
+        beta = np.zeros(self.X.shape[1]) if start is None else np.array(start, dtype=float)
+        ll, scores, hess = self.loglike(beta, weights)
+        converged = False
+        for iteration in range(1, max_iter + 1):
+            grad = scores.sum(axis=0) if weights is None else weights @ scores
+            step = np.linalg.solve(-hess, grad)
+            if grad @ step < tol:
+                converged = True
+                break
+            t = 1.0
+            while True:
+                candidate = beta + t * step
+                ll_new, scores_new, hess_new = self.loglike(candidate, weights)
+                if ll_new >= ll or t < 1e-10:
+                    break
+                t /= 2
+            beta, ll, scores, hess = candidate, ll_new, scores_new, hess_new
+        else:
+            iteration = max_iter
+
+        vcov = self.robust_cov(scores, hess, weights) if cov else None
+        return ClogitResult(self, beta, vcov, ll, iteration, converged)
+
+    def robust_cov(self, scores, hess, weights=None):
+        """Cluster-robust sandwich H^-1 (sum_c s_c s_c') H^-1 scaled by C/(C-1), as Stata"""
+        if weights is not None:
+            scores = scores * weights[:, None]
+        cluster_scores = np.zeros((self.n_clusters, scores.shape[1]))
+        np.add.at(cluster_scores, self.cluster_of_group, scores)
+        bread = np.linalg.inv(-hess)
+        meat = cluster_scores.T @ cluster_scores
+        C = self.n_clusters
+        return bread @ meat @ bread * C / (C - 1)
+
+
+class ClogitResult:
+    """Estimates from ConditionalLogit.fit"""
+
+    def __init__(self, model, params, vcov, loglik, iterations, converged):
+        self.model = model
+        self.names = model.names
+        self.params = params
+        self.vcov = vcov
+        self.loglik = loglik
+        self.iterations = iterations
+        self.converged = converged
+
+    @property
+    def bse(self):
+        return np.sqrt(np.diag(self.vcov))
+
+    def table(self, odds_ratios=False):
+        """Rows of (name, estimate, se, z, p, ci_low, ci_high); `odds_ratios` as Stata's `or` option"""
+        z = self.params / self.bse
+        p = normal_pvalue(z)
+        lo, hi = self.params - Z_95 * self.bse, self.params + Z_95 * self.bse
+        est, se = self.params, self.bse
+        if odds_ratios:
+            est = np.exp(self.params)
+            se = est * self.bse     # delta method, as Stata reports it
+            lo, hi = np.exp(lo), np.exp(hi)
+        return list(zip(self.names, est, se, z, p, lo, hi))
+
+    def summary(self, odds_ratios=False):
+        model = self.model
+        ll0 = model.null_loglike()
+        wald = float(self.params @ np.linalg.solve(self.vcov, self.params))
+        lines = [
+            "Conditional (fixed-effects) logistic regression",
+            f"Number of obs = {model.n_obs}   groups = {model.n_groups}   clusters = {model.n_clusters}"
+            + (f"   (dropped {model.n_dropped_groups} groups with all positive or all negative outcomes)"
+               if model.n_dropped_groups else ""),
+            f"Log pseudolikelihood = {self.loglik:.6f}   Wald chi2({len(self.params)}) = {wald:.2f}   "
+            f"Pseudo R2 = {1 - self.loglik / ll0:.4f}",
+        ]
+        lines.append(_format_table(self.table(odds_ratios), "Odds ratio" if odds_ratios else "Coef."))
+        if not self.converged:
+            lines.append(f"WARNING: not converged after {self.iterations} iterations")
+        return "\n".join(lines)
+
+
+def _format_table(rows, label):
+    width = max(12, max(len(r[0]) for r in rows))
+    out = [f"{'':<{width}} {label:>11} {'Robust SE':>11} {'z':>7} {'P>|z|':>7} {'[95% conf. interval]':>23}"]
+    for name, est, se, z, p, lo, hi in rows:
+        out.append(f"{name:<{width}} {est:>11.6f} {se:>11.6f} {z:>7.2f} {p:>7.3f} {lo:>11.6f} {hi:>11.6f}")
+    return "\n".join(out)
+
+
+def marginal_effects(beta, X, factor_idx=(), weights=None, jacobian=True):
+    """Average marginal effects at beta over the rows of X (optionally weighted) and,
+    if requested, their Jacobian with respect to beta for the delta method"""
+    def prob(Xr):
+        return 1.0 / (1.0 + np.exp(-(Xr @ beta)))
+
+    def mean(v):
+        return np.average(v, axis=0, weights=weights)
+
+    p = prob(X)
+    dp = p * (1 - p)
+    dp_mean = mean(dp)
+    effects = np.zeros(len(beta))
+    jac = np.zeros((len(beta), len(beta))) if jacobian else None
+    for j in range(len(beta)):
+        if j in factor_idx:
+            X1, X0 = X.copy(), X.copy()
+            X1[:, j], X0[:, j] = 1.0, 0.0
+            p1, p0 = prob(X1), prob(X0)
+            effects[j] = mean(p1 - p0)
+            if jacobian:
+                jac[j] = mean((p1 * (1 - p1))[:, None] * X1 - (p0 * (1 - p0))[:, None] * X0)
+        else:
+            effects[j] = beta[j] * dp_mean
+            if jacobian:
+                jac[j] = beta[j] * mean((dp * (1 - 2 * p))[:, None] * X)
+                jac[j, j] += dp_mean
+    return effects, jac
+
+
+def average_marginal_effects(result, factors=(), rows=None):
+    """Average marginal effects of every regressor on Pr(y=1 | fixed effect = 0), as
+    `margins, dydx(*)` after clogit (its default pu0 prediction, p = invlogit(x'b)).
+
+    Columns listed in `factors` are 0/1 indicators (e.g. i.source levels) and get the
+    discrete change from 0 to 1; the rest get the derivative. `rows` (a mask over the
+    estimation sample) restricts the average, as `margins, over()`. Standard errors use
+    the delta method with the model's covariance. Returns rows like ClogitResult.table.
+    """
+    X = result.model.X if rows is None else result.model.X[rows]
+    factor_idx = [result.names.index(f) if isinstance(f, str) else f for f in factors]
+    effects, jac = marginal_effects(result.params, X, factor_idx)
+    se = np.sqrt(np.diag(jac @ result.vcov @ jac.T))
+    z = effects / se
+    return list(zip(result.names, effects, se, z, normal_pvalue(z), effects - Z_95 * se, effects + Z_95 * se))
+
+
+def format_margins(rows):
+    return "Average marginal effects (Pr(y=1 | fixed effect = 0))\n" + _format_table(rows, "dy/dx")
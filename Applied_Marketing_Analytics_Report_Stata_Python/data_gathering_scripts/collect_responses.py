@@ -0,0 +1,282 @@
+import argparse
+import csv
+import json
+import os
+import time
+
+from call_metrics import CallMetrics, format_summary, metrics_path, timed
+from checkpoint_journal import open_journal
+from query_runner import run_queries
+from response_cache import ResponseCache
+
+# ===========================
+# CONFIG
+# ===========================
+QUERIES_FILE = "queries.csv"
+BATCH_POLL_SECONDS = 30
+BATCH_APPEND_EVERY = 500    # journal rows per fsync while streaming batch results
+
+
+def load_queries(path):
+    queries = []
+    with open(path, newline="", encoding="utf-8") as f:
+        reader = csv.DictReader(f)
+        for row in reader:
+            queries.append(row)
+    return queries
+
+
+def parse_params(params_json=None, items=()):
+    """Generation parameters from a JSON object plus KEY=VALUE overrides; values are read as
+    JSON (numbers, true/false, lists) and fall back to plain strings"""
+    params = json.loads(params_json) if params_json else {}
+    if not isinstance(params, dict):
+        raise ValueError("--params must be a JSON object")
+    for item in items:
+        key, sep, value = item.partition("=")
+        if not sep or not key:
+            raise ValueError(f"--param expects KEY=VALUE, got {item!r}")
+        try:
+            params[key] = json.loads(value)
+        except json.JSONDecodeError:
+            params[key] = value
+    return params
+
+
+def _make_row(q, text):
+    return {
+        "query_id": q["query_id"],
+        "query_text": q["query_text"],
+        "topic": q["topic"],
+        "response_text": (text or "").replace("\n", " ").strip()
+    }
+
+
+def collect_online(provider, pending, journal, cache, previously_completed=0, **runner_kwargs):
+    """Call the provider for every pending query, several requests in flight at once"""
+    provider.preflight()
+    kwargs = {
+        "max_in_flight": provider.max_in_flight,
+        "requests_per_minute": provider.requests_per_minute,
+        "tokens_per_minute": provider.tokens_per_minute,
+    }
+    kwargs.update({k: v for k, v in runner_kwargs.items() if v is not None})
+    run_queries(
+        pending, provider.complete, provider.is_rate_limit, provider.is_auth_error,
+        on_result=journal.append,  # one durable record per finished query
+        previously_completed=previously_completed,
+        cache=cache,
+        provider=provider.name,
+        model=provider.model,
+        params=provider.params,
+        **kwargs,
+    )
+
+
+def collect_batch(provider, pending, journal, cache, output_file, poll_seconds=BATCH_POLL_SECONDS):
+    """Submit pending queries as one provider batch job, poll it and stream results into the journal.
+
+    The job id is kept in `<output>.batch.json` so an interrupted run re-attaches to the
+    running job instead of paying for a second one.
+    """
+    state_file = output_file + ".batch.json"
+    batch_file = output_file + ".batch_input.jsonl"
+    by_id = {q["query_id"]: q for q in pending}
+
+    if os.path.exists(state_file):
+        with open(state_file, encoding="utf-8") as f:
+            job_id = json.load(f)["job_id"]
+        print(f"Re-attaching to batch job {job_id}")
+    else:
+        # Cache hits never go into the batch
+        to_submit = []
+        cached_rows = []
+        for q in pending:
+            cached = cache.get(provider.name, provider.model, q["query_text"], provider.params)
+            if cached is not None:
+                cached_rows.append(_make_row(q, cached[0]))
+            else:
+                to_submit.append(q)
+        if cached_rows:
+            journal.append_many(cached_rows)
+            print(f"Reused {len(cached_rows)} cached answers")
+        if not to_submit:
+            return
+
+        with open(batch_file, "w", encoding="utf-8") as f:
+            for q in to_submit:
+                f.write(json.dumps(provider.batch_request(q["query_id"], q["query_text"]), ensure_ascii=False) + "\n")
+        job_id = provider.submit_batch(batch_file)
+        with open(state_file, "w", encoding="utf-8") as f:
+            json.dump({"job_id": job_id, "provider": provider.name, "model": provider.model,
+                       "query_ids": [q["query_id"] for q in to_submit]}, f)
+        print(f"Submitted batch job {job_id} with {len(to_submit)} requests")
+
+    while True:
+        status, raw_state = provider.batch_status(job_id)
+        if status != "running":
+            break
+        print(f"   Batch job {job_id}: {raw_state}, checking again in {poll_seconds}s...")
+        time.sleep(poll_seconds)
+
+    if status == "failed":
+        os.remove(state_file)
+        raise RuntimeError(f"Batch job {job_id} ended in state {raw_state}; rerun to resubmit pending queries")
+
+    rows = []
+    n_done = n_errors = 0
+    for custom_id, text, error, total_tokens in provider.batch_results(job_id):
+        q = by_id.get(custom_id)
+        if q is None:
+            continue  # already in the journal from an earlier run
+        if error is not None:
+            rows.append({**_make_row(q, ""), "response_text": f"ERROR: {error}"})
+            n_errors += 1
+        else:
+            rows.append(_make_row(q, text))
+            cache.put(provider.name, provider.model, q["query_text"], text or "", total_tokens, provider.params)
+        n_done += 1
+        if len(rows) >= BATCH_APPEND_EVERY:
+            journal.append_many(rows)
+            rows = []
+    if rows:
+        journal.append_many(rows)
+    os.remove(state_file)
+    if os.path.exists(batch_file):
+        os.remove(batch_file)
+    print(f"✓ Batch job {job_id}: {n_done} results ({n_errors} errors)")
+
+
+def run_collection(provider, queries_file=QUERIES_FILE, output_file=None, batch=False,
+                   poll_seconds=BATCH_POLL_SECONDS, **runner_kwargs):
+    """Collect responses for queries_file into output_file, resuming from its journal.
+
+    A `metrics` runner argument (call_metrics.CallMetrics) also times the compaction.
+    """
+    metrics = runner_kwargs.get("metrics")
+    output_file = output_file or provider.default_output
+
+    # 1) Load the queries
+    queries = load_queries(queries_file)
+    print(f"Loaded {len(queries)} queries")
+
+    # Resume from the append-only journal next to the output file
+    journal, existing_responses = open_journal(output_file)
+    if existing_responses:
+        print(f"Found {len(existing_responses)} already completed queries in {journal.path}")
+
+    pending = [q for q in queries if q["query_id"] not in existing_responses]
+    print(f"{len(pending)} queries to run with {provider.name} ({provider.model})")
+    query_order = [q["query_id"] for q in queries]
+    cache = ResponseCache()
+
+    # 2) Call the provider for each pending query
+    try:
+        if batch:
+            collect_batch(provider, pending, journal, cache, output_file, poll_seconds)
+        elif pending:
+            collect_online(provider, pending, journal, cache, len(existing_responses), **runner_kwargs)
+    except Exception as e:
+        journal.close()
+        with timed(metrics, "compact"):
+            journal.compact(output_file, query_order)
+        if provider.is_auth_error(e):
+            print("\n   This might be:")
+            for line in provider.auth_help():
+                print(f"   {line}")
+        print(f"   Progress saved to {output_file}. Rerun to resume.")
+        raise
+    finally:
+        journal.close()
+        print(cache.summary())
+        cache.close()
+
+    # 3) Materialize the journal as the final CSV (in queries.csv order)
+    with timed(metrics, "compact"):
+        n_rows = journal.compact(output_file, query_order)
+
+    print(f"\n✓ Done! Processed {n_rows}/{len(queries)} queries")
+    print(f"  Saved to {output_file} (journal: {journal.path})")
+    return output_file
+
+
+def main(provider_cls, argv=None):
+    parser = argparse.ArgumentParser(description=f"Collect {provider_cls.name} responses for queries.csv")
+    parser.add_argument("--queries", default=QUERIES_FILE)
+    parser.add_argument("--output", default=provider_cls.default_output)
+    parser.add_argument("--model", default=provider_cls.default_model)
+    parser.add_argument("--params", metavar="JSON",
+                        help='generation parameters for every call, e.g. \'{"temperature": 0.2}\'')
+    parser.add_argument("--param", action="append", default=[], metavar="KEY=VALUE",
+                        help="one generation parameter, repeatable; overrides --params")
+    parser.add_argument("--batch", action="store_true", help="use the provider's batch API instead of online calls")
+    parser.add_argument("--stream", action="store_true",
+                        help="stream answers, match brands on the fly and write the mentions table too")
+    parser.add_argument("--mentions", help="mentions table for --stream (default: mentions<suffix> of --output)")
+    parser.add_argument("--brands", help="brand,alias CSV for --stream/--adaptive (default: the brand_matcher.py list)")
+    parser.add_argument("--poll-seconds", type=float, default=BATCH_POLL_SECONDS)
+    parser.add_argument("--max-in-flight", type=int)
+    parser.add_argument("--rpm", type=int, help="requests per minute")
+    parser.add_argument("--tpm", type=int, help="tokens per minute")
+    parser.add_argument("--metrics", help="per-call metrics JSONL (default: <output>.metrics.jsonl)")
+    parser.add_argument("--no-metrics", action="store_true")
+    adaptive = parser.add_argument_group("adaptive sampling (repeated answers per query until mention rates are precise)")
+    adaptive.add_argument("--adaptive", action="store_true")
+    adaptive.add_argument("--ci-half-width", type=float, help="target half-width of each brand's 95%% CI")
+    adaptive.add_argument("--min-samples", type=int)
+    adaptive.add_argument("--max-samples", type=int)
+    adaptive.add_argument("--max-calls", type=int, help="call budget for this run (default: queries x --max-samples)")
+    args = parser.parse_args(argv)
+    if sum([args.batch, args.stream, args.adaptive]) > 1:
+        parser.error("--batch, --stream and --adaptive are separate modes")
+    try:
+        params = parse_params(args.params, args.param)
+    except ValueError as e:
+        parser.error(str(e))
+
+    # Parameters are part of the response cache key, so changing them never reuses old answers
+    provider = provider_cls(model=args.model, params=params)
+    metrics = None
+    if not args.no_metrics and not args.batch:
+        metrics = CallMetrics(args.metrics or metrics_path(args.output), provider.name, provider.model)
+    runner_kwargs = {
+        "max_in_flight": args.max_in_flight,
+        "requests_per_minute": args.rpm,
+        "tokens_per_minute": args.tpm,
+        "metrics": metrics,
+    }
+    try:
+        _run_mode(provider, provider_cls, args, runner_kwargs)
+    finally:
+        if metrics is not None:
+            summary = metrics.close()
+            print()
+            for line in format_summary(summary):
+                print(line)
+            print(f"  per-call records in {metrics.path}")
+
+
+def _run_mode(provider, provider_cls, args, runner_kwargs):
+    # These modes import this module, so they are loaded on demand
+    brands = None
+    if args.brands:
+        from brand_matcher import load_brands
+        brands = load_brands(args.brands)
+    if args.stream:
+        import streaming
+
+        streaming.run_streaming(provider, args.queries, args.output, args.mentions, brands, **runner_kwargs)
+        return
+    if args.adaptive:
+        import adaptive_sampling as sampling
+
+        output = args.output if args.output != provider_cls.default_output else None
+        options = {"target": args.ci_half_width, "min_samples": args.min_samples,
+                   "max_samples": args.max_samples, "max_calls": args.max_calls}
+        sampling.run_adaptive(
+            provider, args.queries, output, brands=brands, **runner_kwargs,
+            **{k: v for k, v in options.items() if v is not None},
+        )
+        return
+    run_collection(provider, args.queries, args.output, batch=args.batch, poll_seconds=args.poll_seconds,
+                   **runner_kwargs)
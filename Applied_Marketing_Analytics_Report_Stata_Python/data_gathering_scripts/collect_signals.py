@@ -0,0 +1,365 @@
+import argparse
+import asyncio
+import csv
+import hashlib
+import json
+import os
+import sqlite3
+import time
+
+import pandas as pd
+
+from brand_matcher import DEFAULT_BRANDS, load_brands
+from collect_responses import load_queries
+from dataset_constructor import BRAND_FEATURES_FILE, TOPIC_HITS_FILE
+from query_runner import TokenBucket
+from schema import TABLES, read_table, write_csv
+from signal_backends import MissingSignal, backend_class
+
+# ===========================
+# CONFIG
+# ===========================
+QUERIES_FILE = "data/queries.csv"      # the topics are the ones used in the queries
+CACHE_FILE = "cache/signals.sqlite"
+CATEGORY = "password manager"
+# Search phrase per topic
+TOPIC_TERMS = {
+    "Price": "price",
+    "Security": "security",
+    "Fit/Use": "ease of use",
+}
+# Result-count query behind each <channel>_topic_hits_bt column of topic_brand_hits.csv
+HIT_QUERIES = {
+    "listicle": 'intitle:best "{category}" {topic} "{brand}"',
+    "reddit": 'site:reddit.com "{brand}" {topic}',
+    "youtube": 'site:youtube.com "{brand}" {topic}',
+    "linkedin": 'site:linkedin.com "{brand}" {topic}',
+    "domain": "site:{domain} {topic}",
+}
+# Review sites behind avgrating_b_<site> and reviewcount_b_<site> (tp = Trustpilot)
+RATING_SITES = ["tp", "g2"]
+BRAND_DOMAINS = {
+    "1Password": "1password.com",
+    "Bitwarden": "bitwarden.com",
+    "LastPass": "lastpass.com",
+    "Dashlane": "dashlane.com",
+    "Keeper": "keepersecurity.com",
+    "NordPass": "nordpass.com",
+    "RoboForm": "roboform.com",
+}
+# Backend per request kind; kinds without one keep the values already in the CSVs
+DEFAULT_BACKENDS = {
+    "hits": "google",
+    "rating": None,
+    "seo": "pagespeed",
+}
+MAX_AGE_DAYS = {"hits": 7, "rating": 30, "seo": 30}   # cached values older than this are revalidated
+MAX_RETRIES = 3
+
+
+def load_domains(path):
+    """Read brand domains from a CSV with `brand,domain` columns"""
+    with open(path, newline="", encoding="utf-8") as f:
+        return {row["brand"]: row["domain"] for row in csv.DictReader(f)}
+
+
+def load_topics(path=QUERIES_FILE):
+    """Topics of the queries file, in order of first appearance"""
+    return list(dict.fromkeys(q["topic"] for q in load_queries(path)))
+
+
+def plan_cells(brands, topics, domains, category=CATEGORY):
+    """One cell per request: its kind, the request, and the table cells its answer fills.
+
+    `columns` maps a field of the answer (None for a plain number) to a column.
+    """
+    cells = []
+    for brand in brands:
+        domain = domains.get(brand)
+        for topic in topics:
+            terms = TOPIC_TERMS.get(topic, topic.lower())
+            for channel, template in HIT_QUERIES.items():
+                if "{domain}" in template and not domain:
+                    continue
+                query = template.format(brand=brand, topic=terms, domain=domain, category=category)
+                cells.append({"kind": "hits", "request": {"query": query}, "table": "topic_hits",
+                              "key": (brand, topic), "columns": {None: f"{channel}_topic_hits_bt"}})
+        for site in RATING_SITES:
+            cells.append({"kind": "rating", "request": {"site": site, "brand": brand, "domain": domain},
+                          "table": "brand_features", "key": (brand,),
+                          "columns": {"avgrating": f"avgrating_b_{site}", "reviewcount": f"reviewcount_b_{site}"}})
+        if domain:
+            cells.append({"kind": "seo", "request": {"url": f"https://{domain}"}, "table": "brand_features",
+                          "key": (brand,), "columns": {None: "lighthouse_seo_b"}})
+    return cells
+
+
+def signal_key(backend, kind, request):
+    payload = json.dumps([backend, kind, request], sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class SignalCache:
+    """Last answer and ETag of every signal request, with when it was fetched and last confirmed.
+
+    A value is fresh for MAX_AGE_DAYS after it was last confirmed; a stale one is
+    revalidated with a conditional request, and a 304 only renews its confirmation time.
+    """
+
+    def __init__(self, path=CACHE_FILE):
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.path = path
+        self.conn = sqlite3.connect(path)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS signals (
+                key TEXT PRIMARY KEY,
+                backend TEXT,
+                kind TEXT,
+                request TEXT,
+                value TEXT,
+                etag TEXT,
+                fetched_at REAL,
+                checked_at REAL
+            )
+        """)
+        self.conn.commit()
+
+    def get(self, backend, kind, request):
+        """{"value", "etag", "fetched_at", "checked_at"} or None"""
+        row = self.conn.execute(
+            "SELECT value, etag, fetched_at, checked_at FROM signals WHERE key = ?",
+            (signal_key(backend, kind, request),),
+        ).fetchone()
+        if row is None:
+            return None
+        return {"value": json.loads(row[0]), "etag": row[1], "fetched_at": row[2], "checked_at": row[3]}
+
+    def put(self, backend, kind, request, value, etag):
+        now = time.time()
+        self.conn.execute(
+            "INSERT OR REPLACE INTO signals VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+            (signal_key(backend, kind, request), backend, kind, json.dumps(request, sort_keys=True),
+             json.dumps(value), etag, now, now),
+        )
+        self.conn.commit()
+
+    def confirm(self, backend, kind, request):
+        self.conn.execute("UPDATE signals SET checked_at = ? WHERE key = ?",
+                          (time.time(), signal_key(backend, kind, request)))
+        self.conn.commit()
+
+    def close(self):
+        self.conn.close()
+
+
+def is_fresh(entry, kind, max_age_days=None):
+    max_age = MAX_AGE_DAYS[kind] if max_age_days is None else max_age_days
+    return entry is not None and time.time() - entry["checked_at"] < max_age * 86400
+
+
+async def refresh(cells, backends, cache, max_age_days=None):
+    """Fetch or revalidate every stale cell whose kind has a backend; returns counts.
+
+    Requests run concurrently, at most `max_in_flight` at a time and within the
+    requests-per-minute budget of their backend; failures are retried with backoff and
+    then leave the cell as it was, like answers without a value (MissingSignal).
+    """
+    stats = {"fresh": 0, "fetched": 0, "not_modified": 0, "missing": 0, "failed": 0}
+    # Bursts are capped at one request per connection, so the rate stays even
+    limits = {id(b): (asyncio.Semaphore(b.max_in_flight), TokenBucket(b.requests_per_minute, b.max_in_flight))
+              for b in backends.values()}
+
+    async def one(cell):
+        kind, request = cell["kind"], cell["request"]
+        backend = backends[kind]
+        entry = cache.get(backend.name, kind, request)
+        if is_fresh(entry, kind, max_age_days):
+            stats["fresh"] += 1
+            return
+        semaphore, bucket = limits[id(backend)]
+        for attempt in range(MAX_RETRIES + 1):
+            async with semaphore:
+                await bucket.acquire()
+                try:
+                    value, etag = await backend.fetch(kind, request, entry["etag"] if entry else None)
+                    break
+                except MissingSignal as e:
+                    print(f"   – {kind} {json.dumps(request)}: {e}")
+                    stats["missing"] += 1
+                    return
+                except Exception as e:
+                    error = e
+            if attempt == MAX_RETRIES:
+                print(f"   ✗ {kind} {json.dumps(request)} failed after {MAX_RETRIES} retries: {error}")
+                stats["failed"] += 1
+                return
+            # Exponential backoff: 2s, 4s, 8s, longer after a rate limit
+            await asyncio.sleep((10 if backend.is_rate_limit(error) else 1) * 2 ** (attempt + 1))
+        if value is None:
+            cache.confirm(backend.name, kind, request)
+            stats["not_modified"] += 1
+        else:
+            cache.put(backend.name, kind, request, value, etag)
+            stats["fetched"] += 1
+
+    await asyncio.gather(*(one(cell) for cell in cells if cell["kind"] in backends))
+    return stats
+
+
+def _current_rows(kind, path):
+    """{key: row} of an existing table, or {} if it does not exist yet"""
+    if not os.path.exists(path):
+        return {}
+    df = read_table(kind, path)
+    key = TABLES[kind]["key"]
+    return {tuple(row[k] for k in key): row for row in df.to_dict("records")}
+
+
+def assemble(cells, backend_names, cache, brands, topics, paths):
+    """Tables in the exact topic_brand_hits.csv / brand_features.csv schemas.
+
+    Values come from the cache for kinds with a backend; everything else keeps its
+    value from the current file. Returns ({table: DataFrame}, [missing cells]).
+    """
+    keys = {"topic_hits": [(b, t) for b in brands for t in topics], "brand_features": [(b,) for b in brands]}
+    tables = {}
+    for kind, table_keys in keys.items():
+        current = _current_rows(kind, paths[kind])
+        key_cols = TABLES[kind]["key"]
+        tables[kind] = {k: {**dict(zip(key_cols, k)), **{c: v for c, v in current.get(k, {}).items()
+                                                         if not pd.isna(v)}} for k in table_keys}
+
+    for cell in cells:
+        name = backend_names.get(cell["kind"])
+        entry = cache.get(name, cell["kind"], cell["request"]) if name else None
+        if entry is not None:
+            for field, col in cell["columns"].items():
+                tables[cell["table"]][cell["key"]][col] = entry["value"] if field is None else entry["value"][field]
+
+    frames, missing = {}, []
+    for kind, rows in tables.items():
+        columns = TABLES[kind]["columns"]
+        for k, row in rows.items():
+            missing += [f"{kind} {'/'.join(k)}: {c}" for c in columns if c not in row]
+        df = pd.DataFrame(list(rows.values()), columns=list(columns))
+        frames[kind] = df
+    return frames, missing
+
+
+def _ends_with_newline(path):
+    with open(path, "rb") as f:
+        f.seek(0, os.SEEK_END)
+        if f.tell() == 0:
+            return True
+        f.seek(-1, os.SEEK_END)
+        return f.read(1) == b"\n"
+
+
+def write_tables(frames, paths):
+    """Replace the tables atomically, keeping whether each file ends with a newline so a
+    refresh only shows the changed values in a diff"""
+    for kind, df in frames.items():
+        for col, dtype in TABLES[kind]["columns"].items():
+            if dtype == "int":
+                df[col] = df[col].astype("int64")
+        tmp = paths[kind] + ".tmp"
+        write_csv(df, tmp, TABLES[kind].get("comma_decimal", ()))
+        if os.path.exists(paths[kind]) and not _ends_with_newline(paths[kind]):
+            with open(tmp, "rb+") as f:
+                f.truncate(os.path.getsize(tmp) - 1)
+        os.replace(tmp, paths[kind])
+
+
+def _make_backends(names):
+    """One backend instance per name, shared by the kinds it serves (and its connection pool)"""
+    instances = {}
+    backends = {}
+    for kind, name in names.items():
+        if not name:
+            continue
+        if name not in instances:
+            instances[name] = backend_class(name)()
+        if kind not in instances[name].kinds:
+            raise ValueError(f"backend {name!r} does not provide {kind!r} signals")
+        backends[kind] = instances[name]
+    return backends
+
+
+async def _refresh_and_close(cells, backends, cache, max_age_days):
+    try:
+        return await refresh(cells, backends, cache, max_age_days)
+    finally:
+        for backend in {id(b): b for b in backends.values()}.values():
+            await backend.aclose()
+
+
+def main(argv=None, backends=None):
+    parser = argparse.ArgumentParser(description="Refresh topic_brand_hits.csv and brand_features.csv from "
+                                                 "search, review and SEO backends")
+    parser.add_argument("--brands", help="brand,alias CSV (default: the brand_matcher.py list)")
+    parser.add_argument("--domains", help="brand,domain CSV added to the configured BRAND_DOMAINS")
+    parser.add_argument("--queries", default=QUERIES_FILE, help="queries file whose topics are used")
+    parser.add_argument("--topic-hits", default=TOPIC_HITS_FILE)
+    parser.add_argument("--brand-features", default=BRAND_FEATURES_FILE)
+    parser.add_argument("--cache", default=CACHE_FILE)
+    parser.add_argument("--backend", action="append", default=[], metavar="KIND=NAME",
+                        help="backend for hits, rating or seo (google, pagespeed, fake, none)")
+    parser.add_argument("--max-age-days", type=float, help="revalidate cached values older than this (all kinds)")
+    parser.add_argument("--dry-run", action="store_true", help="only count the cells that would be requested")
+    args = parser.parse_args(argv)
+
+    names = {**DEFAULT_BACKENDS, **(backends or {})}
+    for item in args.backend:
+        kind, sep, name = item.partition("=")
+        if not sep or kind not in DEFAULT_BACKENDS:
+            parser.error(f"--backend expects KIND=NAME with KIND in {list(DEFAULT_BACKENDS)}, got {item!r}")
+        names[kind] = None if name == "none" else name
+    names = {kind: name for kind, name in names.items() if name}
+
+    brands = list(load_brands(args.brands) if args.brands else DEFAULT_BRANDS)
+    domains = {**BRAND_DOMAINS, **(load_domains(args.domains) if args.domains else {})}
+    topics = load_topics(args.queries)
+    paths = {"topic_hits": args.topic_hits, "brand_features": args.brand_features}
+    cells = plan_cells(brands, topics, domains)
+    print(f"{len(brands)} brands x {len(topics)} topics: {len(cells)} signal requests")
+
+    cache = SignalCache(args.cache)
+    try:
+        stale = {}
+        for cell in cells:
+            name = names.get(cell["kind"])
+            if name and not is_fresh(cache.get(name, cell["kind"], cell["request"]), cell["kind"], args.max_age_days):
+                stale[cell["kind"]] = stale.get(cell["kind"], 0) + 1
+        for kind in DEFAULT_BACKENDS:
+            source = f"{names[kind]} backend" if kind in names else "kept from the current files"
+            print(f"  {kind:<7} {stale.get(kind, 0)} stale ({source})")
+        if args.dry_run:
+            return
+
+        if stale:
+            start = time.perf_counter()
+            # Backends (and their HTTP libraries) are only created when something is stale
+            active = _make_backends({kind: name for kind, name in names.items() if stale.get(kind)})
+            stats = asyncio.run(_refresh_and_close(cells, active, cache, args.max_age_days))
+            print(f"Refreshed in {time.perf_counter() - start:.1f}s: {stats['fetched']} fetched, "
+                  f"{stats['not_modified']} not modified, {stats['fresh']} fresh, {stats['missing']} without a value, "
+                  f"{stats['failed']} failed")
+
+        frames, missing = assemble(cells, names, cache, brands, topics, paths)
+    finally:
+        cache.close()
+
+    if missing:
+        print(f"\n✗ {len(missing)} cells have no value yet, nothing written (rerun to retry):")
+        for line in missing[:10]:
+            print(f"   {line}")
+        raise SystemExit(1)
+    write_tables(frames, paths)
+    print(f"\n✓ Saved {paths['topic_hits']} ({len(frames['topic_hits'])} rows) and "
+          f"{paths['brand_features']} ({len(frames['brand_features'])} rows)")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,54 +1,159 @@
+import argparse
+import csv
+import glob
+import io
+import os
+import shutil
+
 import pandas as pd
 import numpy as np
 
+from dataset_files import (BRAND_FEATURES_FILE, OUT_FILE, OUT_PARQUET_FILE, OUT_TEXTS_FILE, SOURCES_FILE,
+                           TOPIC_HITS_FILE)
+from schema import DATASET_COMMA_DECIMAL, TABLES, SchemaError, read_tables, write_csv
+
 # ===========================
 # CONFIG
 # ===========================
-RESPONSES_CHATGPT_FILE = "data/responses_chatgpt.csv"
-RESPONSES_GEMINI_FILE = "data/responses_gemini.csv"
-MENTIONS_CHATGPT_FILE = "data/mentions_chatgpt.csv"
-MENTIONS_GEMINI_FILE = "data/mentions_gemini.csv"
-BRAND_FEATURES_FILE = "data/brand_features.csv"
-TOPIC_HITS_FILE = "data/topic_brand_hits.csv"
-OUT_FILE = "data/dataset.csv"
+# Input and output files are set in dataset_files.py
+
+# Partitioned output (--partition): one hive-style source=<name>/ directory per source,
+# replaced as a whole on every build; CSV and Parquet partitions live in separate trees
+OUT_PARTITION_DIR = "data/dataset_by_source"
+OUT_TEXTS_PARTITION_DIR = "data/dataset_texts_by_source"
+OUT_CSV_PARTITION_DIR = "data/dataset_csv_by_source"
+
+# DuckDB engine: joins and sorts larger than the memory limit spill to the temp directory
+DUCKDB_MEMORY_LIMIT = "2GB"
+DUCKDB_TEMP_DIR = "data/.duckdb_tmp"
 
 REVIEW_SOURCE = "g2"
 
-def main():
-    # 1) Load data
-    responses_chatgpt = pd.read_csv(RESPONSES_CHATGPT_FILE)
-    responses_gemini = pd.read_csv(RESPONSES_GEMINI_FILE)
-    mentions_chatgpt = pd.read_csv(MENTIONS_CHATGPT_FILE)
-    mentions_gemini = pd.read_csv(MENTIONS_GEMINI_FILE)
-    brand_features = pd.read_csv(BRAND_FEATURES_FILE)
-    topic_hits = pd.read_csv(TOPIC_HITS_FILE)
+MANIFEST_COLS = ["source", "responses_file", "mentions_file"]
+REVIEW_COLS = ["reviewcount_b_tp", "reviewcount_b_g2"]
+TOPIC_HIT_COLS = ["listicle_topic_hits_bt", "reddit_topic_hits_bt",
+                  "youtube_topic_hits_bt", "linkedin_topic_hits_bt", "domain_topic_hits_bt"]
+
+# Desired column order
+DESIRED_COLS = [
+    "query_id",
+    "source",
+    "query_text",
+    "topic",
+    "response_text",
+    "brand",
+    "mention",
+    "avgrating_b_tp",
+    "reviewcount_b_tp",
+    "avgrating_b_g2",
+    "reviewcount_b_g2",
+    "lighthouse_seo_b",
+    "listicle_topic_hits_bt",
+    "reddit_topic_hits_bt",
+    "youtube_topic_hits_bt",
+    "linkedin_topic_hits_bt",
+    "domain_topic_hits_bt",
+]
+
+
+def load_sources(path=SOURCES_FILE):
+    """Read the sources manifest: a list of {source, responses_file, mentions_file, ...} dicts"""
+    with open(path, newline="", encoding="utf-8") as f:
+        reader = csv.DictReader(f)
+        header = reader.fieldnames or []
+        sources = list(reader)
+
+    problems = []
+    missing = [c for c in MANIFEST_COLS if c not in header]
+    if missing:
+        problems.append(f"{path}: missing columns {missing}")
+    elif not sources:
+        problems.append(f"{path}: no sources listed")
+    else:
+        names = [s["source"] for s in sources]
+        duplicated = sorted({n for n in names if names.count(n) > 1})
+        if duplicated:
+            problems.append(f"{path}: duplicate sources {duplicated}")
+        for s in sources:
+            for col in ["responses_file", "mentions_file"]:
+                if not os.path.exists(s[col]):
+                    problems.append(f"{path}: {s['source']} {col} {s[col]} does not exist")
+    if problems:
+        raise SchemaError(problems)
+    return sources
+
+
+def metadata_cols(sources):
+    """Manifest columns beyond the required ones, e.g. model or snapshot"""
+    return [c for c in sources[0] if c not in MANIFEST_COLS]
+
+
+def load_dataset(path=OUT_PARQUET_FILE, texts_path=OUT_TEXTS_FILE, with_text=False, columns=None):
+    """Read the columnar dataset (memory-mapped); response/query texts are joined only on request.
+
+    Both paths may also be partitioned Parquet directories (OUT_PARTITION_DIR, OUT_TEXTS_PARTITION_DIR).
+    """
+    df = pd.read_parquet(path, columns=columns, memory_map=True)
+    if with_text:
+        texts = pd.read_parquet(texts_path, memory_map=True)
+        df = df.merge(texts.drop(columns=["topic"]), on=["query_id", "source"], how="left")
+    return df
+
+
+def clear_partitions(directory):
+    """Remove the source=<name>/ partitions of a previous build, so a rebuild does not add
+    part files next to the old ones or keep sources that are no longer in the manifest"""
+    for part_dir in glob.glob(os.path.join(directory, "source=*")):
+        shutil.rmtree(part_dir)
+
+
+# ===========================
+# PANDAS ENGINE (in memory)
+# ===========================
+
+def build_pandas(sources, out_format="csv", partition=False):
+    # 1) Load data with the declared dtypes (schema.py); comma-decimal ratings such as
+    # "4,5" are parsed at read time and every schema violation is reported before any work
+    inputs = {}
+    for s in sources:
+        inputs[f"responses_{s['source']}"] = ("responses", s["responses_file"])
+        inputs[f"mentions_{s['source']}"] = ("mentions", s["mentions_file"])
+    inputs["brand_features"] = ("brand_features", BRAND_FEATURES_FILE)
+    inputs["topic_hits"] = ("topic_hits", TOPIC_HITS_FILE)
+    tables = read_tables(inputs)
+    brand_features = tables["brand_features"]
+    topic_hits = tables["topic_hits"]
 
     # Basic sanity prints
-    print("responses_chatgpt:", responses_chatgpt.shape)
-    print("responses_gemini:", responses_gemini.shape)
-    print("mentions_chatgpt:", mentions_chatgpt.shape)
-    print("mentions_gemini:", mentions_gemini.shape)
-    print("brand_features:", brand_features.shape)
-    print("topic_hits:", topic_hits.shape)
-
-    # 2) Process ChatGPT data
-    df_chatgpt = mentions_chatgpt.merge(
-        responses_chatgpt[["query_id", "query_text", "topic", "response_text"]],
-        on="query_id",
-        how="left"
-    )
-    df_chatgpt["source"] = "chatgpt"
+    for name, table in tables.items():
+        print(f"{name}:", table.shape)
 
-    # 3) Process Gemini data
-    df_gemini = mentions_gemini.merge(
-        responses_gemini[["query_id", "query_text", "topic", "response_text"]],
-        on="query_id",
-        how="left"
-    )
-    df_gemini["source"] = "gemini"
+    meta_cols = metadata_cols(sources)
+    text_frames = []
+    long_frames = []
+    for s in sources:
+        responses = tables[f"responses_{s['source']}"]
+        mentions = tables[f"mentions_{s['source']}"]
 
-    # 4) Combine both datasets
-    df = pd.concat([df_chatgpt, df_gemini], ignore_index=True)
+        # 2) Response texts, stored once per (query_id, source)
+        responses["source"] = s["source"]
+        text_frames.append(responses[["query_id", "source", "query_text", "topic", "response_text"]])
+
+        # 3) Long brand table: only the topic is needed from the responses at this stage,
+        # so the multi-KB texts are not copied onto every brand row
+        df_source = mentions.merge(
+            responses[["query_id", "topic"]],
+            on="query_id",
+            how="left"
+        )
+        df_source["source"] = s["source"]
+        for col in meta_cols:
+            df_source[col] = s[col]
+        long_frames.append(df_source)
+
+    # 4) Combine all sources
+    texts = pd.concat(text_frames, ignore_index=True)
+    df = pd.concat(long_frames, ignore_index=True)
 
     # 5) Merge brand-level features (Trustpilot + G2 + lighthouse)
     df = df.merge(
@@ -56,19 +161,9 @@ def main():
         on="brand",
         how="left"
     )
-    
-    # Convert rating columns from comma decimal format (e.g., "4,5") to float (4.5)
-    rating_cols = ["avgrating_b_tp", "avgrating_b_g2"]
-    for col in rating_cols:
-        if col in df.columns:
-            # Replace comma with period and convert to float
-            df[col] = df[col].astype(str).str.replace(",", ".").astype(float)
-    
-    # Ensure review count columns are numeric
-    review_cols = ["reviewcount_b_tp", "reviewcount_b_g2"]
-    for col in review_cols:
-        if col in df.columns:
-            df[col] = pd.to_numeric(df[col], errors="coerce").fillna(0)
+
+    # Brands without features get zero reviews (ratings stay missing)
+    df[REVIEW_COLS] = df[REVIEW_COLS].fillna(0)
 
     # 6) Merge brand × topic hits
     df = df.merge(
@@ -76,64 +171,253 @@ def main():
         on=["brand", "topic"],
         how="left"
     )
-    
-    # Ensure topic hit columns are numeric
-    topic_hit_cols = ["listicle_topic_hits_bt", "reddit_topic_hits_bt", 
-                      "youtube_topic_hits_bt", "linkedin_topic_hits_bt", "domain_topic_hits_bt"]
-    for col in topic_hit_cols:
-        if col in df.columns:
-            df[col] = pd.to_numeric(df[col], errors="coerce").fillna(0)
+
+    # Brand × topic cells without hit counts get zero hits
+    df[TOPIC_HIT_COLS] = df[TOPIC_HIT_COLS].fillna(0)
 
     # 7) (Optional) sort rows and reorder columns nicely
     # Sort by query_id, source, then brand for readability
     df = df.sort_values(by=["query_id", "source", "brand"]).reset_index(drop=True)
 
-    # Desired column order
-    desired_cols = [
-        "query_id",
-        "source",
-        "query_text",
-        "topic",
-        "response_text",
-        "brand",
-        "mention",
-        "avgrating_b_tp",
-        "reviewcount_b_tp",
-        "avgrating_b_g2",
-        "reviewcount_b_g2",
-        "lighthouse_seo_b",
-        "listicle_topic_hits_bt",
-        "reddit_topic_hits_bt",
-        "youtube_topic_hits_bt",
-        "linkedin_topic_hits_bt",
-        "domain_topic_hits_bt",
-    ]
+    # Flat CSV: texts joined back onto every brand row
+    if out_format == "csv":
+        df = df.merge(texts.drop(columns=["topic"]), on=["query_id", "source"], how="left")
 
     # Keep only columns that actually exist (in case names differ)
-    cols_present = [c for c in desired_cols if c in df.columns]
+    cols_present = [c for c in DESIRED_COLS + meta_cols if c in df.columns]
     df = df[cols_present]
 
-    # 8) Convert numeric columns back to comma format for Google Sheets compatibility
-    def float_to_comma_format(series):
-        """Convert float series to comma-separated decimal format"""
-        return series.apply(lambda x: str(x).replace(".", ",") if pd.notna(x) else "")
-    
-    # Convert rating columns (float) back to comma format
-    rating_cols = ["avgrating_b_tp", "avgrating_b_g2"]
-    for col in rating_cols:
-        if col in df.columns:
-            df[col] = float_to_comma_format(df[col])
-    
-    # Convert reviewindex columns (float) back to comma format
-    reviewindex_cols = ["reviewcount_b_tp", "reviewcount_b_g2"]
-    for col in reviewindex_cols:
-        if col in df.columns:
-            df[col] = float_to_comma_format(df[col])
-
-    # 9) Save
-    df.to_csv(OUT_FILE, index=False, encoding="utf-8")
+    if out_format == "parquet":
+        save_parquet(df, texts, partition)
+        return
+
+    # 8) Save, with ratings and review counts in comma-decimal format for Google Sheets compatibility
+    if partition:
+        clear_partitions(OUT_CSV_PARTITION_DIR)
+        for source, part in df.groupby("source", sort=False):
+            part_dir = os.path.join(OUT_CSV_PARTITION_DIR, f"source={source}")
+            os.makedirs(part_dir, exist_ok=True)
+            write_csv(part.drop(columns=["source"]), os.path.join(part_dir, "data_0.csv"), DATASET_COMMA_DECIMAL)
+        print(f"Saved {len(df)} rows in {df['source'].nunique()} source partitions under {OUT_CSV_PARTITION_DIR}.")
+        return
+    write_csv(df, OUT_FILE, DATASET_COMMA_DECIMAL)
     print(f"Saved {OUT_FILE} with {len(df)} rows and {len(df.columns)} columns.")
 
 
+def save_parquet(df, texts, partition=False):
+    """Write the long table and the text side table as Parquet with categorical labels"""
+    df = df.copy()
+    for col in ["brand", "topic", "source"]:
+        df[col] = df[col].astype("category")
+    for col in ["topic", "source"]:
+        texts[col] = texts[col].astype("category")
+    texts = texts.sort_values(by=["query_id", "source"]).reset_index(drop=True)
+
+    if partition:
+        clear_partitions(OUT_PARTITION_DIR)
+        clear_partitions(OUT_TEXTS_PARTITION_DIR)
+        df.to_parquet(OUT_PARTITION_DIR, index=False, compression="zstd", partition_cols=["source"])
+        texts.to_parquet(OUT_TEXTS_PARTITION_DIR, index=False, compression="zstd", partition_cols=["source"])
+        print(f"Saved {len(df)} rows under {OUT_PARTITION_DIR}, "
+              f"texts for {len(texts)} responses under {OUT_TEXTS_PARTITION_DIR}.")
+        return
+    df.to_parquet(OUT_PARQUET_FILE, index=False, compression="zstd")
+    texts.to_parquet(OUT_TEXTS_FILE, index=False, compression="zstd")
+    print(f"Saved {OUT_PARQUET_FILE} with {len(df)} rows and {len(df.columns)} columns, "
+          f"texts for {len(texts)} responses in {OUT_TEXTS_FILE}.")
+
+
+# ===========================
+# DUCKDB ENGINE (lazy, out of core)
+# ===========================
+
+def _sql_str(value):
+    return "'" + str(value).replace("'", "''") + "'"
+
+
+def _read_csv_sql(path):
+    # Everything is read as text and cast per schema.TABLES, like schema._read does
+    return f"read_csv({_sql_str(path)}, header=true, all_varchar=true)"
+
+
+def _cast_sql(kind, col):
+    dtype = TABLES[kind]["columns"][col]
+    if dtype == "str":
+        return f'"{col}"'
+    text = f'''replace("{col}", ',', '.')''' if col in TABLES[kind].get("comma_decimal", []) else f'"{col}"'
+    return f'TRY_CAST(trim({text}) AS {"DOUBLE" if dtype == "float" else "BIGINT"})'
+
+
+def _typed_sql(kind, path):
+    """SELECT reading one input CSV with its declared column types"""
+    cols = ", ".join(f'{_cast_sql(kind, c)} AS "{c}"' for c in TABLES[kind]["columns"])
+    return f"SELECT {cols} FROM {_read_csv_sql(path)}"
+
+
+def _validate_duckdb(con, inputs):
+    """The checks of schema.read_tables as one streaming aggregate per input; raises SchemaError"""
+    problems = []
+    for kind, path in inputs:
+        spec = TABLES[kind]
+        header = [d[0] for d in con.execute(f"SELECT * FROM {_read_csv_sql(path)} LIMIT 0").description]
+        missing = [c for c in spec["columns"] if c not in header]
+        if missing:
+            problems.append(f"{path}: missing columns {missing}")
+            continue
+
+        numeric = [c for c, t in spec["columns"].items() if t != "str"]
+        key = ", ".join(f'{_cast_sql(kind, c)}' for c in spec["key"])
+        checks = [f'COUNT(*) FILTER (WHERE "{c}" IS NOT NULL AND {_cast_sql(kind, c)} IS NULL)' for c in numeric]
+        null_key = " OR ".join(f"{_cast_sql(kind, c)} IS NULL" for c in spec["key"])
+        checks.append(f"COUNT(*) FILTER (WHERE {null_key})")
+        # Rows with an empty key are reported above, not as duplicates
+        checks.append(f"COUNT(*) FILTER (WHERE NOT ({null_key})) - COUNT(DISTINCT ({key})) FILTER (WHERE NOT ({null_key}))")
+        counts = con.execute(f"SELECT {', '.join(checks)} FROM {_read_csv_sql(path)}").fetchone()
+
+        for col, n_bad in zip(numeric, counts):
+            if n_bad:
+                problems.append(f"{path}: {n_bad} unparseable {spec['columns'][col]} values in '{col}'")
+        if counts[-2]:
+            problems.append(f"{path}: {counts[-2]} rows with empty {spec['key']}")
+        if counts[-1]:
+            problems.append(f"{path}: {counts[-1]} duplicate {spec['key']} rows")
+    if problems:
+        raise SchemaError(problems)
+
+
+def build_duckdb(sources, out_format="csv", partition=False):
+    """Build the same dataset as build_pandas as a single lazy DuckDB plan.
+
+    Inputs are scanned straight from CSV and never materialized as a whole; joins and the
+    final sort spill to DUCKDB_TEMP_DIR beyond DUCKDB_MEMORY_LIMIT, so the dataset can be
+    larger than RAM. Results are streamed to disk by COPY.
+    """
+    import duckdb
+
+    os.makedirs(DUCKDB_TEMP_DIR, exist_ok=True)
+    con = duckdb.connect()
+    con.execute(f"SET memory_limit = {_sql_str(DUCKDB_MEMORY_LIMIT)}")
+    con.execute(f"SET temp_directory = {_sql_str(DUCKDB_TEMP_DIR)}")
+
+    inputs = []
+    for s in sources:
+        inputs += [("responses", s["responses_file"]), ("mentions", s["mentions_file"])]
+    inputs += [("brand_features", BRAND_FEATURES_FILE), ("topic_hits", TOPIC_HITS_FILE)]
+    _validate_duckdb(con, inputs)
+
+    # 1) Views over the inputs; nothing is read until the final COPY
+    meta_cols = metadata_cols(sources)
+    responses_sql = []
+    mentions_sql = []
+    for s in sources:
+        label = f"{_sql_str(s['source'])} AS source"
+        meta = "".join(f', {_sql_str(s[c])} AS "{c}"' for c in meta_cols)
+        responses_sql.append(f"SELECT *, {label} FROM ({_typed_sql('responses', s['responses_file'])})")
+        mentions_sql.append(f"SELECT *, {label}{meta} FROM ({_typed_sql('mentions', s['mentions_file'])})")
+    con.execute(f"CREATE VIEW responses AS {' UNION ALL '.join(responses_sql)}")
+    con.execute(f"CREATE VIEW mentions AS {' UNION ALL '.join(mentions_sql)}")
+    con.execute(f"CREATE VIEW brand_features AS {_typed_sql('brand_features', BRAND_FEATURES_FILE)}")
+    con.execute(f"CREATE VIEW topic_hits AS {_typed_sql('topic_hits', TOPIC_HITS_FILE)}")
+
+    # 2) Long brand table: mentions + topic, brand features and brand × topic hits,
+    # with missing review and hit counts set to zero (ratings stay missing)
+    def feature_sql(col):
+        if col in REVIEW_COLS:
+            return f'COALESCE(f."{col}", 0) AS "{col}"'
+        if col in TOPIC_HIT_COLS:
+            return f'COALESCE(h."{col}", 0) AS "{col}"'
+        return f'f."{col}"'
+
+    feature_cols = [c for c in TABLES["brand_features"]["columns"] if c != "brand"] + TOPIC_HIT_COLS
+    long_cols = (["m.query_id", "m.source", "r.topic", "m.brand", "m.mention"]
+                 + [feature_sql(c) for c in feature_cols]
+                 + [f'm."{c}"' for c in meta_cols])
+    con.execute(f"""
+        CREATE VIEW long AS
+        SELECT {', '.join(long_cols)}
+        FROM mentions m
+        LEFT JOIN responses r ON r.query_id = m.query_id AND r.source = m.source
+        LEFT JOIN brand_features f ON f.brand = m.brand
+        LEFT JOIN topic_hits h ON h.brand = m.brand AND h.topic = r.topic
+    """)
+
+    # 3) Write the result
+    if out_format == "parquet":
+        long_sql = f"SELECT {', '.join(c for c in DESIRED_COLS + meta_cols if c not in ('query_text', 'response_text'))} " \
+                   "FROM long ORDER BY query_id, source, brand"
+        texts_sql = "SELECT query_id, source, query_text, topic, response_text FROM responses ORDER BY query_id, source"
+        options = "FORMAT parquet, COMPRESSION zstd"
+        if partition:
+            options += ", PARTITION_BY (source), OVERWRITE_OR_IGNORE"
+            clear_partitions(OUT_PARTITION_DIR)
+            clear_partitions(OUT_TEXTS_PARTITION_DIR)
+        out, texts_out = (OUT_PARTITION_DIR, OUT_TEXTS_PARTITION_DIR) if partition else (OUT_PARQUET_FILE, OUT_TEXTS_FILE)
+        con.execute(f"COPY ({long_sql}) TO {_sql_str(out)} ({options})")
+        con.execute(f"COPY ({texts_sql}) TO {_sql_str(texts_out)} ({options})")
+        print(f"Saved {out}, texts in {texts_out}.")
+        return
+
+    # Flat CSV: texts joined back on, ratings and review counts in comma-decimal format
+    def out_sql(col):
+        if col in ("query_text", "response_text"):
+            return f"r.{col}"
+        if col in DATASET_COMMA_DECIMAL:
+            return f'''COALESCE(replace(CAST(l."{col}" AS VARCHAR), '.', ','), '') AS "{col}"'''
+        return f'l."{col}"'
+
+    csv_sql = f"""
+        SELECT {', '.join(out_sql(c) for c in DESIRED_COLS + meta_cols)}
+        FROM long l
+        LEFT JOIN responses r ON r.query_id = l.query_id AND r.source = l.source
+    """
+    # COPY's own CSV writer quotes more fields than the csv module behind write_csv (e.g.
+    # any text containing '#'), so each row is written as one line quoted like pandas does
+    line_cols = [c for c in DESIRED_COLS + meta_cols if not (partition and c == "source")]
+    header = io.StringIO()
+    csv.writer(header, lineterminator="").writerow(line_cols)
+    line = " || ',' || ".join(_csv_field_sql(c) for c in line_cols)
+    header_col = '"' + header.getvalue().replace('"', '""') + '"'
+    lines_sql = f"""
+        SELECT {"source, " if partition else ""}{line} AS {header_col}
+        FROM ({csv_sql})
+        ORDER BY query_id, source, brand
+    """
+    options = "FORMAT csv, HEADER, QUOTE '', ESCAPE ''"
+    if partition:
+        clear_partitions(OUT_CSV_PARTITION_DIR)
+        con.execute(f"COPY ({lines_sql}) TO {_sql_str(OUT_CSV_PARTITION_DIR)} "
+                    f"({options}, PARTITION_BY (source), OVERWRITE_OR_IGNORE)")
+        print(f"Saved source partitions under {OUT_CSV_PARTITION_DIR}.")
+        return
+    con.execute(f"COPY ({lines_sql}) TO {_sql_str(OUT_FILE)} ({options})")
+    print(f"Saved {OUT_FILE}.")
+
+
+def _csv_field_sql(col):
+    """Column as one field of a csv-module line: empty when missing, and quoted with doubled
+    quotes when it holds the delimiter, a quote or a line break"""
+    text = f'CAST("{col}" AS VARCHAR)'
+    return (f"""CASE WHEN regexp_matches({text}, '[,"\\r\\n]') """
+            f"""THEN '"' || replace({text}, '"', '""') || '"' ELSE COALESCE({text}, '') END""")
+
+
+def main(out_format="csv", engine="pandas", sources_file=SOURCES_FILE, partition=False):
+    sources = load_sources(sources_file)
+    print(f"Sources: {', '.join(s['source'] for s in sources)}")
+    if engine == "duckdb":
+        build_duckdb(sources, out_format, partition)
+    else:
+        build_pandas(sources, out_format, partition)
+
+
 if __name__ == "__main__":
-    main()
+    parser = argparse.ArgumentParser(description="Build the brand-level modelling dataset")
+    parser.add_argument("--format", choices=["csv", "parquet"], default="csv",
+                        help="parquet writes a normalized columnar dataset (needs pyarrow)")
+    parser.add_argument("--engine", choices=["pandas", "duckdb"], default="pandas",
+                        help="duckdb runs the build as a lazy, out-of-core plan (needs duckdb)")
+    parser.add_argument("--sources", default=SOURCES_FILE, help="CSV manifest of sources to combine")
+    parser.add_argument("--partition", action="store_true",
+                        help="write one source=<name>/ partition per source instead of a single file")
+    args = parser.parse_args()
+    main(args.format, args.engine, args.sources, args.partition)
@@ -0,0 +1,18 @@
+# Input and output paths of dataset_constructor.py, kept apart from it so that scripts
+# which only need the paths (e.g. pipeline.py) do not import pandas.
+
+# ===========================
+# CONFIG
+# ===========================
+# Manifest of the response/mention pairs to combine, one row per source (provider, model
+# or snapshot). Columns: source,responses_file,mentions_file; any further columns
+# (e.g. model, snapshot) are copied onto every row of that source.
+SOURCES_FILE = "data/sources.csv"
+BRAND_FEATURES_FILE = "data/brand_features.csv"
+TOPIC_HITS_FILE = "data/topic_brand_hits.csv"
+OUT_FILE = "data/dataset.csv"
+
+# Columnar output (--format parquet): the long brand table without texts, plus the
+# response texts stored once per (query_id, source) in a side table
+OUT_PARQUET_FILE = "data/dataset.parquet"
+OUT_TEXTS_FILE = "data/dataset_texts.parquet"
@@ -1,47 +1,253 @@
+import argparse
 import csv
-import re
-
-# Define regex patterns for each brand (case-insensitive)
-brand_patterns = {
-    "1Password": re.compile(r"\b1 ?password\b", re.IGNORECASE),
-    "Bitwarden": re.compile(r"\bbit ?warden\b", re.IGNORECASE),
-    "LastPass": re.compile(r"\blast ?pass\b", re.IGNORECASE),
-    "Dashlane": re.compile(r"\bdash ?lane\b", re.IGNORECASE),
-    "Keeper": re.compile(r"\bkeeper\b", re.IGNORECASE),
-    "NordPass": re.compile(r"\bnord ?pass\b", re.IGNORECASE),
-    "RoboForm": re.compile(r"\brobo ?form\b", re.IGNORECASE),
-}
-
-# 1) Load the responses
-responses = []
-with open("responses.csv", newline="", encoding="utf-8") as f:
-    reader = csv.DictReader(f)
-    for row in reader:
-        responses.append(row)
-
-print(f"Loaded {len(responses)} responses")
-
-# 2) Build the long-format mentions table
-mentions_rows = []
-
-for row in responses:
-    qid = row["query_id"]
-    text = row["response_text"]
-
-    for brand, pattern in brand_patterns.items():
-        mention = 1 if pattern.search(text) else 0
-
-        mentions_rows.append({
-            "query_id": qid,
-            "brand": brand,
-            "mention": mention
-        })
-
-# 3) Save mentions.csv
-with open("mentions.csv", "w", newline="", encoding="utf-8") as f:
-    fieldnames = ["query_id", "brand", "mention"]
-    writer = csv.DictWriter(f, fieldnames=fieldnames)
-    writer.writeheader()
-    writer.writerows(mentions_rows)
-
-print("Done. Saved mentions to mentions.csv")
+import hashlib
+import io
+import itertools
+import json
+import multiprocessing
+import os
+import sys
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+from brand_matcher import BrandMatcher, DEFAULT_BRANDS, load_brands
+
+# ===========================
+# CONFIG
+# ===========================
+RESPONSES_FILE = "responses.csv"
+MENTIONS_FILE = "mentions.csv"
+# Optional CSV of brand aliases (columns: brand,alias); the built-in list is used when None
+BRANDS_FILE = None
+CHUNK_SIZE = 2000               # responses per task sent to a worker
+WORKERS = os.cpu_count() or 1
+CHUNKS_IN_FLIGHT_PER_WORKER = 2  # bounds memory: at most this many chunks queued per worker
+# Workers are started fresh rather than forked: pipeline.py runs extractions from threads,
+# and forking a multithreaded process can copy a lock held by another thread and deadlock
+START_METHOD = "spawn"
+
+FIELDNAMES = ["query_id", "brand", "mention"]
+
+# LLM answers can exceed the csv module's default 128 KB field limit
+csv.field_size_limit(min(sys.maxsize, 2 ** 31 - 1))
+
+_matcher = None
+
+
+def _init_worker(brands):
+    global _matcher
+    _matcher = BrandMatcher(brands)
+
+
+def _mentions_chunk(chunk):
+    """Long-format mention rows for each (query_id, response_text) in a chunk, as CSV text"""
+    results = []
+    for qid, text in chunk:
+        out = io.StringIO()
+        # One scan of the text finds every brand it mentions
+        flags = _matcher.mention_flags(text)
+        csv.writer(out).writerows([qid, brand, mention] for brand, mention in zip(_matcher.brands, flags))
+        results.append(out.getvalue())
+    return results
+
+
+def response_hash(text):
+    return hashlib.blake2b(text.encode("utf-8"), digest_size=16).hexdigest()
+
+
+def manifest_path(mentions_file):
+    return mentions_file + ".manifest.json"
+
+
+def load_manifest(mentions_file):
+    """The manifest for mentions_file, with one hash per occurrence of each query_id"""
+    path = manifest_path(mentions_file)
+    if not os.path.exists(path) or not os.path.exists(mentions_file):
+        return None
+    with open(path, encoding="utf-8") as f:
+        manifest = json.load(f)
+    # Older manifests stored a single hash per query_id
+    manifest["responses"] = {qid: [h] if isinstance(h, str) else h for qid, h in manifest["responses"].items()}
+    return manifest
+
+
+def occurrence_hashes(pairs):
+    """{query_id: [hash of its 1st response, 2nd, ...]} for (query_id, response_text) pairs.
+
+    A query_id repeats when the same query was sampled several times, so responses
+    are told apart by their occurrence index within the file.
+    """
+    hashes = {}
+    for qid, text in pairs:
+        hashes.setdefault(qid, []).append(response_hash(text))
+    return hashes
+
+
+def read_chunks(path, chunk_size=CHUNK_SIZE):
+    """Stream (query_id, response_text) pairs from a responses CSV in fixed-size chunks"""
+    with open(path, newline="", encoding="utf-8") as f:
+        chunk = []
+        for row in csv.DictReader(f):
+            chunk.append((row["query_id"], row["response_text"]))
+            if len(chunk) >= chunk_size:
+                yield chunk
+                chunk = []
+        if chunk:
+            yield chunk
+
+
+class _OrderMismatch(Exception):
+    pass
+
+
+class _PreviousMentions:
+    """Reads an earlier mentions.csv response by response, in file order, to copy unchanged rows.
+
+    Every response has exactly one row per brand, so blocks of n_brands rows are
+    responses; a block is identified by its query_id and occurrence index.
+    """
+
+    def __init__(self, path, n_brands):
+        self.f = open(path, newline="", encoding="utf-8")
+        self.reader = csv.reader(self.f)
+        next(self.reader)  # header
+        self.n_brands = n_brands
+        self.seen = {}
+
+    def take(self, qid, occurrence):
+        """CSV text of the rows for that response, skipping responses that changed or disappeared"""
+        while True:
+            rows = list(itertools.islice(self.reader, self.n_brands))
+            if len(rows) < self.n_brands or any(row[0] != rows[0][0] for row in rows):
+                break
+            block_qid = rows[0][0]
+            index = self.seen.get(block_qid, 0)
+            self.seen[block_qid] = index + 1
+            if (block_qid, index) == (qid, occurrence):
+                out = io.StringIO()
+                csv.writer(out).writerows(rows)
+                return out.getvalue()
+        # Responses were reordered since the last run; merging in order is not possible
+        raise _OrderMismatch(qid)
+
+    def close(self):
+        self.f.close()
+
+
+def _extract(responses_file, tmp_file, brands, workers, chunk_size, previous):
+    """One pass over responses_file; `previous` is None for a full recompute, else
+    (old manifest hashes, _PreviousMentions) for rows that can be copied unchanged"""
+    hashes = {}
+    stats = {"reused": 0, "computed": 0}
+
+    def plan(chunk):
+        items = []   # (query_id, occurrence, reuse) in input order
+        todo = []    # (query_id, text) that need matching
+        for qid, text in chunk:
+            h = response_hash(text)
+            seen = hashes.setdefault(qid, [])
+            occurrence = len(seen)
+            old = previous[0].get(qid, []) if previous is not None else []
+            reuse = occurrence < len(old) and old[occurrence] == h
+            seen.append(h)
+            items.append((qid, occurrence, reuse))
+            if not reuse:
+                todo.append((qid, text))
+        return items, todo
+
+    def write(out, items, computed):
+        computed = iter(computed)
+        for qid, occurrence, reuse in items:
+            if reuse:
+                out.write(previous[1].take(qid, occurrence))
+                stats["reused"] += 1
+            else:
+                out.write(next(computed))
+                stats["computed"] += 1
+
+    with open(tmp_file, "w", newline="", encoding="utf-8") as out:
+        csv.writer(out).writerow(FIELDNAMES)
+
+        if workers <= 1:
+            _init_worker(brands)
+            for chunk in read_chunks(responses_file, chunk_size):
+                items, todo = plan(chunk)
+                write(out, items, _mentions_chunk(todo))
+        else:
+            max_pending = workers * CHUNKS_IN_FLIGHT_PER_WORKER
+            with ProcessPoolExecutor(workers, mp_context=multiprocessing.get_context(START_METHOD),
+                                     initializer=_init_worker, initargs=(brands,)) as pool:
+                pending = deque()
+                for chunk in read_chunks(responses_file, chunk_size):
+                    items, todo = plan(chunk)
+                    pending.append((items, pool.submit(_mentions_chunk, todo) if todo else None))
+                    # Write finished chunks in order; block on the oldest once the window is full
+                    while pending and (len(pending) >= max_pending or pending[0][1] is None
+                                       or pending[0][1].done()):
+                        items, future = pending.popleft()
+                        write(out, items, future.result() if future else [])
+                while pending:
+                    items, future = pending.popleft()
+                    write(out, items, future.result() if future else [])
+
+    return hashes, stats
+
+
+def extract_mentions(responses_file=RESPONSES_FILE, mentions_file=MENTIONS_FILE, brands=None,
+                     workers=WORKERS, chunk_size=CHUNK_SIZE, full=False):
+    """Write the long-format mentions table for responses_file.
+
+    Chunks are fanned out to a process pool and written back in input order as soon as
+    they are ready, so memory stays bounded by the chunks in flight, not the corpus size.
+
+    A manifest next to mentions_file records a hash per response (per occurrence of
+    each query_id, so repeated samples of one query are tracked separately) and the
+    brand-set version. Unless `full` is set or the brands changed, only new or changed responses
+    are matched; rows for unchanged ones are copied from the previous mentions_file.
+    """
+    brands = brands or DEFAULT_BRANDS
+    version = BrandMatcher(brands).version
+    tmp_file = mentions_file + ".tmp"
+
+    manifest = None if full else load_manifest(mentions_file)
+    previous = None
+    if manifest is not None and manifest["brand_version"] == version:
+        previous = (manifest["responses"], _PreviousMentions(mentions_file, len(brands)))
+    elif manifest is not None:
+        print("Brand list changed since the last run, recomputing all mentions")
+
+    try:
+        hashes, stats = _extract(responses_file, tmp_file, brands, workers, chunk_size, previous)
+    except _OrderMismatch:
+        print("Responses were reordered since the last run, recomputing all mentions")
+        previous[1].close()
+        previous = None
+        hashes, stats = _extract(responses_file, tmp_file, brands, workers, chunk_size, None)
+    finally:
+        if previous is not None:
+            previous[1].close()
+
+    os.replace(tmp_file, mentions_file)
+    with open(manifest_path(mentions_file), "w", encoding="utf-8") as f:
+        json.dump({"brand_version": version, "brands": list(brands), "responses": hashes}, f)
+    return stats
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Build the long-format mentions table from LLM responses")
+    parser.add_argument("--responses", default=RESPONSES_FILE)
+    parser.add_argument("--mentions", default=MENTIONS_FILE)
+    parser.add_argument("--brands", default=BRANDS_FILE, help="CSV of brand,alias rows")
+    parser.add_argument("--workers", type=int, default=WORKERS)
+    parser.add_argument("--chunk-size", type=int, default=CHUNK_SIZE)
+    parser.add_argument("--full", action="store_true", help="ignore the manifest and rescan every response")
+    args = parser.parse_args(argv)
+
+    brands = load_brands(args.brands) if args.brands else DEFAULT_BRANDS
+    stats = extract_mentions(args.responses, args.mentions, brands, args.workers, args.chunk_size, args.full)
+    print(f"Done. {stats['computed']} responses scanned, {stats['reused']} unchanged reused "
+          f"({len(brands)} brands), saved mentions to {args.mentions}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,229 @@
+import asyncio
+import hashlib
+import json
+import os
+import random
+import sys
+import time
+import uuid
+
+from providers import Provider
+
+# ===========================
+# CONFIG
+# ===========================
+N_QUERIES = 300
+LATENCY = 0.5           # mean seconds per simulated call
+JITTER = 0.3
+ERROR_PROB = 0.02       # transient non-rate-limit failures
+SERVER_RPM = 200        # the fake server answers 429 above this many calls per minute
+BATCH_DIR = "fake_batches"
+BATCH_POLLS_TO_FINISH = 2
+FIRST_TOKEN_SHARE = 0.4  # part of the latency spent before the first streamed piece
+STREAM_PIECE_CHARS = 8   # characters per streamed piece (on average)
+FAKE_BRANDS = ["1Password", "Bitwarden", "LastPass", "Dashlane", "Keeper", "NordPass", "RoboForm"]
+
+
+class FakeRateLimitError(Exception):
+    """Mimics the SDK errors the runners detect as rate limits"""
+    status_code = 429
+
+
+class ServerQuota:
+    """Requests-per-minute quota of a fake server: admit() raises FakeRateLimitError above it"""
+
+    def __init__(self, rpm):
+        self.rpm = rpm
+        self.recent_calls = []
+        self.calls = 0
+        self.rate_limited = 0
+
+    def admit(self):
+        self.calls += 1
+        # Quota enforced over a sliding 10s window; rejected calls do not count against it
+        now = time.monotonic()
+        self.recent_calls = [t for t in self.recent_calls if now - t < 10]
+        if self.rpm and len(self.recent_calls) >= self.rpm / 6:
+            self.rate_limited += 1
+            raise FakeRateLimitError("Error code: 429 - RESOURCE_EXHAUSTED (fake quota)")
+        self.recent_calls.append(now)
+
+
+class FakeClient:
+    """Local stand-in for a provider: simulated latency, transient errors and 429s, no network"""
+
+    def __init__(self, latency=LATENCY, jitter=JITTER, error_prob=ERROR_PROB,
+                 server_rpm=SERVER_RPM, seed=0):
+        self.latency = latency
+        self.jitter = jitter
+        self.error_prob = error_prob
+        self.quota = ServerQuota(server_rpm)
+        self.rng = random.Random(seed)
+
+    async def complete(self, prompt):
+        self.quota.admit()
+        await asyncio.sleep(max(0.0, self.rng.gauss(self.latency, self.jitter)))
+        if self.rng.random() < self.error_prob:
+            raise RuntimeError("fake transient server error")
+
+        text = fake_answer(prompt, self.rng)
+        usage = {"prompt_tokens": len(prompt) // 4, "completion_tokens": len(text) // 4}
+        return text, usage["prompt_tokens"] + usage["completion_tokens"], usage
+
+    async def stream(self, prompt):
+        """Same answers as complete(), delivered in small pieces over the simulated latency"""
+        self.quota.admit()
+        latency = max(0.0, self.rng.gauss(self.latency, self.jitter))
+        text = fake_answer(prompt, self.rng)
+        await asyncio.sleep(latency * FIRST_TOKEN_SHARE)
+        pieces = []
+        pos = 0
+        while pos < len(text):
+            size = self.rng.randint(1, 2 * STREAM_PIECE_CHARS)
+            pieces.append(text[pos:pos + size])
+            pos += size
+        for i, piece in enumerate(pieces):
+            if i == len(pieces) // 2 and self.rng.random() < self.error_prob:
+                raise RuntimeError("fake stream interrupted")
+            await asyncio.sleep(latency * (1 - FIRST_TOKEN_SHARE) / len(pieces))
+            yield piece, None
+        yield "", len(prompt) // 4 + len(text) // 4
+
+
+def fake_answer(prompt, rng=random):
+    """A stochastic answer: each brand is named with its own fixed, prompt-dependent probability"""
+    named = [brand for brand in FAKE_BRANDS if rng.random() < mention_prob(prompt, brand)]
+    if not named:
+        return f"Fake answer to: {prompt}\nIt depends on your needs."
+    return f"Fake answer to: {prompt}\n{' and '.join(named)} are popular choices."
+
+
+def mention_prob(prompt, brand):
+    """True mention rate of a brand for a prompt in fake answers (for checking estimates)"""
+    digest = hashlib.blake2b(f"{prompt}|{brand}".encode("utf-8"), digest_size=2).digest()
+    return int.from_bytes(digest, "big") / 65535
+
+
+class FakeBatchServer:
+    """Local stand-in for a provider batch API, backed by files in `root`.
+
+    Jobs go validating -> in_progress -> completed over a few status polls;
+    requests whose prompt contains "FAIL" come back as per-request errors.
+    """
+
+    def __init__(self, root=BATCH_DIR, polls_to_finish=BATCH_POLLS_TO_FINISH):
+        os.makedirs(root, exist_ok=True)
+        self.root = root
+        self.polls_to_finish = polls_to_finish
+
+    def _job_file(self, job_id):
+        return os.path.join(self.root, f"{job_id}.json")
+
+    def create(self, jsonl_path):
+        job_id = f"batch_{uuid.uuid4().hex[:12]}"
+        with open(jsonl_path, encoding="utf-8") as f:
+            requests = [json.loads(line) for line in f if line.strip()]
+        with open(self._job_file(job_id), "w", encoding="utf-8") as f:
+            json.dump({"state": "validating", "polls": 0, "requests": requests}, f)
+        return job_id
+
+    def retrieve(self, job_id):
+        with open(self._job_file(job_id), encoding="utf-8") as f:
+            job = json.load(f)
+        job["polls"] += 1
+        if job["polls"] >= self.polls_to_finish:
+            job["state"] = "completed"
+        elif job["state"] == "validating":
+            job["state"] = "in_progress"
+        with open(self._job_file(job_id), "w", encoding="utf-8") as f:
+            json.dump(job, f)
+        return job
+
+    def results(self, job_id):
+        with open(self._job_file(job_id), encoding="utf-8") as f:
+            job = json.load(f)
+        for request in job["requests"]:
+            prompt = request["prompt"]
+            if "FAIL" in prompt:
+                yield {"custom_id": request["custom_id"], "error": {"message": "fake request failure"}}
+            else:
+                yield {"custom_id": request["custom_id"], "text": fake_answer(prompt)}
+
+
+class FakeProvider(Provider):
+    """Provider backed by FakeClient (online) and FakeBatchServer (batch)"""
+
+    name = "fake"
+    default_model = "fake-model"
+    default_output = "responses_fake.csv"
+    max_in_flight = 32
+    requests_per_minute = 600
+    tokens_per_minute = 1000000
+
+    def __init__(self, model=None, api_key=None, params=None, client=None, batch_server=None):
+        super().__init__(model, api_key or "fake", params)
+        self.client = client or FakeClient()
+        self.batch_server = batch_server or FakeBatchServer()
+
+    def preflight(self):
+        print(f"✓ Fake provider ready. Using model: {self.model}")
+
+    async def complete(self, prompt):
+        return await self.client.complete(prompt)
+
+    async def stream(self, prompt):
+        async for item in self.client.stream(prompt):
+            yield item
+
+    def is_rate_limit(self, e):
+        return isinstance(e, FakeRateLimitError)
+
+    def batch_request(self, custom_id, prompt):
+        return {"custom_id": custom_id, "prompt": prompt}
+
+    def submit_batch(self, jsonl_path):
+        return self.batch_server.create(jsonl_path)
+
+    def batch_status(self, job_id):
+        state = self.batch_server.retrieve(job_id)["state"]
+        return ("succeeded" if state == "completed" else "running"), state
+
+    def batch_results(self, job_id):
+        for record in self.batch_server.results(job_id):
+            if "error" in record:
+                yield record["custom_id"], None, json.dumps(record["error"]), None
+            else:
+                yield record["custom_id"], record["text"], None, len(record["text"]) // 4
+
+
+def main():
+    from query_runner import run_queries
+
+    provider = FakeProvider()
+    client = provider.client
+    queries = [
+        {"query_id": str(i), "query_text": f"Which password manager is best? #{i}", "topic": "Fit/Use"}
+        for i in range(1, N_QUERIES + 1)
+    ]
+
+    start = time.monotonic()
+    rows = run_queries(queries, provider.complete, provider.is_rate_limit, provider.is_auth_error,
+                       max_in_flight=provider.max_in_flight,
+                       requests_per_minute=provider.requests_per_minute,
+                       tokens_per_minute=provider.tokens_per_minute)
+    elapsed = time.monotonic() - start
+
+    errors = sum(r["response_text"].startswith("ERROR:") for r in rows)
+    print(f"\n✓ {len(rows)} rows ({errors} errors) in {elapsed:.1f}s; "
+          f"{client.quota.calls} calls, {client.quota.rate_limited} rate limited")
+    print(f"  Sequential with 1s pauses would take ~{N_QUERIES * (LATENCY + 1.0):.0f}s")
+
+
+if __name__ == "__main__":
+    # python fake_client.py            -> runner demo against the fake client
+    # python fake_client.py --collect  -> full collection path (remaining args passed on, e.g. --batch)
+    if len(sys.argv) > 1 and sys.argv[1] == "--collect":
+        from collect_responses import main as collect_main
+        collect_main(FakeProvider, sys.argv[2:])
+    else:
+        main()
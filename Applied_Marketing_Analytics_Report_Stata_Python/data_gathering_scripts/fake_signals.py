@@ -0,0 +1,72 @@
+import asyncio
+import hashlib
+import json
+import random
+import sys
+
+from fake_client import ERROR_PROB, ServerQuota
+from signal_backends import SignalBackend
+
+# ===========================
+# CONFIG
+# ===========================
+SIGNAL_LATENCY = 0.2     # mean seconds per simulated search/rating/SEO request
+SIGNAL_SERVER_RPM = 1200
+SIGNAL_CHANGE_SHARE = 0.1  # share of signal values that change with each data version
+
+
+def _signal_seed(kind, request, version):
+    digest = hashlib.blake2b(json.dumps([kind, request, version], sort_keys=True).encode("utf-8"),
+                             digest_size=8).digest()
+    return int.from_bytes(digest, "big")
+
+
+class FakeSignalBackend(SignalBackend):
+    """Local stand-in for the search, rating and SEO services, with ETags and 304s.
+
+    Values are deterministic per request. Each bump of `version` changes about
+    SIGNAL_CHANGE_SHARE of them (and their ETags), so conditional requests for the rest
+    come back as not modified.
+    """
+
+    name = "fake"
+    kinds = ("hits", "rating", "seo")
+    max_in_flight = 16
+    requests_per_minute = 1000
+
+    def __init__(self, version=0, latency=SIGNAL_LATENCY, error_prob=ERROR_PROB, server_rpm=SIGNAL_SERVER_RPM, seed=0):
+        self.version = version
+        self.latency = latency
+        self.error_prob = error_prob
+        self.quota = ServerQuota(server_rpm)
+        self.rng = random.Random(seed)
+        self.not_modified = 0
+
+    def _value(self, kind, request):
+        changed = [v for v in range(1, self.version + 1)
+                   if _signal_seed(kind, request, v) % 1000 < SIGNAL_CHANGE_SHARE * 1000]
+        seed = _signal_seed(kind, request, max(changed, default=0))
+        rng = random.Random(seed)
+        if kind == "hits":
+            return int(rng.lognormvariate(7, 2))
+        if kind == "rating":
+            return {"avgrating": round(rng.uniform(3.0, 5.0), 1), "reviewcount": int(rng.lognormvariate(6, 1.5)) + 1}
+        return rng.randint(60, 100)
+
+    async def fetch(self, kind, request, etag=None):
+        self.quota.admit()
+        await asyncio.sleep(max(0.0, self.rng.gauss(self.latency, self.latency / 3)))
+        if self.rng.random() < self.error_prob:
+            raise RuntimeError("fake transient server error")
+        value = self._value(kind, request)
+        current = '"' + hashlib.blake2b(json.dumps(value).encode("utf-8"), digest_size=8).hexdigest() + '"'
+        if etag == current:
+            self.not_modified += 1
+            return None, etag
+        return value, current
+
+
+if __name__ == "__main__":
+    # python fake_signals.py [collect_signals.py options] -> collect_signals.py against FakeSignalBackend
+    from collect_signals import main as signals_main
+    signals_main(sys.argv[1:], backends={kind: "fake" for kind in FakeSignalBackend.kinds})
@@ -0,0 +1,117 @@
+import numpy as np
+import pandas as pd
+
+from schema import TABLES
+
+# ===========================
+# CONFIG
+# ===========================
+# Lever definitions of analysis.do (sections 2-3), in order: (name, operation, inputs).
+# Inputs are dataset columns or earlier features. Add a lever by appending a row.
+FEATURES = [
+    # A. Social Buzz (Reddit + YouTube + LinkedIn)
+    ("raw_social_buzz", "sum", ["reddit_topic_hits_bt", "youtube_topic_hits_bt", "linkedin_topic_hits_bt"]),
+    ("ln_social_buzz", "log1p", ["raw_social_buzz"]),
+    # B. Articles (Listicles + Domain)
+    ("raw_articles", "sum", ["listicle_topic_hits_bt", "domain_topic_hits_bt"]),
+    ("ln_articles", "log1p", ["raw_articles"]),
+    # C. Review Index (Rating * Volume Interaction)
+    ("ln_reviews", "log1p", ["reviewcount_b_g2"]),
+    ("raw_review_score", "mul", ["avgrating_b_g2", "ln_reviews"]),
+    # D. Standardization (Z-Scores for Model Comparability)
+    ("z_social_buzz", "std", ["ln_social_buzz"]),
+    ("z_articles", "std", ["ln_articles"]),
+    ("z_review_index", "std", ["raw_review_score"]),
+    ("z_seo", "std", ["lighthouse_seo_b"]),
+]
+
+# Element-wise operations on equally long arrays. "std" is handled separately because it
+# needs the row-level distribution (Stata's egen std()).
+OPS = {
+    "sum": lambda *cols: np.sum(cols, axis=0),
+    "mul": lambda *cols: np.prod(cols, axis=0),
+    "log1p": np.log1p,
+    "log": np.log,
+}
+
+# Every dataset column is constant within one of these keys; features are computed once
+# per key and broadcast to the mention rows
+LEVELS = {
+    "brand": ["brand"],
+    "brand_topic": ["brand", "topic"],
+}
+BASE_LEVEL = {
+    **{c: "brand" for c in TABLES["brand_features"]["columns"] if c != "brand"},
+    **{c: "brand_topic" for c in TABLES["topic_hits"]["columns"] if c not in ("brand", "topic")},
+}
+
+
+class FeaturePipeline:
+    """Computes the FEATURES on the dataset constructor's output.
+
+    Brand features (ratings, reviews, SEO) and brand × topic features (hit counts) are
+    evaluated once per distinct brand or (brand, topic) on small key tables. The mention
+    rows only hold integer codes into those tables. Standardization uses each key's row
+    count as its weight, so z-scores equal egen std() over the mention rows without
+    expanding the data first.
+    """
+
+    def __init__(self, features=None):
+        self.features = list(features or FEATURES)
+        self.level = dict(BASE_LEVEL)
+        for name, op, inputs in self.features:
+            if op != "std" and op not in OPS:
+                raise ValueError(f"feature '{name}': unknown operation '{op}'")
+            unknown = [c for c in inputs if c not in self.level]
+            if unknown:
+                raise ValueError(f"feature '{name}': unknown inputs {unknown}")
+            if name in self.level:
+                raise ValueError(f"feature '{name}' is defined twice or shadows a dataset column")
+            levels = {self.level[c] for c in inputs}
+            # A feature mixing brand and brand × topic inputs lives at the finer level
+            self.level[name] = "brand_topic" if "brand_topic" in levels else "brand"
+
+    def transform(self, df, names=None):
+        """DataFrame (same index as df) with the requested features, all by default"""
+        names = list(names) if names is not None else [name for name, _, _ in self.features]
+
+        # Key tables: one row per brand and per (brand, topic), with row counts as weights
+        codes, tables, weights = {}, {}, {}
+        for level, key in LEVELS.items():
+            code, uniques = pd.MultiIndex.from_frame(df[key]).factorize()
+            codes[level] = code
+            first = np.unique(code, return_index=True)[1]
+            tables[level] = {c: df[c].to_numpy(float)[first] for c in df.columns if BASE_LEVEL.get(c) == level}
+            weights[level] = np.bincount(code, minlength=len(uniques)).astype(float)
+
+        # The brand level is also needed at the brand × topic level for mixed features
+        brand_of_pair = codes["brand"][np.unique(codes["brand_topic"], return_index=True)[1]]
+
+        def values(col, level):
+            if self.level[col] == level:
+                return tables[level][col]
+            return tables["brand"][col][brand_of_pair]
+
+        for name, op, inputs in self.features:
+            level = self.level[name]
+            args = [values(c, level) for c in inputs]
+            if op == "std":
+                tables[level][name] = _weighted_std(args[0], weights[level])
+            else:
+                tables[level][name] = OPS[op](*args)
+
+        out = pd.DataFrame(index=df.index)
+        for name in names:
+            level = self.level[name]
+            out[name] = tables[level][name][codes[level]]
+        return out
+
+
+def _weighted_std(x, counts):
+    """egen std() over the rows: key values weighted by their row counts, n-1 denominator,
+    missing values ignored"""
+    ok = ~np.isnan(x)
+    n = counts[ok].sum()
+    mean = np.sum(counts[ok] * x[ok]) / n
+    sd = np.sqrt(np.sum(counts[ok] * (x[ok] - mean) ** 2) / (n - 1))
+    return (x - mean) / sd
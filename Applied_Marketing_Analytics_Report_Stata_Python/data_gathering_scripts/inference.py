@@ -0,0 +1,338 @@
+import argparse
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+
+import numpy as np
+import pandas as pd
+
+from analysis import DATASET_FILE, GROUP_COL, LEVERS, SOURCE_COL, load_model_data
+from clogit import ConditionalLogit, chi2_pvalue, marginal_effects
+from features import FeaturePipeline
+
+# ===========================
+# CONFIG
+# ===========================
+BOOTSTRAP_REPS = 2000
+PERMUTATIONS = 1000
+REPS_PER_TASK = 50       # replicates per task sent to a worker
+WORKERS = os.cpu_count() or 1
+SEED = 0
+OUT_FILE = "data/inference.csv"
+UNIT_COL = "brand"       # the levers vary by (brand, topic): brands are permuted within each topic
+STRATUM_COL = "topic"
+
+# Replicate streams: each replicate's random draws depend only on (seed, kind, index),
+# so results do not change with the number of workers or the task size
+KINDS = {"bootstrap": 0, "lr_permutation": 1, "lever_permutation": 2}
+
+
+class InferenceData:
+    """Outcome, groups, source codes and levers packed into one float64 block.
+
+    The block lives in shared memory so worker processes map it instead of receiving a
+    pickled copy; columns are [y, group, source, unit, stratum, lever_1..lever_P]. The levers
+    are brand x topic features, so a unit is a (brand, topic) cell and a stratum is a topic.
+    """
+
+    def __init__(self, block, sources, levers):
+        self.block = block
+        self.sources = list(sources)
+        self.levers = list(levers)
+
+    @property
+    def y(self):
+        return self.block[:, 0]
+
+    @property
+    def groups(self):
+        return self.block[:, 1].astype(np.int64)
+
+    @property
+    def source(self):
+        return self.block[:, 2].astype(np.int64)
+
+    @property
+    def unit(self):
+        return self.block[:, 3].astype(np.int64)
+
+    @property
+    def stratum(self):
+        return self.block[:, 4].astype(np.int64)
+
+    @property
+    def L(self):
+        return self.block[:, 5:]
+
+    @classmethod
+    def from_frame(cls, df, pipeline=None):
+        levers = (pipeline or FeaturePipeline()).transform(df, LEVERS)
+        sources = sorted(pd.unique(df[SOURCE_COL]))
+        block = np.column_stack([
+            df["mention"].to_numpy(float),
+            pd.factorize(df[GROUP_COL])[0].astype(float),
+            pd.Categorical(df[SOURCE_COL], categories=sources).codes.astype(float),
+            pd.factorize(pd.MultiIndex.from_frame(df[[UNIT_COL, STRATUM_COL]]))[0].astype(float),
+            pd.factorize(df[STRATUM_COL])[0].astype(float),
+            levers.to_numpy(float),
+        ])
+        return cls(block, sources, LEVERS)
+
+    def to_shared(self):
+        shm = shared_memory.SharedMemory(create=True, size=self.block.nbytes)
+        np.ndarray(self.block.shape, dtype=np.float64, buffer=shm.buf)[:] = self.block
+        return shm, (shm.name, self.block.shape, self.sources, self.levers)
+
+    @classmethod
+    def from_shared(cls, name, shape, sources, levers):
+        shm = shared_memory.SharedMemory(name=name)
+        block = np.ndarray(shape, dtype=np.float64, buffer=shm.buf)
+        return shm, cls(block, sources, levers)
+
+
+def pooled_design(data, source=None):
+    """Levers + i.source indicators (first source is the base level)"""
+    source = data.source if source is None else source
+    dummies = [(source == s).astype(float) for s in range(1, len(data.sources))]
+    names = data.levers + [f"{s}.{SOURCE_COL}" for s in data.sources[1:]]
+    return np.column_stack([data.L] + dummies), names
+
+
+def split_design(data, source=None):
+    """Separate lever coefficients per source (levers interacted with source) + i.source"""
+    source = data.source if source is None else source
+    X, _ = pooled_design(data, source)
+    P = len(data.levers)
+    interacted = [data.L * (source == s)[:, None] for s in range(len(data.sources))]
+    return np.column_stack(interacted + [X[:, P:]])
+
+
+def ame_scopes(data, model, beta, weights=None):
+    """Pooled AMEs and AMEs over each source's rows, (1 + n_sources) x n_params;
+    `weights` are per-group weights such as bootstrap counts"""
+    factor_idx = list(range(len(data.levers), model.X.shape[1]))
+    row_weights = np.ones(model.n_obs) if weights is None else weights[model.row_group]
+    source = data.source[model.sample]
+    out = [marginal_effects(beta, model.X, factor_idx, row_weights, jacobian=False)[0]]
+    for s in range(len(data.sources)):
+        rows = source == s
+        out.append(marginal_effects(beta, model.X[rows], factor_idx, row_weights[rows], jacobian=False)[0])
+    return np.array(out)
+
+
+def lever_residuals(X, groups, j):
+    """Split column j of X into its fit on the other columns plus query-group effects, and the
+    residual; the fit is a within-group least-squares projection, matching the clogit's conditioning"""
+    counts = np.bincount(groups)
+
+    def within(a):
+        means = np.stack([np.bincount(groups, a[:, k]) for k in range(a.shape[1])], axis=1) / counts[:, None]
+        return a - means[groups]
+
+    x = within(X[:, [j]])[:, 0]
+    Z = within(np.delete(X, j, axis=1))
+    coef = np.linalg.lstsq(Z, x, rcond=None)[0]
+    resid = x - Z @ coef
+    return X[:, j] - resid, resid
+
+
+def _fit_or_none(model, start, weights=None):
+    try:
+        result = model.fit(start=start, weights=weights, cov=False)
+    except np.linalg.LinAlgError:
+        return None
+    return result if result.converged else None
+
+
+# ===========================
+# WORKERS
+# ===========================
+_state = None
+
+
+def _init_worker(shared, full):
+    """Map the shared block and build the full-sample models once per process"""
+    global _state
+    shm, data = InferenceData.from_shared(*shared)
+    X, _ = pooled_design(data)
+    model = ConditionalLogit(data.y, X, data.groups)
+    unit = data.unit[model.sample]
+    n_units = np.bincount(unit)
+    lever_parts = []
+    for j in range(len(data.levers)):
+        fitted, resid = lever_residuals(model.X, model.row_group, j)
+        lever_parts.append((fitted, np.bincount(unit, resid, len(n_units)) / np.maximum(n_units, 1)))
+    unit_stratum = np.zeros(len(n_units), dtype=np.int64)
+    unit_stratum[unit] = data.stratum[model.sample]
+    _state = {
+        "shm": shm,
+        "data": data,
+        "pooled": model,
+        "full": full,
+        "unit": unit,
+        "unit_stratum": unit_stratum,
+        "lever_parts": lever_parts,
+    }
+
+
+def _rng(seed, kind, rep):
+    return np.random.default_rng([seed, KINDS[kind], rep])
+
+
+def _bootstrap_task(seed, reps):
+    """Cluster bootstrap: resample query groups with replacement, expressed as group weights"""
+    data, model, full = _state["data"], _state["pooled"], _state["full"]
+    out = np.full((len(reps), 1 + len(data.sources), model.X.shape[1]), np.nan)
+    for i, rep in enumerate(reps):
+        draws = _rng(seed, "bootstrap", rep).integers(0, model.n_groups, model.n_groups)
+        weights = np.bincount(draws, minlength=model.n_groups).astype(float)
+        result = _fit_or_none(model, full["pooled"], weights)
+        if result is not None:
+            out[i] = ame_scopes(data, model, result.params, weights)
+    return out
+
+
+def lr_statistic(data, source, start_pooled=None, start_split=None):
+    """LR statistic of the split (per-source levers) model against the pooled one"""
+    X_pooled, _ = pooled_design(data, source)
+    pooled = _fit_or_none(ConditionalLogit(data.y, X_pooled, data.groups), start_pooled)
+    split = _fit_or_none(ConditionalLogit(data.y, split_design(data, source), data.groups), start_split)
+    if pooled is None or split is None:
+        return np.nan, pooled, split
+    return 2 * (split.loglik - pooled.loglik), pooled, split
+
+
+def _lr_permutation_task(seed, reps):
+    """Permute the source labels among the responses of each query and recompute the LR statistic"""
+    data, full = _state["data"], _state["full"]
+    n_groups = int(data.groups.max()) + 1
+    S = len(data.sources)
+    out = np.full(len(reps), np.nan)
+    for i, rep in enumerate(reps):
+        perm = _rng(seed, "lr_permutation", rep).permuted(np.tile(np.arange(S), (n_groups, 1)), axis=1)
+        source = perm[data.groups, data.source]
+        out[i] = lr_statistic(data, source, full["pooled"], full["split"])[0]
+    return out
+
+
+def _lever_permutation_task(seed, reps):
+    """Freedman-Lane permutation of one lever: shuffle its residual on the other regressors
+    across the (brand, topic) units of each topic, add back the fitted part and refit; pooled
+    AME of that lever.
+
+    Every response of a unit gets the same permuted residual, since the lever itself is a
+    unit-level value; shuffling the raw lever row by row would also break its correlation
+    with the other levers and make the null far narrower than the spread of the AME.
+    """
+    data, model, full = _state["data"], _state["pooled"], _state["full"]
+    unit, unit_stratum = _state["unit"], _state["unit_stratum"]
+    P = len(data.levers)
+    factor_idx = list(range(P, model.X.shape[1]))
+    by_stratum = np.argsort(unit_stratum, kind="stable")
+    out = np.full((len(reps), P), np.nan)
+    for i, rep in enumerate(reps):
+        rng = _rng(seed, "lever_permutation", rep)
+        for j in range(P):
+            fitted, unit_resid = _state["lever_parts"][j]
+            # Units sorted by stratum, then randomly within each stratum
+            shuffled = np.lexsort((rng.random(len(unit_stratum)), unit_stratum))
+            permuted_resid = np.empty_like(unit_resid)
+            permuted_resid[by_stratum] = unit_resid[shuffled]
+            X = model.X.copy()
+            X[:, j] = fitted + permuted_resid[unit]
+            permuted = ConditionalLogit(model.y, X, model.row_group)
+            result = _fit_or_none(permuted, full["pooled"])
+            if result is not None:
+                out[i, j] = marginal_effects(result.params, permuted.X, factor_idx, jacobian=False)[0][j]
+    return out
+
+
+def _run(pool, task, seed, n_reps, reps_per_task=REPS_PER_TASK):
+    chunks = [list(range(lo, min(lo + reps_per_task, n_reps))) for lo in range(0, n_reps, reps_per_task)]
+    futures = [pool.submit(task, seed, chunk) for chunk in chunks]
+    return np.concatenate([f.result() for f in futures]) if futures else None
+
+
+# ===========================
+# DRIVER
+# ===========================
+
+def run_inference(df, n_boot=BOOTSTRAP_REPS, n_perm=PERMUTATIONS, workers=WORKERS, seed=SEED):
+    """Full-sample fit plus cluster-bootstrap and permutation inference, fanned out to a process pool.
+
+    Returns (table, lr) where table has one row per (scope, parameter): the AME, its
+    bootstrap SE and 95% percentile CI, and the Freedman-Lane permutation p-value for
+    levers (pooled scope); lr holds the pooled-vs-split likelihood-ratio test.
+    """
+    data = InferenceData.from_frame(df)
+    X, names = pooled_design(data)
+    model = ConditionalLogit(data.y, X, data.groups, names)
+    pooled = model.fit()
+    lr, _, split = lr_statistic(data, data.source, pooled.params)
+    if split is None:
+        raise RuntimeError("The split (per-source levers) model did not converge on the full sample; "
+                           "the pooled-vs-split LR test and its permutation null cannot be computed")
+    full = {"pooled": pooled.params, "split": split.params}
+    point = ame_scopes(data, model, pooled.params)
+
+    shm, shared = data.to_shared()
+    try:
+        with ProcessPoolExecutor(workers, initializer=_init_worker, initargs=(shared, full)) as pool:
+            boot = _run(pool, _bootstrap_task, seed, n_boot)
+            lr_null = _run(pool, _lr_permutation_task, seed, n_perm)
+            lever_null = _run(pool, _lever_permutation_task, seed, n_perm)
+    finally:
+        shm.close()
+        shm.unlink()
+
+    rows = []
+    scopes = ["all"] + data.sources
+    for s, scope in enumerate(scopes):
+        for j, name in enumerate(names):
+            draws = boot[:, s, j] if boot is not None else np.array([np.nan])
+            draws = draws[~np.isnan(draws)]
+            row = {"scope": scope, "parameter": name, "ame": point[s, j],
+                   "boot_se": draws.std(ddof=1) if len(draws) > 1 else np.nan,
+                   "ci_low": np.percentile(draws, 2.5) if len(draws) else np.nan,
+                   "ci_high": np.percentile(draws, 97.5) if len(draws) else np.nan,
+                   "boot_reps": len(draws), "perm_p": np.nan}
+            if scope == "all" and j < len(data.levers) and lever_null is not None:
+                null = lever_null[:, j][~np.isnan(lever_null[:, j])]
+                row["perm_p"] = (1 + np.sum(np.abs(null) >= abs(point[0, j]))) / (1 + len(null))
+            rows.append(row)
+
+    df_lr = len(data.levers) * (len(data.sources) - 1)
+    lr_result = {"statistic": lr, "df": df_lr, "chi2_p": chi2_pvalue(lr, df_lr), "perm_p": np.nan, "perm_reps": 0}
+    if lr_null is not None:
+        null = lr_null[~np.isnan(lr_null)]
+        lr_result["perm_p"] = (1 + np.sum(null >= lr)) / (1 + len(null))
+        lr_result["perm_reps"] = len(null)
+    return pd.DataFrame(rows), lr_result
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Cluster bootstrap and permutation inference for the pooled clogit AMEs")
+    parser.add_argument("--dataset", default=DATASET_FILE)
+    parser.add_argument("--bootstrap", type=int, default=BOOTSTRAP_REPS, help="cluster-bootstrap replicates")
+    parser.add_argument("--permutations", type=int, default=PERMUTATIONS, help="permutations per test")
+    parser.add_argument("--workers", type=int, default=WORKERS)
+    parser.add_argument("--seed", type=int, default=SEED)
+    parser.add_argument("--output", default=OUT_FILE, help="CSV of AMEs with bootstrap CIs")
+    args = parser.parse_args(argv)
+
+    df = load_model_data(args.dataset)
+    start = time.perf_counter()
+    table, lr = run_inference(df, args.bootstrap, args.permutations, args.workers, args.seed)
+    elapsed = time.perf_counter() - start
+
+    with pd.option_context("display.width", 120, "display.max_columns", None):
+        print(table.to_string(index=False, float_format=lambda v: f"{v:.4f}"))
+    print(f"\nPooled vs split LR test: chi2({lr['df']}) = {lr['statistic']:.3f}, "
+          f"asymptotic p = {lr['chi2_p']:.4f}, permutation p = {lr['perm_p']:.4f} ({lr['perm_reps']} permutations)")
+    table.to_csv(args.output, index=False)
+    print(f"Saved {args.output} ({elapsed:.1f}s, {args.workers} workers)")
+
+
+if __name__ == "__main__":
+    main()
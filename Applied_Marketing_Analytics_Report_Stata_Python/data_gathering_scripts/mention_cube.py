@@ -0,0 +1,326 @@
+import argparse
+import hashlib
+import io
+import os
+import sqlite3
+import time
+
+import pandas as pd
+
+from dataset_constructor import SOURCES_FILE, load_sources
+from schema import SchemaError, read_table
+
+# ===========================
+# CONFIG
+# ===========================
+CUBE_FILE = "data/mention_cube.sqlite"
+DIMENSIONS = ["brand", "topic", "source", "model", "date"]
+# Manifest columns (data/sources.csv) that fill the model and date dimensions; empty when absent
+MODEL_COL = "model"
+DATE_COLS = ["date", "snapshot"]
+CUBE_VERSION = 2              # bumped when the tables change; older cubes are rebuilt
+SCAN_BLOCK = 1 << 20          # bytes hashed per read when checking whether a file only grew
+
+
+class MentionCube:
+    """Persistent mention counts per (brand, topic, source, model, date).
+
+    Each cell stores the number of responses and how many of them mention the brand, so
+    any slice or roll-up is a SUM over cells and rates are mentions / responses. Every
+    ingested response is remembered with a digest of its topic and mention flags:
+    updating the cube adds new responses, swaps changed ones and subtracts removed ones,
+    without re-aggregating the rest. Unchanged input files are skipped entirely, and
+    files that only grew since the last update have just their new rows read.
+
+    Inputs are tracked per (source, model, date): pointing a source at a new snapshot
+    adds it next to the earlier ones instead of replacing them. A source dropped from
+    the manifest is removed with all its snapshots.
+    """
+
+    def __init__(self, path=CUBE_FILE):
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.path = path
+        self.conn = sqlite3.connect(path)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        if self.conn.execute("PRAGMA user_version").fetchone()[0] != CUBE_VERSION:
+            # Cubes from an older layout are re-aggregated by the next update
+            self.conn.executescript("DROP TABLE IF EXISTS cells; DROP TABLE IF EXISTS ingested; "
+                                    "DROP TABLE IF EXISTS files;")
+        self.conn.executescript(f"""
+            CREATE TABLE IF NOT EXISTS cells (
+                brand TEXT, topic TEXT, source TEXT, model TEXT, date TEXT,
+                responses INTEGER, mentions INTEGER,
+                PRIMARY KEY (brand, topic, source, model, date)
+            );
+            CREATE TABLE IF NOT EXISTS ingested (
+                source TEXT, model TEXT, date TEXT, query_id INTEGER, topic TEXT,
+                flags TEXT,          -- brand=mention pairs, ';'-separated
+                digest TEXT,
+                PRIMARY KEY (source, model, date, query_id)
+            );
+            CREATE TABLE IF NOT EXISTS files (
+                source TEXT, model TEXT, date TEXT, signature TEXT,
+                responses_file TEXT, responses_bytes INTEGER, responses_digest TEXT,
+                mentions_file TEXT, mentions_bytes INTEGER, mentions_digest TEXT,
+                updated_at REAL,
+                PRIMARY KEY (source, model, date)
+            );
+            PRAGMA user_version = {CUBE_VERSION};
+        """)
+        self.conn.commit()
+
+    def rebuild(self):
+        """Forget everything; the next update re-aggregates all inputs"""
+        self.conn.executescript("DELETE FROM cells; DELETE FROM ingested; DELETE FROM files;")
+        self.conn.commit()
+
+    @staticmethod
+    def _signature(entry):
+        parts = [entry["source"], entry.get(MODEL_COL) or "", _date_of(entry)]
+        for path in (entry["responses_file"], entry["mentions_file"]):
+            st = os.stat(path)
+            parts += [path, str(st.st_size), str(st.st_mtime_ns)]
+        return "|".join(parts)
+
+    def update(self, sources):
+        """Bring the cube up to date with the manifest entries; returns change counts"""
+        stats = {"added": 0, "changed": 0, "removed": 0, "skipped_sources": 0, "appended_sources": 0}
+        for entry in sources:
+            key = (entry["source"], entry.get(MODEL_COL) or "", _date_of(entry))
+            signature = self._signature(entry)
+            known = self.conn.execute("""
+                SELECT signature, responses_file, responses_bytes, responses_digest,
+                       mentions_file, mentions_bytes, mentions_digest
+                FROM files WHERE source = ? AND model = ? AND date = ?
+            """, key).fetchone()
+            if known is not None and known[0] == signature:
+                stats["skipped_sources"] += 1
+                continue
+            scans = [_scan(entry["responses_file"], known[2] if known and known[1] == entry["responses_file"] else 0),
+                     _scan(entry["mentions_file"], known[5] if known and known[4] == entry["mentions_file"] else 0)]
+            if known is not None and self._append(entry, key, known, scans, stats):
+                stats["appended_sources"] += 1
+            else:
+                self._update_source(entry, key, stats)
+            self.conn.execute("INSERT OR REPLACE INTO files VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", key + (
+                signature,
+                entry["responses_file"], scans[0][0], scans[0][1],
+                entry["mentions_file"], scans[1][0], scans[1][1],
+                time.time()))
+            self.conn.commit()
+
+        # Sources dropped from the manifest are removed from the cube, every snapshot of them
+        listed = {entry["source"] for entry in sources}
+        for key in self.conn.execute("SELECT source, model, date FROM files").fetchall():
+            if key[0] not in listed:
+                old = self.conn.execute("""
+                    SELECT query_id, model, date, topic, flags FROM ingested
+                    WHERE source = ? AND model = ? AND date = ?
+                """, key).fetchall()
+                self._apply(key[0], old, -1)
+                stats["removed"] += len(old)
+                self.conn.execute("DELETE FROM ingested WHERE source = ? AND model = ? AND date = ?", key)
+                self.conn.execute("DELETE FROM files WHERE source = ? AND model = ? AND date = ?", key)
+                self.conn.commit()
+        return stats
+
+    def _append(self, entry, key, known, scans, stats):
+        """Ingest only the rows added to the end of both files since the last update.
+
+        Returns False, leaving the cube untouched, unless both files still start with the
+        exact bytes read last time and their new rows are whole responses with all their
+        mentions, none of them ingested before.
+        """
+        tails = []
+        for col, scan, (path, read_bytes, digest) in zip(
+                ("responses_file", "mentions_file"), scans, (known[1:4], known[4:7])):
+            if entry[col] != path or scan[2] != digest:
+                return False
+            tail = _read_tail(path, read_bytes)
+            if tail is None:
+                return False
+            tails.append(tail)
+        try:
+            responses = read_table("responses", io.StringIO(tails[0]), usecols=["topic"])
+            mentions = read_table("mentions", io.StringIO(tails[1]))
+        except SchemaError:
+            return False   # the full read reports the problem against the file name
+        if set(responses["query_id"]) != set(mentions["query_id"]):
+            return False   # e.g. responses collected but not yet extracted
+
+        source, model, date = key
+        added, inserts = [], []
+        for qid, topic, flag_text in _flag_rows(responses, mentions).itertuples():
+            added.append((qid, model, date, topic, flag_text))
+            inserts.append((source, model, date, int(qid), topic, flag_text, _digest(model, date, topic, flag_text)))
+        try:
+            self.conn.executemany("INSERT INTO ingested VALUES (?, ?, ?, ?, ?, ?, ?)", inserts)
+        except sqlite3.IntegrityError:
+            self.conn.rollback()   # a query_id that was already ingested: not a pure append
+            return False
+        self._apply(source, added, +1)
+        stats["added"] += len(added)
+        return True
+
+    def _update_source(self, entry, key, stats):
+        source, model, date = key
+        responses = read_table("responses", entry["responses_file"], usecols=["topic"])
+        mentions = read_table("mentions", entry["mentions_file"])
+        current = _flag_rows(responses, mentions)
+
+        previous = {qid: (m, d, t, f, digest) for qid, m, d, t, f, digest in self.conn.execute(
+            "SELECT query_id, model, date, topic, flags, digest FROM ingested WHERE source = ? AND model = ? AND date = ?",
+            key)}
+
+        added, removed, upserts = [], [], []
+        for qid, topic, flag_text in current.itertuples():
+            digest = _digest(model, date, topic, flag_text)
+            old = previous.pop(int(qid), None)
+            if old is not None and old[4] == digest:
+                continue
+            if old is not None:
+                removed.append((qid,) + old[:4])
+                stats["changed"] += 1
+            else:
+                stats["added"] += 1
+            added.append((qid, model, date, topic, flag_text))
+            upserts.append((source, model, date, int(qid), topic, flag_text, digest))
+        for qid, old in previous.items():
+            removed.append((qid,) + old[:4])
+            stats["removed"] += 1
+
+        self._apply(source, removed, -1)
+        self._apply(source, added, +1)
+        self.conn.executemany("DELETE FROM ingested WHERE source = ? AND model = ? AND date = ? AND query_id = ?",
+                              [key + (qid,) for qid in previous])
+        self.conn.executemany("INSERT OR REPLACE INTO ingested VALUES (?, ?, ?, ?, ?, ?, ?)", upserts)
+
+    def _apply(self, source, responses, sign):
+        """Add (sign=+1) or subtract (-1) responses given as (query_id, model, date, topic, flags)"""
+        deltas = {}
+        for _, model, date, topic, flag_text in responses:
+            for pair in flag_text.split(";"):
+                brand, mention = pair.rsplit("=", 1)
+                cell = deltas.setdefault((brand, topic, source, model, date), [0, 0])
+                cell[0] += sign
+                cell[1] += sign * int(mention)
+        self.conn.executemany("""
+            INSERT INTO cells VALUES (?, ?, ?, ?, ?, ?, ?)
+            ON CONFLICT (brand, topic, source, model, date)
+            DO UPDATE SET responses = responses + excluded.responses, mentions = mentions + excluded.mentions
+        """, [key + tuple(v) for key, v in deltas.items()])
+        self.conn.execute("DELETE FROM cells WHERE responses = 0")
+
+    def rates(self, by=("brand", "topic", "source"), where=None):
+        """Roll-up over the dimensions in `by`, filtered by {dimension: value or list};
+        a DataFrame with responses, mentions and mention_prob (their ratio)"""
+        by = list(by)
+        unknown = [d for d in by + list(where or {}) if d not in DIMENSIONS]
+        if unknown:
+            raise ValueError(f"unknown dimensions {unknown}, expected some of {DIMENSIONS}")
+        clauses, params = [], []
+        for dim, value in (where or {}).items():
+            values = value if isinstance(value, (list, tuple, set)) else [value]
+            clauses.append(f"{dim} IN ({', '.join('?' * len(values))})")
+            params += list(values)
+        select = ", ".join(by + ["SUM(responses) AS responses", "SUM(mentions) AS mentions"])
+        sql = f"SELECT {select} FROM cells"
+        if clauses:
+            sql += " WHERE " + " AND ".join(clauses)
+        if by:
+            sql += f" GROUP BY {', '.join(by)} ORDER BY {', '.join(by)}"
+        out = pd.read_sql_query(sql, self.conn, params=params)
+        out["mention_prob"] = out["mentions"] / out["responses"]
+        return out
+
+    def close(self):
+        self.conn.close()
+
+
+def _date_of(entry):
+    return next((entry[c] for c in DATE_COLS if entry.get(c)), "")
+
+
+def _flag_rows(responses, mentions):
+    """topic and flags (brand=mention pairs) per query_id, for responses with mentions"""
+    flags = (mentions["brand"] + "=" + mentions["mention"].astype(str)).groupby(mentions["query_id"]).agg(";".join)
+    return responses.set_index("query_id")[["topic"]].join(flags.rename("flags"), how="inner")
+
+
+def _scan(path, offset):
+    """(size, digest of the file, digest of its first `offset` bytes) in one read"""
+    h = hashlib.blake2b(digest_size=16)
+    prefix = h.hexdigest() if offset == 0 else None
+    size = 0
+    with open(path, "rb") as f:
+        while True:
+            block = f.read(min(SCAN_BLOCK, offset - size) if size < offset else SCAN_BLOCK)
+            if not block:
+                break
+            h.update(block)
+            size += len(block)
+            if size == offset:
+                prefix = h.hexdigest()
+    return size, h.hexdigest(), prefix
+
+
+def _read_tail(path, offset):
+    """The header line plus the CSV text after `offset`, or None if the bytes there do
+    not start a new row (the old last row was edited rather than followed by new ones)"""
+    with open(path, "rb") as f:
+        header = f.readline()
+        f.seek(max(offset - 1, 0))
+        before = f.read(1) if offset else b"\n"
+        tail = f.read()
+    if tail and before != b"\n" and not tail.startswith((b"\n", b"\r\n")):
+        return None
+    return (header.rstrip(b"\r\n") + b"\n" + tail.lstrip(b"\r\n")).decode("utf-8")
+
+
+def _digest(*parts):
+    return hashlib.blake2b("\x1f".join(parts).encode("utf-8"), digest_size=16).hexdigest()
+
+
+def _parse_where(items):
+    where = {}
+    for item in items or []:
+        dim, _, value = item.partition("=")
+        where.setdefault(dim, []).append(value)
+    return where
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Incrementally maintained mention-rate cube")
+    parser.add_argument("--sources", default=SOURCES_FILE, help="manifest of response/mention files per source")
+    parser.add_argument("--cube", default=CUBE_FILE)
+    parser.add_argument("--rebuild", action="store_true", help="discard the cube and re-aggregate every input")
+    parser.add_argument("--no-update", action="store_true", help="only query the cube as it is")
+    parser.add_argument("--by", default="brand,topic,source",
+                        help=f"comma-separated dimensions to roll up to ({','.join(DIMENSIONS)}); empty for the total")
+    parser.add_argument("--where", action="append", metavar="DIM=VALUE", help="filter, repeatable")
+    args = parser.parse_args(argv)
+
+    cube = MentionCube(args.cube)
+    try:
+        if args.rebuild:
+            cube.rebuild()
+        if not args.no_update:
+            start = time.perf_counter()
+            stats = cube.update(load_sources(args.sources))
+            print(f"Updated {args.cube} in {time.perf_counter() - start:.2f}s: {stats['added']} responses added, "
+                  f"{stats['changed']} changed, {stats['removed']} removed, "
+                  f"{stats['skipped_sources']} unchanged sources skipped, "
+                  f"{stats['appended_sources']} read from their new rows only")
+        start = time.perf_counter()
+        by = [d for d in args.by.split(",") if d]
+        table = cube.rates(by, _parse_where(args.where))
+        elapsed = time.perf_counter() - start
+        print(table.to_string(index=False, float_format=lambda v: f"{v:.3f}"))
+        print(f"({len(table)} rows in {elapsed * 1000:.1f} ms)")
+    finally:
+        cube.close()
+
+
+if __name__ == "__main__":
+    main()
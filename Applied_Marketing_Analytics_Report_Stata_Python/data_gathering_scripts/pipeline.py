@@ -0,0 +1,390 @@
+import argparse
+import csv
+import hashlib
+import json
+import os
+import threading
+import time
+import traceback
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from brand_matcher import BrandMatcher, DEFAULT_BRANDS, load_brands
+from checkpoint_journal import Journal, journal_path, open_journal
+from collect_responses import load_queries
+from dataset_files import (BRAND_FEATURES_FILE, OUT_FILE, OUT_PARQUET_FILE, OUT_TEXTS_FILE, SOURCES_FILE,
+                           TOPIC_HITS_FILE)
+from extract_mentions import WORKERS
+
+# ===========================
+# CONFIG
+# ===========================
+QUERIES_FILE = "data/queries.csv"
+STATE_FILE = "data/.pipeline_state.json"   # fingerprints of the last successful run of each stage
+ANALYSIS_FILE = "data/analysis_results.txt"
+JOBS = 4                                   # stages running at the same time
+# Provider that collects each source of the manifest; sources without one are taken
+# as they are on disk. An optional "model" column in the manifest picks the model.
+SOURCE_PROVIDERS = {
+    "chatgpt": "openai",
+    "gemini": "gemini",
+}
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+HASH_BLOCK = 1 << 20
+
+
+def provider_class(name):
+    """Provider class by name; importing it is cheap, the SDK loads when it is instantiated"""
+    if name == "fake":
+        from fake_client import FakeProvider
+        return FakeProvider
+    from providers import PROVIDERS
+    return PROVIDERS[name]
+
+
+def read_manifest(path=SOURCES_FILE):
+    """Sources manifest rows; unlike dataset_constructor.load_sources the files may not exist yet"""
+    with open(path, newline="", encoding="utf-8") as f:
+        return list(csv.DictReader(f))
+
+
+def pending_queries(queries_file, output_file):
+    """Queries without an answer in output_file or its journal (what a collection would send)"""
+    done = set(Journal(journal_path(output_file)).replay())
+    if not done and os.path.exists(output_file):
+        with open(output_file, newline="", encoding="utf-8") as f:
+            done = {row["query_id"] for row in csv.DictReader(f)}
+    return [q for q in load_queries(queries_file) if q["query_id"] not in done]
+
+
+class FileDigests:
+    """SHA-256 of files, re-hashed only when their size or mtime changes"""
+
+    def __init__(self, known=None):
+        self.known = dict(known or {})
+        self.lock = threading.Lock()
+
+    def digest(self, path):
+        try:
+            st = os.stat(path)
+        except FileNotFoundError:
+            return None
+        with self.lock:
+            entry = self.known.get(path)
+        if entry and entry[0] == st.st_size and entry[1] == st.st_mtime_ns:
+            return entry[2]
+        h = hashlib.sha256()
+        with open(path, "rb") as f:
+            for block in iter(lambda: f.read(HASH_BLOCK), b""):
+                h.update(block)
+        with self.lock:
+            self.known[path] = [st.st_size, st.st_mtime_ns, h.hexdigest()]
+        return h.hexdigest()
+
+
+class Stage:
+    """One step of the pipeline, from input files to output files.
+
+    Its fingerprint hashes the contents of the inputs, the `params` that change what it
+    writes (provider, model, brand list, format) and the source of the `code` modules.
+    `needs_network`, if given, tells whether running the stage now would call an API.
+    """
+
+    def __init__(self, name, run, inputs, outputs, params=None, code=(), needs_network=None):
+        self.name = name
+        self.run = run
+        self.inputs = list(inputs)
+        self.outputs = list(outputs)
+        self.params = params or {}
+        self.code = [os.path.join(SCRIPT_DIR, module) for module in code]
+        self.needs_network = needs_network
+
+    def fingerprint(self, digests):
+        payload = json.dumps({
+            "inputs": {path: digests.digest(path) for path in self.inputs},
+            "params": self.params,
+            "code": {os.path.basename(path): digests.digest(path) for path in self.code},
+        }, sort_keys=True)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class PipelineState:
+    """Fingerprint and output digests of every stage's last successful run, plus the digest cache"""
+
+    def __init__(self, path=STATE_FILE):
+        self.path = path
+        data = {}
+        if os.path.exists(path):
+            with open(path, encoding="utf-8") as f:
+                data = json.load(f)
+        self.stages = data.get("stages", {})
+        self.digests = FileDigests(data.get("files"))
+        self.lock = threading.Lock()
+
+    def is_current(self, stage, fingerprint):
+        """Same fingerprint as the last run and every output still as that run left it"""
+        record = self.stages.get(stage.name)
+        if record is None or record["fingerprint"] != fingerprint or set(record["outputs"]) != set(stage.outputs):
+            return False
+        return all(self.digests.digest(path) == digest for path, digest in record["outputs"].items())
+
+    def record(self, stage, fingerprint):
+        outputs = {path: self.digests.digest(path) for path in stage.outputs}
+        with self.lock:
+            self.stages[stage.name] = {"fingerprint": fingerprint, "outputs": outputs, "finished_at": time.time()}
+            self.save()
+
+    def save(self):
+        with self.digests.lock:
+            files = dict(self.digests.known)
+        tmp = self.path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump({"stages": self.stages, "files": files}, f, indent=1)
+        os.replace(tmp, self.path)
+
+
+# ---- stages ----
+
+def _collect(provider_name, model, queries_file, output_file):
+    pending = pending_queries(queries_file, output_file)
+    if not pending:
+        # Everything is answered: refresh the CSV from the journal without touching the API
+        if os.path.exists(journal_path(output_file)):
+            journal, _ = open_journal(output_file)
+            journal.close()
+            journal.compact(output_file, [q["query_id"] for q in load_queries(queries_file)])
+        return
+    from call_metrics import CallMetrics, format_summary, metrics_path
+    from collect_responses import run_collection
+
+    provider = provider_class(provider_name)(model=model)
+    metrics = CallMetrics(metrics_path(output_file), provider.name, provider.model)
+    try:
+        run_collection(provider, queries_file, output_file, metrics=metrics)
+    finally:
+        for line in format_summary(metrics.close()):
+            print(line)
+
+
+def _extract(responses_file, mentions_file, brands, workers):
+    from extract_mentions import extract_mentions
+
+    stats = extract_mentions(responses_file, mentions_file, brands, workers)
+    print(f"{mentions_file}: {stats['computed']} responses scanned, {stats['reused']} unchanged reused")
+
+
+def _construct(sources_file, out_format, engine):
+    import dataset_constructor
+
+    dataset_constructor.main(out_format, engine, sources_file)
+
+
+def _analysis(dataset_file, output_file):
+    import analysis
+    from clogit import format_margins
+
+    result, margins = analysis.fit_model(analysis.load_model_data(dataset_file))
+    text = f"{result.summary(odds_ratios=True)}\n\n{format_margins(margins)}\n"
+    with open(output_file, "w", encoding="utf-8") as f:
+        f.write(text)
+    print(text)
+
+
+def build_stages(sources_file=SOURCES_FILE, queries_file=QUERIES_FILE, brands=None, out_format="csv",
+                 engine="pandas", workers=WORKERS, providers=None):
+    """The pipeline as a list of stages; dependencies follow from their input and output files.
+
+    collect_<source> (one per provider source, independent of each other) ->
+    extract_<source> -> construct -> analysis. Stata's analysis.do takes the same
+    dataset as the analysis stage, its Python counterpart.
+    """
+    brands = brands or DEFAULT_BRANDS
+    providers = {**SOURCE_PROVIDERS, **(providers or {})}
+    sources = read_manifest(sources_file)
+    stages = []
+    for s in sources:
+        source, responses, mentions = s["source"], s["responses_file"], s["mentions_file"]
+        if source in providers:
+            name = providers[source]
+            model = s.get("model") or provider_class(name).default_model
+            stages.append(Stage(
+                f"collect_{source}",
+                lambda name=name, model=model, responses=responses: _collect(name, model, queries_file, responses),
+                [queries_file], [responses],
+                params={"provider": name, "model": model},
+                code=["collect_responses.py", "query_runner.py", "providers.py", "checkpoint_journal.py",
+                      "response_cache.py", "call_metrics.py"] + (["fake_client.py"] if name == "fake" else []),
+                needs_network=lambda responses=responses: bool(pending_queries(queries_file, responses)),
+            ))
+        stages.append(Stage(
+            f"extract_{source}",
+            lambda responses=responses, mentions=mentions: _extract(responses, mentions, brands, workers),
+            [responses], [mentions],
+            params={"brand_version": BrandMatcher(brands).version},
+            code=["extract_mentions.py", "brand_matcher.py"],
+        ))
+
+    outputs = [OUT_FILE] if out_format == "csv" else [OUT_PARQUET_FILE, OUT_TEXTS_FILE]
+    inputs = [sources_file, BRAND_FEATURES_FILE, TOPIC_HITS_FILE]
+    inputs += [s[col] for s in sources for col in ("responses_file", "mentions_file")]
+    # The engine changes how the dataset is built, not what it contains
+    stages.append(Stage("construct", lambda: _construct(sources_file, out_format, engine), inputs, outputs,
+                        params={"format": out_format}, code=["dataset_constructor.py", "dataset_files.py", "schema.py"]))
+    stages.append(Stage("analysis", lambda: _analysis(outputs[0], ANALYSIS_FILE), [outputs[0]], [ANALYSIS_FILE],
+                        code=["analysis.py", "clogit.py", "features.py", "schema.py"]))
+    return stages
+
+
+# ---- scheduling ----
+
+def dependencies(stages):
+    """{stage name: names of the stages writing one of its inputs}"""
+    producer = {path: stage.name for stage in stages for path in stage.outputs}
+    return {stage.name: {producer[p] for p in stage.inputs if p in producer and producer[p] != stage.name}
+            for stage in stages}
+
+
+def select(stages, targets):
+    """The target stages and everything upstream of them. A target matches a stage name or
+    its prefix, so "collect" selects every collection."""
+    if not targets:
+        return stages
+    deps = dependencies(stages)
+    wanted = set()
+    todo = []
+    for target in targets:
+        matched = [s.name for s in stages if s.name == target or s.name.startswith(target + "_")]
+        if not matched:
+            raise SystemExit(f"Unknown stage {target!r}; stages: {', '.join(s.name for s in stages)}")
+        todo += matched
+    while todo:
+        name = todo.pop()
+        if name not in wanted:
+            wanted.add(name)
+            todo += deps[name]
+    return [s for s in stages if s.name in wanted]
+
+
+def plan(stages, state, force=False, offline=False):
+    """Dry run: what each stage would do, in dependency order"""
+    deps = dependencies(stages)
+    will_run = set()
+    lines = []
+    for stage in stages:
+        upstream = sorted(deps[stage.name] & will_run)
+        if force:
+            action = "run (forced)"
+        elif upstream:
+            action = f"run if {', '.join(upstream)} change its inputs"
+        elif not state.is_current(stage, stage.fingerprint(state.digests)):
+            action = "run (out of date)"
+        else:
+            action = "up to date"
+        if action != "up to date" and stage.needs_network is not None and not upstream:
+            if stage.needs_network():
+                action += ", calls the API" + (" -> skipped, --no-network" if offline else "")
+            else:
+                action += ", no API calls needed"
+        if action.startswith("run") and "skipped" not in action:
+            will_run.add(stage.name)
+        lines.append(f"  {stage.name:<20} {action}")
+    return lines
+
+
+def run_pipeline(stages, state, jobs=JOBS, force=False, offline=False):
+    """Run stages in dependency order, independent ones in parallel, skipping those that are
+    up to date. Returns {stage name: (status, seconds)}; downstream of a failure is skipped."""
+    deps = dependencies(stages)
+    by_name = {stage.name: stage for stage in stages}
+    results = {}
+
+    def execute(stage):
+        start = time.perf_counter()
+        # Fingerprinted before running, so inputs that change meanwhile trigger another run
+        fingerprint = stage.fingerprint(state.digests)
+        if not force and state.is_current(stage, fingerprint):
+            return "up to date", time.perf_counter() - start
+        if offline and stage.needs_network is not None and stage.needs_network():
+            # Later stages use the responses collected so far
+            return "needs the API, skipped", time.perf_counter() - start
+        print(f"\n=== {stage.name} ===")
+        stage.run()
+        state.record(stage, fingerprint)
+        return "ran", time.perf_counter() - start
+
+    remaining = {stage.name: deps[stage.name] for stage in stages}
+    running = {}
+    with ThreadPoolExecutor(max_workers=max(1, jobs)) as pool:
+        while remaining or running:
+            ready = [name for name, upstream in remaining.items() if upstream <= set(results)]
+            for name in ready:
+                del remaining[name]
+                failed = sorted(d for d in deps[name] if results[d][0] in ("failed", "skipped"))
+                if failed:
+                    results[name] = ("skipped", 0.0)
+                    print(f"✗ Skipping {name}: {', '.join(failed)} did not finish")
+                else:
+                    running[pool.submit(execute, by_name[name])] = name
+            if not running:
+                continue
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                name = running.pop(future)
+                try:
+                    results[name] = future.result()
+                except Exception as e:
+                    traceback.print_exc()
+                    print(f"✗ {name} failed: {e}")
+                    results[name] = ("failed", 0.0)
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Run the data pipeline (collect -> extract -> construct -> analysis), "
+                    "skipping stages whose inputs, settings and code are unchanged")
+    parser.add_argument("targets", nargs="*", help="stages to bring up to date with their upstream "
+                                                   "(e.g. construct, extract_gemini, collect); default: all")
+    parser.add_argument("--sources", default=SOURCES_FILE, help="CSV manifest of sources")
+    parser.add_argument("--queries", default=QUERIES_FILE)
+    parser.add_argument("--brands", help="brand,alias CSV (default: the brand_matcher.py list)")
+    parser.add_argument("--format", choices=["csv", "parquet"], default="csv")
+    parser.add_argument("--engine", choices=["pandas", "duckdb"], default="pandas")
+    parser.add_argument("--workers", type=int, default=WORKERS, help="processes per mention extraction")
+    parser.add_argument("--provider", action="append", default=[], metavar="SOURCE=PROVIDER",
+                        help="collect a source with another provider (openai, gemini, fake)")
+    parser.add_argument("--jobs", type=int, default=JOBS, help="stages running at the same time")
+    parser.add_argument("--state", default=STATE_FILE)
+    parser.add_argument("--force", action="store_true", help="rerun the selected stages even if up to date")
+    parser.add_argument("--no-network", action="store_true",
+                        help="never call an API; collections with unanswered queries are skipped")
+    parser.add_argument("--dry-run", action="store_true", help="only show what would run")
+    args = parser.parse_args(argv)
+
+    providers = {}
+    for item in args.provider:
+        source, sep, name = item.partition("=")
+        if not sep:
+            parser.error(f"--provider expects SOURCE=PROVIDER, got {item!r}")
+        providers[source] = name
+
+    brands = load_brands(args.brands) if args.brands else None
+    stages = select(build_stages(args.sources, args.queries, brands, args.format, args.engine, args.workers,
+                                 providers), args.targets)
+    state = PipelineState(args.state)
+    if args.dry_run:
+        print("\n".join(plan(stages, state, args.force, args.no_network)))
+        return
+
+    start = time.perf_counter()
+    results = run_pipeline(stages, state, args.jobs, args.force, args.no_network)
+    state.save()
+    print(f"\nPipeline finished in {time.perf_counter() - start:.1f}s")
+    for stage in stages:
+        status, seconds = results[stage.name]
+        print(f"  {stage.name:<20} {status:<24} {seconds:6.1f}s")
+    if any(status in ("failed", "skipped") for status, _ in results.values()):
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,317 @@
+import json
+import os
+
+
+class Provider:
+    """Common interface for the LLM APIs the query runners talk to.
+
+    Online mode uses `preflight()` + `complete()` (or `stream()`); batch mode uses
+    `batch_request()`, `submit_batch()`, `batch_status()` and `batch_results()`. SDKs are
+    imported when a provider is created, so only the one actually used needs to be installed.
+    """
+
+    name = None
+    api_key_env = None
+    default_model = None
+    default_output = "responses.csv"
+
+    # Concurrency and quota (match these to your account's rate limits)
+    max_in_flight = 8
+    requests_per_minute = 60
+    tokens_per_minute = 100000
+
+    def __init__(self, model=None, api_key=None, params=None):
+        self.model = model or self.default_model
+        self.api_key = api_key or os.getenv(self.api_key_env, "<fallback_api_key>")
+        # Extra generation parameters passed to every call (also part of the cache key)
+        self.params = params or {}
+
+    # ---- online mode ----
+
+    def preflight(self):
+        """Cheap call that fails fast on a bad key"""
+        raise NotImplementedError
+
+    async def complete(self, prompt):
+        """Return (response_text, total_tokens or None), optionally followed by a dict with
+        "prompt_tokens" and "completion_tokens" for the call metrics"""
+        raise NotImplementedError
+
+    async def stream(self, prompt):
+        """Yield (text_delta, total_tokens or None) as the answer is generated; usage
+        usually only comes with the last item. Without a streaming API the whole
+        answer arrives as one piece."""
+        text, total_tokens, *_ = await self.complete(prompt)
+        yield text, total_tokens
+
+    def is_rate_limit(self, e):
+        error_msg = str(e)
+        error_code = getattr(e, 'status_code', None) or getattr(e, 'code', None)
+        return (
+            "429" in error_msg or
+            "rate limit" in error_msg.lower() or
+            "quota" in error_msg.lower() or
+            error_code == 429
+        )
+
+    def is_auth_error(self, e):
+        return False
+
+    def auth_help(self):
+        """Lines printed when a run stops on an API key error"""
+        return []
+
+    # ---- batch mode ----
+
+    def batch_request(self, custom_id, prompt):
+        """One line of the provider's batch JSONL input"""
+        raise NotImplementedError
+
+    def submit_batch(self, jsonl_path):
+        """Upload the JSONL file, start a batch job and return its id"""
+        raise NotImplementedError
+
+    def batch_status(self, job_id):
+        """Return ("running" | "succeeded" | "failed", provider-specific state)"""
+        raise NotImplementedError
+
+    def batch_results(self, job_id):
+        """Yield (custom_id, response_text, error_message, total_tokens) per request"""
+        raise NotImplementedError
+
+
+class OpenAIProvider(Provider):
+    name = "openai"
+    api_key_env = "OPENAI_API_KEY"
+    default_model = "gpt-5-mini"
+    default_output = "responses.csv"
+
+    def __init__(self, model=None, api_key=None, params=None):
+        super().__init__(model, api_key, params)
+        from openai import OpenAI, AsyncOpenAI
+
+        if not self.api_key:
+            raise ValueError("OPENAI_API_KEY environment variable not set. Please set it or pass api_key.")
+        self.client = OpenAI(api_key=self.api_key)
+        self.async_client = AsyncOpenAI(api_key=self.api_key)
+
+    def preflight(self):
+        print("Testing API key...")
+        try:
+            self.client.chat.completions.create(
+                model=self.model,
+                messages=[{"role": "user", "content": "test"}],
+                max_completion_tokens=5
+            )
+            print(f"✓ API key is valid. Using model: {self.model}")
+        except Exception as e:
+            print(f"✗ Error with API key: {e}")
+            print("\nPossible issues:")
+            print("1. API key expired or invalid - regenerate it at https://platform.openai.com/api-keys")
+            print("2. Insufficient credits - check your OpenAI account balance")
+            print("3. API key doesn't have correct permissions")
+            raise
+
+    async def complete(self, prompt):
+        response = await self.async_client.chat.completions.create(
+            model=self.model,
+            messages=[{"role": "user", "content": prompt}],
+            **self.params,
+        )
+        usage = getattr(response, "usage", None)
+        return response.choices[0].message.content or "", getattr(usage, "total_tokens", None), {
+            "prompt_tokens": getattr(usage, "prompt_tokens", None),
+            "completion_tokens": getattr(usage, "completion_tokens", None),
+        }
+
+    async def stream(self, prompt):
+        response = await self.async_client.chat.completions.create(
+            model=self.model,
+            messages=[{"role": "user", "content": prompt}],
+            stream=True,
+            stream_options={"include_usage": True},
+            **self.params,
+        )
+        async for chunk in response:
+            # The usage chunk at the end has no choices
+            delta = chunk.choices[0].delta.content if chunk.choices else None
+            yield delta or "", getattr(getattr(chunk, "usage", None), "total_tokens", None)
+
+    def is_rate_limit(self, e):
+        return super().is_rate_limit(e) or "rate_limit" in type(e).__name__.lower()
+
+    def is_auth_error(self, e):
+        error_msg = str(e)
+        error_type = type(e).__name__
+        error_code = getattr(e, 'status_code', None) or getattr(e, 'code', None)
+        return (
+            "authentication" in error_msg.lower() or
+            "invalid_api_key" in error_type.lower() or
+            "401" in error_msg or
+            error_code == 401
+        )
+
+    def auth_help(self):
+        return [
+            "1. Rate limiting (most likely if it worked before) - wait a few minutes and rerun (it will resume)",
+            "2. API key invalid or expired - regenerate it at https://platform.openai.com/api-keys",
+            "3. Make sure you have sufficient credits",
+            "4. Set the OPENAI_API_KEY env variable",
+        ]
+
+    def batch_request(self, custom_id, prompt):
+        return {
+            "custom_id": custom_id,
+            "method": "POST",
+            "url": "/v1/chat/completions",
+            "body": {"model": self.model, "messages": [{"role": "user", "content": prompt}], **self.params},
+        }
+
+    def submit_batch(self, jsonl_path):
+        with open(jsonl_path, "rb") as f:
+            input_file = self.client.files.create(file=f, purpose="batch")
+        job = self.client.batches.create(
+            input_file_id=input_file.id,
+            endpoint="/v1/chat/completions",
+            completion_window="24h",
+        )
+        return job.id
+
+    def batch_status(self, job_id):
+        job = self.client.batches.retrieve(job_id)
+        if job.status == "completed":
+            return "succeeded", job.status
+        if job.status in ("failed", "expired", "cancelled"):
+            return "failed", job.status
+        return "running", job.status
+
+    def batch_results(self, job_id):
+        job = self.client.batches.retrieve(job_id)
+        # Successful requests land in the output file, failed ones in the error file
+        for file_id in (job.output_file_id, job.error_file_id):
+            if not file_id:
+                continue
+            for line in self.client.files.content(file_id).text.splitlines():
+                if not line.strip():
+                    continue
+                record = json.loads(line)
+                response = record.get("response") or {}
+                if record.get("error") or response.get("status_code") != 200:
+                    error = record.get("error") or response.get("body", {}).get("error")
+                    yield record["custom_id"], None, json.dumps(error), None
+                    continue
+                body = response["body"]
+                text = body["choices"][0]["message"].get("content") or ""
+                yield record["custom_id"], text, None, (body.get("usage") or {}).get("total_tokens")
+
+
+class GeminiProvider(Provider):
+    name = "gemini"
+    api_key_env = "GOOGLE_API_KEY"
+    default_model = "gemini-2.5-flash"
+    default_output = "responses_gemini.csv"
+
+    def __init__(self, model=None, api_key=None, params=None):
+        super().__init__(model, api_key, params)
+        from google import genai
+
+        self.client = genai.Client(api_key=self.api_key)
+
+    def preflight(self):
+        print("Testing API key...")
+        try:
+            # One model lookup instead of listing every model
+            self.client.models.get(model=self.model)
+            print(f"✓ API key is valid. Using model: {self.model}")
+        except Exception as e:
+            print(f"✗ Error with API key: {e}")
+            print("\nPossible issues:")
+            print("1. API key expired - regenerate it in Google Cloud Console")
+            print("2. Generative AI API not enabled - enable it in Google Cloud Console")
+            print("3. API key doesn't have correct permissions")
+            raise
+
+    async def complete(self, prompt):
+        response = await self.client.aio.models.generate_content(
+            model=self.model,
+            contents=prompt,
+            config=self.params or None,
+        )
+        usage = getattr(response, "usage_metadata", None)
+        return response.text or "", getattr(usage, "total_token_count", None), {
+            "prompt_tokens": getattr(usage, "prompt_token_count", None),
+            "completion_tokens": getattr(usage, "candidates_token_count", None),
+        }
+
+    async def stream(self, prompt):
+        response = await self.client.aio.models.generate_content_stream(
+            model=self.model,
+            contents=prompt,
+            config=self.params or None,
+        )
+        async for chunk in response:
+            usage = getattr(chunk, "usage_metadata", None)
+            yield chunk.text or "", getattr(usage, "total_token_count", None)
+
+    def is_rate_limit(self, e):
+        return super().is_rate_limit(e) or "RESOURCE_EXHAUSTED" in str(e)
+
+    def is_auth_error(self, e):
+        error_msg = str(e)
+        return "API key expired" in error_msg or "API_KEY_INVALID" in error_msg
+
+    def auth_help(self):
+        return [
+            "1. Rate limiting (most likely if it worked before) - wait a few minutes and rerun (it will resume)",
+            "2. API key expired - check it at https://console.cloud.google.com/apis/credentials",
+            "3. Make sure 'Generative Language API' is enabled",
+            "4. Set the GOOGLE_API_KEY env variable",
+        ]
+
+    def batch_request(self, custom_id, prompt):
+        request = {"contents": [{"role": "user", "parts": [{"text": prompt}]}]}
+        if self.params:
+            request["generation_config"] = self.params
+        return {"key": custom_id, "request": request}
+
+    def submit_batch(self, jsonl_path):
+        uploaded = self.client.files.upload(
+            file=jsonl_path,
+            config={"display_name": os.path.basename(jsonl_path), "mime_type": "jsonl"},
+        )
+        job = self.client.batches.create(
+            model=self.model,
+            src=uploaded.name,
+            config={"display_name": os.path.basename(jsonl_path)},
+        )
+        return job.name
+
+    def batch_status(self, job_id):
+        state = self.client.batches.get(name=job_id).state.name
+        if state == "JOB_STATE_SUCCEEDED":
+            return "succeeded", state
+        if state in ("JOB_STATE_FAILED", "JOB_STATE_CANCELLED", "JOB_STATE_EXPIRED"):
+            return "failed", state
+        return "running", state
+
+    def batch_results(self, job_id):
+        job = self.client.batches.get(name=job_id)
+        content = self.client.files.download(file=job.dest.file_name).decode("utf-8")
+        for line in content.splitlines():
+            if not line.strip():
+                continue
+            record = json.loads(line)
+            if record.get("error") or "response" not in record:
+                yield record["key"], None, json.dumps(record.get("error")), None
+                continue
+            response = record["response"]
+            candidates = response.get("candidates") or [{}]
+            parts = (candidates[0].get("content") or {}).get("parts") or []
+            text = "".join(part.get("text", "") for part in parts)
+            yield record["key"], text, None, (response.get("usageMetadata") or {}).get("totalTokenCount")
+
+
+PROVIDERS = {
+    "openai": OpenAIProvider,
+    "gemini": GeminiProvider,
+}
@@ -0,0 +1,302 @@
+import asyncio
+import time
+from collections import deque
+
+from call_metrics import new_call
+
+# ===========================
+# CONFIG
+# ===========================
+MAX_IN_FLIGHT = 8               # requests running at the same time (per provider)
+REQUESTS_PER_MINUTE = 60
+TOKENS_PER_MINUTE = 100000
+EST_COMPLETION_TOKENS = 800     # budget reserved per answer until the real usage is known
+MAX_RETRIES = 3
+MIN_RATE_SCALE = 0.1            # adaptive backoff never goes below 10% of the configured rate
+# Token counts a call_model may report in its extra dict; they go to the metrics, not the row
+USAGE_FIELDS = ("prompt_tokens", "completion_tokens")
+
+
+def estimate_tokens(text):
+    """Rough token estimate (~4 characters per token)"""
+    return max(1, len(text) // 4)
+
+
+class TokenBucket:
+    """Token bucket refilled continuously at `rate_per_minute` tokens"""
+
+    def __init__(self, rate_per_minute, capacity=None):
+        self.base_rate = rate_per_minute / 60.0
+        self.rate = self.base_rate
+        self.capacity = capacity or rate_per_minute
+        self.tokens = float(self.capacity)
+        self.updated = time.monotonic()
+        self.lock = asyncio.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def set_scale(self, scale):
+        """Run the bucket at a fraction of its configured rate"""
+        self._refill()
+        self.rate = self.base_rate * scale
+
+    def charge(self, amount):
+        """Debit tokens after the fact (e.g. real usage above the estimate); may go negative"""
+        self._refill()
+        self.tokens -= amount
+
+    async def acquire(self, amount=1):
+        amount = min(amount, self.capacity)
+        # Holding the lock while waiting keeps callers first-come, first-served
+        async with self.lock:
+            while True:
+                self._refill()
+                if self.tokens >= amount:
+                    self.tokens -= amount
+                    return
+                await asyncio.sleep((amount - self.tokens) / self.rate)
+
+
+class AdaptiveLimiter:
+    """Requests/min + tokens/min buckets that slow down on 429s and recover on success"""
+
+    def __init__(self, requests_per_minute, tokens_per_minute):
+        self.requests = TokenBucket(requests_per_minute)
+        self.tokens = TokenBucket(tokens_per_minute)
+        self.scale = 1.0
+        self.cooldown_until = 0.0
+
+    async def acquire(self, est_tokens):
+        # A rate limit pauses every worker, not only the one that got the 429
+        delay = self.cooldown_until - time.monotonic()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        await self.requests.acquire(1)
+        await self.tokens.acquire(est_tokens)
+
+    def _apply_scale(self):
+        self.requests.set_scale(self.scale)
+        self.tokens.set_scale(self.scale)
+
+    def on_success(self, est_tokens, used_tokens=None):
+        if used_tokens and used_tokens > est_tokens:
+            self.tokens.charge(used_tokens - est_tokens)
+        if self.scale < 1.0:
+            self.scale = min(1.0, self.scale + 0.05)
+            self._apply_scale()
+
+    def on_rate_limit(self, wait_time):
+        # Multiplicative decrease: halve the rate and hold everyone back for wait_time.
+        # 429s from calls already in flight during a cooldown don't halve it again.
+        if time.monotonic() >= self.cooldown_until:
+            self.scale = max(MIN_RATE_SCALE, self.scale / 2)
+            self._apply_scale()
+        self.cooldown_until = max(self.cooldown_until, time.monotonic() + wait_time)
+
+
+class QueryRunner:
+    """Run queries concurrently against one provider with rate limiting and retries.
+
+    `call_model(prompt)` is a coroutine returning `(text, total_tokens)`; `total_tokens`
+    may be None when the provider does not report usage. A third item, if returned, is a
+    dict of extra fields for the result row (e.g. streaming metrics). `on_result(row)` is
+    called for every finished row (successful or ERROR) as soon as it is available.
+
+    With a `cache` (see response_cache.py), answers already seen for the same
+    provider/model/prompt/params are reused without touching the rate limiter or network.
+    Queries may carry a "sample" index for repeated sampling of the same prompt: it is
+    part of the cache key and of the result row, so each sample is a distinct answer.
+
+    `refill()`, if given, is asked for more queries whenever the queue runs dry and
+    returns a (possibly empty) list. Idle workers wait for calls still in flight, whose
+    results may make the next refill non-empty, and stop once nothing is left.
+
+    With `metrics` (a call_metrics.CallMetrics), every query also produces a structured
+    record: time waiting on the rate limiter, in the network and backing off, token
+    usage, and retries per error class.
+    """
+
+    def __init__(self, call_model, is_rate_limit, is_auth_error, on_result=None,
+                 max_in_flight=MAX_IN_FLIGHT, requests_per_minute=REQUESTS_PER_MINUTE,
+                 tokens_per_minute=TOKENS_PER_MINUTE, max_retries=MAX_RETRIES,
+                 previously_completed=0, cache=None, provider=None, model=None, params=None,
+                 refill=None, metrics=None):
+        self.call_model = call_model
+        self.is_rate_limit = is_rate_limit
+        self.is_auth_error = is_auth_error
+        self.on_result = on_result
+        self.max_in_flight = max_in_flight
+        self.max_retries = max_retries
+        self.limiter = AdaptiveLimiter(requests_per_minute, tokens_per_minute)
+        self.completed = previously_completed  # resumed rows count as earlier successes
+        self.rows = []
+        self.cache = cache
+        self.provider = provider
+        self.model = model
+        self.params = params or {}
+        self.refill = refill
+        self.metrics = metrics
+        self.in_flight = 0
+        self._progress = None
+
+    def _row(self, q, response_text, extra=None):
+        row = {
+            "query_id": q["query_id"],
+            "query_text": q["query_text"],
+            "topic": q["topic"],
+            "response_text": response_text
+        }
+        if "sample" in q:
+            row["sample"] = q["sample"]
+        if extra:
+            row.update(extra)
+        return row
+
+    def _finish(self, row, call):
+        self.rows.append(row)
+        if self.on_result:
+            start = time.perf_counter()
+            self.on_result(row)
+            call["write_s"] += time.perf_counter() - start
+
+    async def _run_one(self, q):
+        call = new_call(q["query_id"], q.get("sample"), self.provider, self.model)
+        start = time.perf_counter()
+        try:
+            await self._attempt_all(q, call)
+        finally:
+            call["total_s"] = time.perf_counter() - start
+            call["status"] = call["status"] or "aborted"  # fatal error or cancelled
+            if self.metrics is not None:
+                self.metrics.record(call)
+
+    async def _attempt_all(self, q, call):
+        prompt = q["query_text"]
+        qid = q["query_id"]
+        est_tokens = estimate_tokens(prompt) + EST_COMPLETION_TOKENS
+        params = {**self.params, "sample": q["sample"]} if "sample" in q else self.params
+        if "sample" in q:
+            qid = f"{qid} (sample {q['sample']})"
+
+        if self.cache is not None:
+            cached = self.cache.get(self.provider, self.model, prompt, params)
+            if cached is not None:
+                print(f"Cached answer for query {qid}")
+                call.update(status="ok", cached=True)
+                self._finish(self._row(q, (cached[0] or "").replace("\n", " ").strip()), call)
+                return
+
+        print(f"Running query {qid}: {prompt[:60]}...")
+
+        retry_count = 0
+        cooling_down = False   # limiter waits after a 429 count as backoff, not queueing
+        while True:
+            t = time.perf_counter()
+            await self.limiter.acquire(est_tokens)
+            call["backoff_s" if cooling_down else "limiter_wait_s"] += time.perf_counter() - t
+            call["attempts"] += 1
+            t = time.perf_counter()
+            try:
+                text, used_tokens, *extra = await self.call_model(prompt)
+            except Exception as e:
+                call["network_s"] += time.perf_counter() - t
+                retry_count += 1
+                error_msg = str(e)
+                is_rate_limit = self.is_rate_limit(e)
+                is_auth_error = self.is_auth_error(e)
+                error_class = "auth" if is_auth_error else "rate_limit" if is_rate_limit else "other"
+                call["error_class"] = error_class
+
+                if is_auth_error and self.completed == 0:
+                    # Failed before anything succeeded - likely a real API key issue
+                    print(f"\n✗ ERROR: API key issue detected on query {qid}!")
+                    print(f"   Error: {error_msg}")
+                    raise
+
+                if is_auth_error or is_rate_limit:
+                    # After earlier successes an auth error is most likely rate limiting in disguise
+                    if retry_count >= self.max_retries:
+                        print(f"\n✗ Rate limited after {self.max_retries} retries on query {qid}. Stopping.")
+                        raise
+                    per_retry = 15 if is_auth_error else 10
+                    wait_time = min(60, per_retry * retry_count)
+                    print(f"   ⚠ Rate limit hit on query {qid}! Slowing down and waiting {wait_time}s "
+                          f"before retry {retry_count}/{self.max_retries}...")
+                    self.limiter.on_rate_limit(wait_time)
+                    call["retries"][error_class] += 1
+                    cooling_down = True
+                    continue
+
+                if retry_count < self.max_retries:
+                    wait_time = 2 ** retry_count  # Exponential backoff: 2s, 4s, 8s
+                    print(f"   Retry {retry_count}/{self.max_retries} for query {qid} after {wait_time}s...")
+                    call["retries"][error_class] += 1
+                    t = time.perf_counter()
+                    await asyncio.sleep(wait_time)
+                    call["backoff_s"] += time.perf_counter() - t
+                    cooling_down = False
+                    continue
+
+                print(f"\n✗ Query {qid} failed after {self.max_retries} retries: {error_msg}")
+                # Save error response instead of crashing
+                call["status"] = "error"
+                self._finish(self._row(q, f"ERROR: {error_msg}"), call)
+                return
+
+            call["latency_s"] = time.perf_counter() - t
+            call["network_s"] += call["latency_s"]
+            call.pop("error_class", None)
+            extra = dict(extra[0]) if extra else {}
+            for key in USAGE_FIELDS:
+                call[key] = extra.pop(key, None)
+            call["total_tokens"] = used_tokens
+            call["status"] = "ok"
+
+            self.limiter.on_success(est_tokens, used_tokens)
+            self.completed += 1
+            if self.cache is not None:
+                self.cache.put(self.provider, self.model, prompt, text or "", used_tokens, params)
+            self._finish(self._row(q, (text or "").replace("\n", " ").strip(), extra), call)
+            return
+
+    async def _worker(self, pending):
+        while True:
+            if not pending and self.refill is not None:
+                pending.extend(self.refill())
+            if pending:
+                self.in_flight += 1
+                try:
+                    await self._run_one(pending.popleft())
+                finally:
+                    self.in_flight -= 1
+                    self._progress.set()
+                continue
+            if self.refill is None or self.in_flight == 0:
+                return
+            # Results still in flight may make more queries worth running
+            self._progress.clear()
+            await self._progress.wait()
+
+    async def run(self, queries):
+        """Process all queries; the first fatal error cancels the remaining work and is re-raised"""
+        pending = deque(queries)
+        self._progress = asyncio.Event()
+        # With a refill source the queue can grow later, so every worker slot is started
+        n_workers = self.max_in_flight if self.refill is not None else min(self.max_in_flight, len(pending))
+        workers = [asyncio.create_task(self._worker(pending)) for _ in range(n_workers)]
+        try:
+            await asyncio.gather(*workers)
+        finally:
+            for w in workers:
+                w.cancel()
+            await asyncio.gather(*workers, return_exceptions=True)
+        return self.rows
+
+
+def run_queries(queries, call_model, is_rate_limit, is_auth_error, **kwargs):
+    """Synchronous entry point for the query scripts"""
+    runner = QueryRunner(call_model, is_rate_limit, is_auth_error, **kwargs)
+    return asyncio.run(runner.run(queries))
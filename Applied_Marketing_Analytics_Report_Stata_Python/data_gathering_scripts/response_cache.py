@@ -0,0 +1,113 @@
+import hashlib
+import json
+import os
+import sqlite3
+import time
+
+# ===========================
+# CONFIG
+# ===========================
+CACHE_FILE = "cache/responses.sqlite"   # shared by every provider and run
+MAX_CACHE_MB = 500
+MAX_AGE_DAYS = 90
+EVICT_EVERY = 200                       # puts between eviction passes
+
+
+def cache_key(provider, model, prompt, params=None):
+    """Content address of one request: provider, model, prompt text and generation parameters"""
+    payload = json.dumps([provider, model, prompt, params or {}], sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class ResponseCache:
+    """Persistent on-disk cache of model answers with size/age eviction and hit/miss counters.
+
+    Answers are keyed by content rather than by query_id, so renumbering or editing
+    queries.csv, or writing to another output file, still reuses earlier calls.
+    """
+
+    def __init__(self, path=CACHE_FILE, max_mb=MAX_CACHE_MB, max_age_days=MAX_AGE_DAYS):
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.path = path
+        self.max_bytes = int(max_mb * 1024 * 1024)
+        self.max_age = max_age_days * 86400
+        self.hits = 0
+        self.misses = 0
+        self.puts_since_evict = 0
+
+        self.conn = sqlite3.connect(path)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS responses (
+                key TEXT PRIMARY KEY,
+                provider TEXT,
+                model TEXT,
+                response_text TEXT,
+                total_tokens INTEGER,
+                size INTEGER,
+                created_at REAL,
+                last_used REAL
+            )
+        """)
+        self.conn.execute("CREATE INDEX IF NOT EXISTS idx_last_used ON responses(last_used)")
+        self.conn.commit()
+        self.evict()
+
+    def get(self, provider, model, prompt, params=None):
+        """Return (response_text, total_tokens) or None"""
+        key = cache_key(provider, model, prompt, params)
+        row = self.conn.execute(
+            "SELECT response_text, total_tokens, created_at FROM responses WHERE key = ?", (key,)
+        ).fetchone()
+        now = time.time()
+        if row is None or (self.max_age and now - row[2] > self.max_age):
+            self.misses += 1
+            return None
+        self.conn.execute("UPDATE responses SET last_used = ? WHERE key = ?", (now, key))
+        self.conn.commit()
+        self.hits += 1
+        return row[0], row[1]
+
+    def put(self, provider, model, prompt, response_text, total_tokens=None, params=None):
+        key = cache_key(provider, model, prompt, params)
+        now = time.time()
+        self.conn.execute(
+            "INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+            (key, provider, model, response_text, total_tokens,
+             len(response_text.encode("utf-8")) + len(prompt.encode("utf-8")), now, now),
+        )
+        self.conn.commit()
+        self.puts_since_evict += 1
+        if self.puts_since_evict >= EVICT_EVERY:
+            self.evict()
+
+    def evict(self):
+        """Drop entries older than max_age, then least recently used ones until under max size"""
+        self.puts_since_evict = 0
+        if self.max_age:
+            self.conn.execute("DELETE FROM responses WHERE created_at < ?", (time.time() - self.max_age,))
+        total = self.conn.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+        if total > self.max_bytes:
+            excess = total - self.max_bytes
+            freed = 0
+            stale_keys = []
+            for key, size in self.conn.execute("SELECT key, size FROM responses ORDER BY last_used"):
+                stale_keys.append((key,))
+                freed += size
+                if freed >= excess:
+                    break
+            self.conn.executemany("DELETE FROM responses WHERE key = ?", stale_keys)
+        self.conn.commit()
+
+    def summary(self):
+        entries, size = self.conn.execute(
+            "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM responses"
+        ).fetchone()
+        lookups = self.hits + self.misses
+        hit_rate = self.hits / lookups if lookups else 0.0
+        return (f"cache: {self.hits} hits, {self.misses} misses ({hit_rate:.0%} hit rate), "
+                f"{entries} entries, {size / 1024 / 1024:.1f} MB in {self.path}")
+
+    def close(self):
+        self.conn.close()
@@ -0,0 +1,530 @@
+import argparse
+import csv
+import hashlib
+import json
+import os
+import re
+import shutil
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+from brand_matcher import DEFAULT_BRANDS, _is_word, _literal_variants, fold_case, load_brands
+from checkpoint_journal import write_csv_atomic
+from dataset_constructor import SOURCES_FILE, load_sources
+from extract_mentions import FIELDNAMES as MENTION_FIELDNAMES, response_hash
+
+# ===========================
+# CONFIG
+# ===========================
+INDEX_DIR = "data/response_index"
+SEGMENT_DOCS = 20000     # responses per segment written by an update
+MAX_TERM_CHARS = 64      # longer tokens are stored under a prefix + digest key of this length
+COMPACT_DELETED_SHARE = 0.25   # rewrite the segments once this share of the docs is deleted
+# Words (as \w+ in Python's re) and single punctuation characters, each with the whitespace before it
+TOKEN_RE = re.compile(r"(\s*)(\w+|[^\w\s])")
+TOKENIZER_VERSION = 3
+DIMENSIONS = ["source", "topic"]
+SEGMENT_ARRAYS = ["terms", "offsets", "post_docs", "post_pos", "post_gap", "post_flags", "gaps",
+                  "doc_source", "doc_topic", "query_ids", "hashes"]
+
+# post_flags bits: the character just before / after the token is a word character. Word
+# tokens are maximal runs, so only punctuation tokens can have them; \b needs them there
+PREV_WORD, NEXT_WORD = 1, 2
+
+
+def term_key(token):
+    """Dictionary key of a case-folded token; long tokens keep a prefix and a digest of the rest"""
+    if len(token) <= MAX_TERM_CHARS:
+        return token
+    # '#' never occurs inside a word token, and punctuation tokens are one character
+    digest = hashlib.sha1(token.encode("utf-8")).hexdigest()[:16]
+    return token[:MAX_TERM_CHARS - 17] + "#" + digest
+
+
+def analyze(text):
+    """(terms, gaps, flags) of a text: the term key of every token, the whitespace before it
+    and its PREV_WORD/NEXT_WORD flags"""
+    pairs = TOKEN_RE.findall(text)
+    terms = [term_key(fold_case(token)) for _, token in pairs]
+    gaps = [gap for gap, _ in pairs]
+    word = [_is_word(token[0]) for _, token in pairs] + [False]
+    flags = [0] * len(pairs)
+    for i, (gap, token) in enumerate(pairs):
+        if not word[i]:
+            flags[i] = (PREV_WORD if i and not gap and word[i - 1] else 0) | \
+                       (NEXT_WORD if word[i + 1] and not pairs[i + 1][0] else 0)
+    return terms, gaps, flags
+
+
+def alias_phrases(alias):
+    """Phrases the literal variants of an alias (see brand_matcher) match, as
+    (terms, gaps between them, PREV_WORD/NEXT_WORD flags the first/last token needs);
+    None for aliases the phrases cannot express"""
+    variants = _literal_variants(alias)
+    if variants is None:
+        return None
+    phrases = set()
+    for v in variants:
+        if v != v.strip():
+            return None  # \b next to whitespace depends on characters outside the alias
+        terms, gaps, _ = analyze(v)
+        phrases.add((tuple(terms), tuple(gaps[1:]),
+                     0 if _is_word(v[0]) else PREV_WORD, 0 if _is_word(v[-1]) else NEXT_WORD))
+    return phrases
+
+
+class Segment:
+    """An immutable, memory-mapped part of the index.
+
+    Postings are (doc, position) pairs grouped by term, so a term's postings are the
+    slice offsets[i]:offsets[i + 1] of post_docs/post_pos for its rank i in the sorted
+    `terms` array; post_gap codes the whitespace before each occurrence (into `gaps`)
+    and post_flags holds its PREV_WORD/NEXT_WORD bits. Doc ids are local; `base` turns
+    them into index-wide ids.
+    """
+
+    def __init__(self, path, base):
+        self.path = path
+        self.base = base
+        for name in SEGMENT_ARRAYS:
+            setattr(self, name, np.load(os.path.join(path, name + ".npy"), mmap_mode="r"))
+
+    @staticmethod
+    def write(path, docs):
+        """Build a segment from (source code, topic code, query_id, hash, analyze() result) tuples"""
+        vocab, gap_vocab = {}, {}
+        term_ids, gap_ids, flags, doc_ids, positions = [], [], [], [], []
+        for local, (_, _, _, _, (terms, gaps, doc_flags)) in enumerate(docs):
+            term_ids.append(np.fromiter((vocab.setdefault(t, len(vocab)) for t in terms), np.int32, len(terms)))
+            gap_ids.append(np.fromiter((gap_vocab.setdefault(g, len(gap_vocab)) for g in gaps), np.int32, len(gaps)))
+            flags.append(np.array(doc_flags, np.uint8))
+            doc_ids.append(np.full(len(terms), local, np.int32))
+            positions.append(np.arange(len(terms), dtype=np.int32))
+        terms = sorted(vocab)
+        rank = np.empty(len(vocab), np.int32)
+        rank[[vocab[t] for t in terms]] = np.arange(len(terms), dtype=np.int32)
+        term_rank = rank[np.concatenate(term_ids)] if docs else np.empty(0, np.int32)
+        # Stable, so each term's postings stay in (doc, position) order
+        order = np.argsort(term_rank, kind="stable")
+
+        def postings(parts, dtype):
+            return np.concatenate(parts)[order] if docs else np.empty(0, dtype)
+
+        Segment._save(path, {
+            "terms": np.array(terms, dtype=f"<U{max([1] + [len(t) for t in terms])}"),
+            "offsets": np.concatenate([[0], np.cumsum(np.bincount(term_rank, minlength=len(terms)))]).astype(np.int64),
+            "post_docs": postings(doc_ids, np.int32),
+            "post_pos": postings(positions, np.int32),
+            "post_gap": postings(gap_ids, np.int32),
+            "post_flags": postings(flags, np.uint8),
+            "gaps": np.array(list(gap_vocab), dtype=f"<U{max([1] + [len(g) for g in gap_vocab])}"),
+            "doc_source": np.array([d[0] for d in docs], np.int16),
+            "doc_topic": np.array([d[1] for d in docs], np.int16),
+            "query_ids": np.array([d[2] for d in docs], dtype=f"<U{max([1] + [len(d[2]) for d in docs])}"),
+            "hashes": np.array([d[3] for d in docs], dtype="<U32"),
+        })
+
+    def write_live(self, path, live):
+        """Write a copy of this segment without the docs where `live` (local) is False"""
+        new_id = (np.cumsum(live) - 1).astype(np.int32)
+        term_of = np.repeat(np.arange(len(self.terms)), np.diff(self.offsets))
+        keep = live[self.post_docs]
+        counts = np.bincount(term_of[keep], minlength=len(self.terms))
+        used = counts > 0
+        Segment._save(path, {
+            "terms": np.asarray(self.terms)[used],
+            "offsets": np.concatenate([[0], np.cumsum(counts[used])]).astype(np.int64),
+            "post_docs": new_id[self.post_docs[keep]],
+            "post_pos": np.asarray(self.post_pos)[keep],
+            "post_gap": np.asarray(self.post_gap)[keep],
+            "post_flags": np.asarray(self.post_flags)[keep],
+            "gaps": np.asarray(self.gaps),
+            "doc_source": np.asarray(self.doc_source)[live],
+            "doc_topic": np.asarray(self.doc_topic)[live],
+            "query_ids": np.asarray(self.query_ids)[live],
+            "hashes": np.asarray(self.hashes)[live],
+        })
+
+    @staticmethod
+    def _save(path, arrays):
+        tmp = path + ".tmp"
+        shutil.rmtree(tmp, ignore_errors=True)
+        os.makedirs(tmp)
+        for name, array in arrays.items():
+            np.save(os.path.join(tmp, name + ".npy"), array)
+        shutil.rmtree(path, ignore_errors=True)
+        os.replace(tmp, path)
+
+    def postings(self, term):
+        i = np.searchsorted(self.terms, term)
+        if i == len(self.terms) or self.terms[i] != term:
+            return None
+        return slice(self.offsets[i], self.offsets[i + 1])
+
+    def phrase_docs(self, terms, gaps, first_flags=0, last_flags=0):
+        """Index-wide ids of the docs containing the terms at consecutive positions, separated
+        by exactly `gaps` and with the given flags on the first and last token"""
+        gap_codes = [np.flatnonzero(self.gaps == g) for g in gaps]
+        if any(len(code) == 0 for code in gap_codes):
+            return np.empty(0, np.int64)
+        keys = None
+        for i, term in enumerate(terms):
+            hit = self.postings(term)
+            if hit is None:
+                return np.empty(0, np.int64)
+            docs, pos = self.post_docs[hit], self.post_pos[hit]
+            keep = pos >= i
+            if i > 0:
+                keep &= self.post_gap[hit] == gap_codes[i - 1][0]
+            required = (first_flags if i == 0 else 0) | (last_flags if i == len(terms) - 1 else 0)
+            if required:
+                keep &= (self.post_flags[hit] & required) == required
+            # (doc, position where the phrase would start) as one sortable key
+            k = (docs[keep].astype(np.int64) << 32) + (pos[keep] - i)
+            keys = k if keys is None else np.intersect1d(keys, k, assume_unique=True)
+            if not len(keys):
+                break
+        return np.unique(keys >> 32) + self.base
+
+
+class ResponseIndex:
+    """Persistent positional inverted index over the collected responses.
+
+    Every response of the sources manifest is one doc with its source, query_id and topic.
+    Postings live in append-only, memory-mapped segments, so opening the index reads
+    only a small JSON file and a lookup touches just the dictionary pages and postings it
+    needs. `update()` indexes new and changed responses into a new segment and marks
+    replaced or removed ones as deleted; unchanged response files are skipped.
+
+    Brand aliases are matched as token phrases: the literal variants of an alias (as in
+    BrandMatcher) are tokenized like the responses, and a doc mentions the brand when
+    some variant occurs at consecutive positions with the same whitespace in between and
+    word boundaries where the regex needs them, which gives the result of
+    BrandMatcher.find(). Aliases with other regex syntax are searched with the regex in
+    the response texts of the live docs.
+    """
+
+    def __init__(self, path=INDEX_DIR):
+        self.path = path
+        self.meta_path = os.path.join(path, "index.json")
+        self.meta = _empty_meta()
+        if os.path.exists(self.meta_path):
+            with open(self.meta_path, encoding="utf-8") as f:
+                self.meta = json.load(f)
+            if self.meta["tokenizer"] != TOKENIZER_VERSION:
+                raise ValueError(f"{path} was built with another tokenizer; rebuild it (--rebuild)")
+        self._load()
+
+    def _load(self):
+        self.segments = [Segment(os.path.join(self.path, s["name"]), s["base"]) for s in self.meta["segments"]]
+        self.bases = np.array([s.base for s in self.segments], np.int64)
+        self.n_docs = sum(s["docs"] for s in self.meta["segments"])
+        self.live = np.ones(self.n_docs, bool)
+        self.live[np.array(self.meta["deleted"], np.int64)] = False
+        self.codes = {
+            "source": np.concatenate([s.doc_source for s in self.segments] or [np.empty(0, np.int16)]),
+            "topic": np.concatenate([s.doc_topic for s in self.segments] or [np.empty(0, np.int16)]),
+        }
+
+    def _save(self):
+        tmp = self.meta_path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(self.meta, f)
+        os.replace(tmp, self.meta_path)
+
+    def rebuild(self):
+        """Forget everything; the next update indexes all responses again"""
+        shutil.rmtree(self.path, ignore_errors=True)
+        self.meta = _empty_meta()
+        self._load()
+
+    def compact(self):
+        """Rewrite the segments holding deleted docs without them and empty the deleted list;
+        returns the number of docs dropped"""
+        dropped = len(self.meta["deleted"])
+        if not dropped:
+            return 0
+        segments, stale, base = [], [], 0
+        for seg, info in zip(self.segments, self.meta["segments"]):
+            live = self.live[seg.base:seg.base + info["docs"]]
+            if live.all():
+                segments.append({**info, "base": base})
+            else:
+                stale.append(seg.path)
+                if live.any():
+                    name = f"seg_{self.meta['next_segment']:05d}"
+                    seg.write_live(os.path.join(self.path, name), live)
+                    self.meta["next_segment"] += 1
+                    segments.append({"name": name, "base": base, "docs": int(live.sum())})
+            base += int(live.sum())
+        self.meta["segments"] = segments
+        self.meta["deleted"] = []
+        self._save()
+        self._load()
+        for path in stale:
+            shutil.rmtree(path, ignore_errors=True)
+        return dropped
+
+    # ---- updates ----
+
+    def _code(self, dim, value):
+        values = self.meta[dim + "s"]
+        if value not in values:
+            values.append(value)
+        return values.index(value)
+
+    def _source_docs(self, source):
+        """{query_id: (doc id, response hash)} of the live docs of a source"""
+        docs = {}
+        if source not in self.meta["sources"]:
+            return docs
+        code = self.meta["sources"].index(source)
+        for seg in self.segments:
+            n = len(seg.doc_source)
+            for local in np.flatnonzero((np.asarray(seg.doc_source) == code) & self.live[seg.base:seg.base + n]):
+                docs[str(seg.query_ids[local])] = (seg.base + int(local), str(seg.hashes[local]))
+        return docs
+
+    def _flush(self, pending):
+        name = f"seg_{self.meta['next_segment']:05d}"
+        Segment.write(os.path.join(self.path, name), pending)
+        self.meta["segments"].append({"name": name, "base": self.n_docs, "docs": len(pending)})
+        self.meta["next_segment"] += 1
+        self.n_docs += len(pending)
+
+    def update(self, sources):
+        """Bring the index up to date with the manifest entries; returns change counts"""
+        os.makedirs(self.path, exist_ok=True)
+        stats = {"added": 0, "changed": 0, "removed": 0, "skipped_sources": 0, "compacted": 0}
+        deleted = []
+        pending = []
+        for entry in sources:
+            source, path = entry["source"], entry["responses_file"]
+            st = os.stat(path)
+            signature = f"{path}|{st.st_size}|{st.st_mtime_ns}"
+            if self.meta["files"].get(source) == signature:
+                stats["skipped_sources"] += 1
+                continue
+            indexed = self._source_docs(source)
+            source_code = self._code("source", source)
+            with open(path, newline="", encoding="utf-8") as f:
+                for row in csv.DictReader(f):
+                    digest = response_hash(row["response_text"])
+                    old = indexed.pop(row["query_id"], None)
+                    if old is not None and old[1] == digest:
+                        continue
+                    if old is not None:
+                        deleted.append(old[0])
+                        stats["changed"] += 1
+                    else:
+                        stats["added"] += 1
+                    pending.append((source_code, self._code("topic", row["topic"]), row["query_id"], digest,
+                                    analyze(row["response_text"])))
+                    if len(pending) >= SEGMENT_DOCS:
+                        self._flush(pending)
+                        pending = []
+            deleted += [doc for doc, _ in indexed.values()]
+            stats["removed"] += len(indexed)
+            self.meta["files"][source] = signature
+
+        # Sources dropped from the manifest are removed from the index
+        listed = {entry["source"] for entry in sources}
+        for source in [s for s in self.meta["files"] if s not in listed]:
+            dropped = self._source_docs(source)
+            deleted += [doc for doc, _ in dropped.values()]
+            stats["removed"] += len(dropped)
+            del self.meta["files"][source]
+
+        if pending:
+            self._flush(pending)
+        self.meta["deleted"] += deleted
+        self._save()
+        self._load()
+        if len(self.meta["deleted"]) > COMPACT_DELETED_SHARE * self.n_docs:
+            stats["compacted"] = self.compact()
+        return stats
+
+    # ---- lookups ----
+
+    def selection(self, where=None):
+        """Boolean mask of the live docs matching {dimension: value or list}"""
+        mask = self.live.copy()
+        for dim, value in (where or {}).items():
+            if dim not in DIMENSIONS:
+                raise ValueError(f"unknown dimension {dim!r}, expected one of {DIMENSIONS}")
+            values = value if isinstance(value, (list, tuple, set)) else [value]
+            codes = [self.meta[dim + "s"].index(v) for v in values if v in self.meta[dim + "s"]]
+            mask &= np.isin(self.codes[dim], codes)
+        return mask
+
+    def match(self, aliases):
+        """Sorted ids of the docs matching any of the aliases; phrase lookups also return
+        deleted docs, the regex fallback only live ones"""
+        parts, complex_aliases = [], []
+        for alias in aliases:
+            phrases = alias_phrases(alias)
+            if phrases is None:
+                complex_aliases.append(alias)
+                continue
+            for seg in self.segments:
+                parts += [seg.phrase_docs(*phrase) for phrase in phrases]
+        if complex_aliases:
+            # Same pattern as BrandMatcher builds for a brand's non-literal aliases
+            parts.append(self.regex_docs(re.compile(r"\b(?:" + "|".join(complex_aliases) + r")\b", re.IGNORECASE)))
+        return np.unique(np.concatenate(parts)) if parts else np.empty(0, np.int64)
+
+    def regex_docs(self, pattern):
+        """Ids of the live docs whose response text matches the compiled pattern, read back
+        from the indexed response files"""
+        found = []
+        for source, signature in self.meta["files"].items():
+            path = signature.rsplit("|", 2)[0]
+            docs = self._source_docs(source)
+            with open(path, newline="", encoding="utf-8") as f:
+                for row in csv.DictReader(f):
+                    doc = docs.get(row["query_id"])
+                    # Texts changed since the last update are not what the doc indexed
+                    if doc is not None and pattern.search(row["response_text"]) \
+                            and doc[1] == response_hash(row["response_text"]):
+                        found.append(doc[0])
+        return np.array(sorted(found), np.int64)
+
+    def hits(self, brands):
+        """{brand: boolean mask over all docs}"""
+        out = {}
+        for brand, aliases in brands.items():
+            mask = np.zeros(self.n_docs, bool)
+            mask[self.match(aliases)] = True
+            out[brand] = mask
+        return out
+
+    def query_ids(self, docs):
+        seg_of = np.searchsorted(self.bases, docs, side="right") - 1
+        return [str(self.segments[s].query_ids[d - self.segments[s].base]) for s, d in zip(seg_of, docs)]
+
+    def rates(self, brands, by=("source",), where=None):
+        """Mention counts per brand and `by` dimensions among the selected responses; a DataFrame
+        with responses, mentions and mention_prob, as mention_cube.py reports them"""
+        by = list(by)
+        docs = np.flatnonzero(self.selection(where))
+        frame = pd.DataFrame({dim: np.array(self.meta[dim + "s"], dtype=object)[self.codes[dim][docs]]
+                              for dim in by})
+        for brand, mask in self.hits(brands).items():
+            frame[brand] = mask[docs].astype(int)
+        long = frame.melt(id_vars=by, value_vars=list(brands), var_name="brand", value_name="mention")
+        out = (long.groupby(["brand"] + by, sort=False)["mention"]
+               .agg(responses="size", mentions="sum").reset_index())
+        out["mention_prob"] = out["mentions"] / out["responses"]
+        return out
+
+    def mention_rows(self, brands, where=None):
+        """Rows in the mentions.csv schema (query_id, brand, mention) for the selected responses
+        of one source, ordered by query_id"""
+        docs = np.flatnonzero(self.selection(where))
+        if len(np.unique(self.codes["source"][docs])) > 1:
+            raise ValueError("mention vectors are per source; select one with source=<name>")
+        qids = self.query_ids(docs)
+        numeric = all(q.isdigit() for q in qids)
+        order = sorted(range(len(docs)), key=lambda i: int(qids[i]) if numeric else qids[i])
+        flags = {brand: mask[docs] for brand, mask in self.hits(brands).items()}
+        for i in order:
+            for brand in brands:
+                yield {"query_id": qids[i], "brand": brand, "mention": int(flags[brand][i])}
+
+    def matching_docs(self, aliases, where=None):
+        """(source, query_id, topic) of the selected responses matching any alias"""
+        docs = self.match(aliases)
+        docs = docs[self.selection(where)[docs]]
+        sources = np.array(self.meta["sources"], dtype=object)[self.codes["source"][docs]]
+        topics = np.array(self.meta["topics"], dtype=object)[self.codes["topic"][docs]]
+        return list(zip(sources, self.query_ids(docs), topics))
+
+
+def _empty_meta():
+    return {"tokenizer": TOKENIZER_VERSION, "next_segment": 0, "segments": [],
+            "sources": [], "topics": [], "deleted": [], "files": {}}
+
+
+def _parse_where(items):
+    where = {}
+    for item in items or []:
+        dim, _, value = item.partition("=")
+        where.setdefault(dim, []).append(value)
+    return where
+
+
+def _parse_term(item):
+    """"Proton Pass" matches the words literally; "Proton=proton ?pass|protonpass" gives aliases"""
+    name, sep, aliases = item.partition("=")
+    return name, aliases.split("|") if sep else [re.escape(name)]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Inverted index over the collected responses for brand and term lookups")
+    parser.add_argument("--sources", default=SOURCES_FILE, help="manifest of response/mention files per source")
+    parser.add_argument("--index", default=INDEX_DIR)
+    parser.add_argument("--rebuild", action="store_true", help="discard the index and index every response again")
+    parser.add_argument("--no-update", action="store_true", help="only query the index as it is")
+    parser.add_argument("--brands", help="brand,alias CSV (default: the brand_matcher.py list)")
+    parser.add_argument("--brand", action="append", default=[], help="brand of the brand list to look up, repeatable")
+    parser.add_argument("--term", action="append", default=[], metavar="NAME[=ALIAS|ALIAS]",
+                        help="ad-hoc phrase or brand with aliases, repeatable")
+    parser.add_argument("--by", default="source", help=f"comma-separated dimensions ({','.join(DIMENSIONS)}) "
+                                                      "to break the counts down by; empty for totals")
+    parser.add_argument("--where", action="append", metavar="DIM=VALUE", help="filter, repeatable")
+    parser.add_argument("--mentions", metavar="PATH", help="write mention vectors in the mentions.csv schema "
+                                                           "('-' for stdout) instead of counts")
+    parser.add_argument("--list", action="store_true", help="list the matching responses instead of counts")
+    args = parser.parse_args(argv)
+
+    catalog = load_brands(args.brands) if args.brands else DEFAULT_BRANDS
+    unknown = [b for b in args.brand if b not in catalog]
+    if unknown:
+        parser.error(f"unknown brands {unknown}; known: {', '.join(catalog)}")
+    brands = {b: catalog[b] for b in args.brand}
+    brands.update(_parse_term(t) for t in args.term)
+    brands = brands or dict(catalog)
+    where = _parse_where(args.where)
+
+    index = ResponseIndex(args.index)
+    if args.rebuild:
+        index.rebuild()
+    if not args.no_update:
+        start = time.perf_counter()
+        stats = index.update(load_sources(args.sources))
+        print(f"Updated {args.index} in {time.perf_counter() - start:.2f}s: {stats['added']} responses added, "
+              f"{stats['changed']} changed, {stats['removed']} removed, "
+              f"{stats['skipped_sources']} unchanged sources skipped, "
+              f"{stats['compacted']} deleted responses compacted away", file=sys.stderr)
+
+    start = time.perf_counter()
+    if args.mentions:
+        rows = list(index.mention_rows(brands, where))
+        elapsed = time.perf_counter() - start
+        if args.mentions == "-":
+            writer = csv.DictWriter(sys.stdout, fieldnames=MENTION_FIELDNAMES)
+            writer.writeheader()
+            writer.writerows(rows)
+        else:
+            write_csv_atomic(args.mentions, MENTION_FIELDNAMES, rows)
+            print(f"Saved {len(rows)} rows to {args.mentions}")
+    elif args.list:
+        lines = []
+        for brand, aliases in brands.items():
+            docs = index.matching_docs(aliases, where)
+            lines.append(f"{brand}: {len(docs)} responses")
+            lines += [f"  {source} {qid} ({topic})" for source, qid, topic in docs]
+        elapsed = time.perf_counter() - start
+        print("\n".join(lines))
+    else:
+        table = index.rates(brands, [d for d in args.by.split(",") if d], where)
+        elapsed = time.perf_counter() - start
+        print(table.to_string(index=False, float_format=lambda v: f"{v:.3f}"))
+    print(f"(looked up in {elapsed * 1000:.1f} ms)", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,144 @@
+import pandas as pd
+
+# Declared layout of every table the dataset constructor reads and writes.
+#   columns:       column -> "int" | "float" | "str"
+#   comma_decimal: float columns stored with a decimal comma ("4,5"), as exported by Google Sheets
+#   key:           columns that must be present, non-null and unique together
+TABLES = {
+    "responses": {
+        "columns": {"query_id": "int", "query_text": "str", "topic": "str", "response_text": "str"},
+        "key": ["query_id"],
+    },
+    "mentions": {
+        "columns": {"query_id": "int", "brand": "str", "mention": "int"},
+        "key": ["query_id", "brand"],
+    },
+    "brand_features": {
+        "columns": {
+            "brand": "str",
+            "avgrating_b_tp": "float",
+            "reviewcount_b_tp": "int",
+            "avgrating_b_g2": "float",
+            "reviewcount_b_g2": "int",
+            "lighthouse_seo_b": "int",
+        },
+        "comma_decimal": ["avgrating_b_tp", "avgrating_b_g2"],
+        "key": ["brand"],
+    },
+    "topic_hits": {
+        "columns": {
+            "brand": "str",
+            "topic": "str",
+            "listicle_topic_hits_bt": "int",
+            "reddit_topic_hits_bt": "int",
+            "youtube_topic_hits_bt": "int",
+            "linkedin_topic_hits_bt": "int",
+            "domain_topic_hits_bt": "int",
+        },
+        "key": ["brand", "topic"],
+    },
+}
+
+# Columns of dataset.csv written with a decimal comma (Google Sheets compatibility)
+DATASET_COMMA_DECIMAL = ["avgrating_b_tp", "reviewcount_b_tp", "avgrating_b_g2", "reviewcount_b_g2"]
+
+# The constructor's output, as read back by the estimation scripts
+TABLES["dataset"] = {
+    "columns": {
+        "query_id": "int",
+        "source": "str",
+        "query_text": "str",
+        "topic": "str",
+        "response_text": "str",
+        "brand": "str",
+        "mention": "int",
+        **{c: t for c, t in TABLES["brand_features"]["columns"].items() if c != "brand"},
+        **{c: t for c, t in TABLES["topic_hits"]["columns"].items() if c not in ("brand", "topic")},
+    },
+    "comma_decimal": DATASET_COMMA_DECIMAL,
+    "key": ["query_id", "source", "brand"],
+}
+
+
+class SchemaError(ValueError):
+    """One or more input tables do not match their declared schema"""
+
+    def __init__(self, problems):
+        self.problems = problems
+        super().__init__("Schema violations:\n  - " + "\n  - ".join(problems))
+
+
+def _read(kind, path, problems, usecols=None):
+    """Read one table with its declared dtypes; violations are appended to `problems`.
+
+    `usecols` restricts the read to some of the declared columns (the key is always read).
+    """
+    spec = TABLES[kind]
+    columns = spec["columns"]
+    if usecols is not None:
+        wanted = set(usecols) | set(spec["key"])
+        columns = {c: t for c, t in columns.items() if c in wanted}
+    comma_cols = set(spec.get("comma_decimal", []))
+    numeric = [c for c, t in columns.items() if t != "str"]
+
+    # Numeric columns come in as text so that bad values can be reported instead of raising
+    df = pd.read_csv(path, dtype={c: str for c in numeric},
+                     usecols=None if usecols is None else lambda c: c in columns)
+
+    missing = [c for c in columns if c not in df.columns]
+    if missing:
+        problems.append(f"{path}: missing columns {missing}")
+        return df
+
+    for col in numeric:
+        raw = df[col]
+        text = raw.str.replace(",", ".", regex=False) if col in comma_cols else raw
+        parsed = pd.to_numeric(text.str.strip(), errors="coerce")
+        bad = parsed.isna() & raw.notna()
+        if bad.any():
+            examples = raw[bad].unique()[:3].tolist()
+            problems.append(f"{path}: {int(bad.sum())} unparseable {columns[col]} values in '{col}', e.g. {examples}")
+        if columns[col] == "float":
+            parsed = parsed.astype("float64")
+        df[col] = parsed
+
+    key = spec["key"]
+    null_keys = df[key].isna().any(axis=1)
+    if null_keys.any():
+        problems.append(f"{path}: {int(null_keys.sum())} rows with empty {key}")
+    duplicated = df.duplicated(subset=key)
+    if duplicated.any():
+        examples = df.loc[duplicated, key].head(3).values.tolist()
+        problems.append(f"{path}: {int(duplicated.sum())} duplicate {key} rows, e.g. {examples}")
+    return df
+
+
+def read_table(kind, path, usecols=None):
+    """Read and validate one table; raises SchemaError listing every problem found"""
+    problems = []
+    df = _read(kind, path, problems, usecols)
+    if problems:
+        raise SchemaError(problems)
+    return df
+
+
+def read_tables(inputs):
+    """Read and validate {name: (kind, path)} together, so every problem is reported up front"""
+    problems = []
+    tables = {name: _read(kind, path, problems) for name, (kind, path) in inputs.items()}
+    if problems:
+        raise SchemaError(problems)
+    return tables
+
+
+def write_csv(df, path, comma_decimal=()):
+    """Write df as CSV with the listed numeric columns formatted with a decimal comma.
+
+    The conversion runs as column-wise string operations; missing values are written empty.
+    """
+    out = df.copy(deep=False)
+    for col in comma_decimal:
+        if col in out.columns:
+            values = out[col]
+            out[col] = values.astype(str).str.replace(".", ",", regex=False).where(values.notna(), "")
+    out.to_csv(path, index=False, encoding="utf-8")
@@ -0,0 +1,127 @@
+import os
+
+
+class MissingSignal(Exception):
+    """The service answered, but has no value for this request; retrying will not help"""
+
+
+class SignalBackend:
+    """Common interface for the services behind the brand and topic signals.
+
+    A backend answers some request kinds:
+      "hits"   {"query": ...}                   -> number of search results
+      "rating" {"site": "tp"|"g2", "brand", "domain"} -> {"avgrating": float, "reviewcount": int}
+      "seo"    {"url": ...}                     -> Lighthouse SEO score (0-100)
+    `fetch(kind, request, etag)` returns `(value, etag)`, or `(None, etag)` when the
+    service confirms with 304 Not Modified that the cached value is still current; it
+    raises MissingSignal when the answer carries no value.
+    HTTP clients are created with the backend, so only the ones used need their library.
+    """
+
+    name = None
+    kinds = ()
+    max_in_flight = 8
+    requests_per_minute = 60
+
+    async def fetch(self, kind, request, etag=None):
+        raise NotImplementedError
+
+    async def aclose(self):
+        pass
+
+    def is_rate_limit(self, e):
+        error_msg = str(e)
+        error_code = getattr(e, 'status_code', None) or getattr(getattr(e, 'response', None), 'status_code', None)
+        return "429" in error_msg or "rate limit" in error_msg.lower() or error_code == 429
+
+
+class HttpBackend(SignalBackend):
+    """JSON-over-HTTP backend with one pooled httpx client per run and conditional GETs"""
+
+    timeout = 60.0
+
+    def __init__(self):
+        import httpx
+
+        # Keep-alive connections are reused across requests, up to one per request in flight
+        self.client = httpx.AsyncClient(
+            timeout=self.timeout,
+            limits=httpx.Limits(max_connections=self.max_in_flight, max_keepalive_connections=self.max_in_flight),
+        )
+
+    async def get_json(self, url, params, etag=None):
+        headers = {"If-None-Match": etag} if etag else {}
+        response = await self.client.get(url, params=params, headers=headers)
+        if response.status_code == 304:
+            return None, etag
+        response.raise_for_status()
+        return response.json(), response.headers.get("ETag")
+
+    async def aclose(self):
+        await self.client.aclose()
+
+
+class GoogleSearchBackend(HttpBackend):
+    """Result counts from the Google Custom Search JSON API (a search engine id and key)"""
+
+    name = "google"
+    kinds = ("hits",)
+    url = "https://www.googleapis.com/customsearch/v1"
+    requests_per_minute = 100
+
+    def __init__(self, api_key=None, engine_id=None):
+        self.api_key = api_key or os.getenv("GOOGLE_CSE_KEY")
+        self.engine_id = engine_id or os.getenv("GOOGLE_CSE_ID")
+        if not self.api_key or not self.engine_id:
+            raise ValueError("GOOGLE_CSE_KEY and GOOGLE_CSE_ID environment variables must be set for the google backend")
+        super().__init__()
+
+    async def fetch(self, kind, request, etag=None):
+        data, etag = await self.get_json(self.url, {"key": self.api_key, "cx": self.engine_id,
+                                                    "q": request["query"], "num": 1}, etag)
+        if data is None:
+            return None, etag
+        return int(data.get("searchInformation", {}).get("totalResults", 0)), etag
+
+
+class PageSpeedBackend(HttpBackend):
+    """Lighthouse SEO category score from the PageSpeed Insights API"""
+
+    name = "pagespeed"
+    kinds = ("seo",)
+    url = "https://www.googleapis.com/pagespeedonline/v5/runPagespeed"
+    max_in_flight = 4
+    requests_per_minute = 60
+    timeout = 120.0   # a Lighthouse run takes tens of seconds
+
+    def __init__(self, api_key=None):
+        self.api_key = api_key or os.getenv("PAGESPEED_API_KEY")
+        super().__init__()
+
+    async def fetch(self, kind, request, etag=None):
+        params = {"url": request["url"], "category": "SEO"}
+        if self.api_key:
+            params["key"] = self.api_key
+        data, etag = await self.get_json(self.url, params, etag)
+        if data is None:
+            return None, etag
+        score = data.get("lighthouseResult", {}).get("categories", {}).get("seo", {}).get("score")
+        if score is None:
+            # Lighthouse reports a null score when it could not audit the page (blocked, errors, timeouts)
+            reason = data.get("lighthouseResult", {}).get("runtimeError", {}).get("message", "no SEO score")
+            raise MissingSignal(f"PageSpeed has no SEO score for {request['url']}: {reason}")
+        return round(score * 100), etag
+
+
+BACKENDS = {
+    "google": GoogleSearchBackend,
+    "pagespeed": PageSpeedBackend,
+}
+
+
+def backend_class(name):
+    """Backend class by name; "fake" is the local stand-in from fake_signals.py"""
+    if name == "fake":
+        from fake_signals import FakeSignalBackend
+        return FakeSignalBackend
+    return BACKENDS[name]
@@ -0,0 +1,168 @@
+import json
+import os
+import time
+
+from brand_matcher import BrandMatcher, DEFAULT_BRANDS
+from call_metrics import quantile, timed
+from checkpoint_journal import FIELDNAMES, open_journal, write_csv_atomic
+from collect_responses import load_queries
+from extract_mentions import FIELDNAMES as MENTION_FIELDNAMES, manifest_path, occurrence_hashes
+from query_runner import run_queries
+from response_cache import ResponseCache
+
+# ===========================
+# CONFIG
+# ===========================
+# Per-call timings, in seconds from sending the request
+TIMING_FIELDS = ["ttft_s", "first_mention_s", "latency_s", "pieces"]
+# Journal records carry the mention flags (one 0/1 character per brand, for the brand
+# list with that version) and timings
+STREAM_FIELDNAMES = FIELDNAMES + ["mentions", "brand_version"] + TIMING_FIELDS
+LATENCY_FIELDNAMES = ["query_id"] + TIMING_FIELDS
+
+
+def default_mentions_file(output_file):
+    """responses.csv -> mentions.csv, responses_gemini.csv -> mentions_gemini.csv"""
+    head, name = os.path.split(output_file)
+    if name.startswith("responses"):
+        return os.path.join(head, "mentions" + name[len("responses"):])
+    return output_file + ".mentions.csv"
+
+
+def latency_path(output_file):
+    return output_file + ".latency.csv"
+
+
+def streaming_call(provider, matcher):
+    """call_model for QueryRunner that streams the answer and matches brands as it arrives.
+
+    Pieces are flattened the same way the runner flattens the final text, so the
+    incremental matches equal what extract_mentions.py finds in the saved response.
+    """
+    async def call(prompt):
+        scan = matcher.scanner()
+        pieces = []
+        total_tokens = None
+        ttft = first_mention = None
+        start = time.perf_counter()
+        async for delta, tokens in provider.stream(prompt):
+            if tokens is not None:
+                total_tokens = tokens
+            if not delta:
+                continue
+            elapsed = time.perf_counter() - start
+            if ttft is None:
+                ttft = elapsed
+            pieces.append(delta)
+            if scan.feed(delta.replace("\n", " ")) and first_mention is None:
+                first_mention = elapsed
+        found = scan.finish()
+        latency = time.perf_counter() - start
+        if found and first_mention is None:
+            first_mention = latency   # decided only by the end of the text
+        return "".join(pieces), total_tokens, {
+            "mentions": _flag_string(found, len(matcher.brands)),
+            "brand_version": matcher.version,
+            "ttft_s": _seconds(ttft),
+            "first_mention_s": _seconds(first_mention),
+            "latency_s": _seconds(latency),
+            "pieces": len(pieces),
+        }
+
+    return call
+
+
+def _flag_string(found, n_brands):
+    return "".join("1" if i in found else "0" for i in range(n_brands))
+
+
+def _seconds(value):
+    return "" if value is None else f"{value:.3f}"
+
+
+def write_outputs(rows, matcher, output_file, mentions_file):
+    """Responses, long-format mentions (with the extract_mentions.py manifest) and per-call
+    timings, all from the journaled rows in one pass"""
+    n_brands = len(matcher.brands)
+    for row in rows:
+        # Rows journaled by a non-streaming run, or by an older brand list, are matched here
+        if row.get("brand_version") != matcher.version:
+            row["mentions"] = _flag_string(matcher.find(row["response_text"]), n_brands)
+
+    write_csv_atomic(output_file, FIELDNAMES, rows)
+    write_csv_atomic(mentions_file, MENTION_FIELDNAMES, (
+        {"query_id": row["query_id"], "brand": brand, "mention": flag}
+        for row in rows for brand, flag in zip(matcher.brands, row["mentions"])
+    ))
+    # A later extract_mentions.py run on the same files finds nothing left to scan
+    with open(manifest_path(mentions_file), "w", encoding="utf-8") as f:
+        json.dump({"brand_version": matcher.version, "brands": matcher.brands,
+                   "responses": occurrence_hashes((row["query_id"], row["response_text"]) for row in rows)}, f)
+    write_csv_atomic(latency_path(output_file), LATENCY_FIELDNAMES, rows)
+
+
+def run_streaming(provider, queries_file, output_file=None, mentions_file=None, brands=None, **runner_kwargs):
+    """Collect responses with streamed calls, writing responses and mentions together.
+
+    Resumes from the same journal as run_collection(). Besides `<output>` this writes
+    the mentions table (as extract_mentions.py would) and `<output>.latency.csv` with
+    time to first token, time to first brand mention and total latency per call.
+    """
+    output_file = output_file or provider.default_output
+    mentions_file = mentions_file or default_mentions_file(output_file)
+    matcher = BrandMatcher(brands or DEFAULT_BRANDS)
+
+    queries = load_queries(queries_file)
+    print(f"Loaded {len(queries)} queries")
+    journal, existing = open_journal(output_file, STREAM_FIELDNAMES)
+    if existing:
+        print(f"Found {len(existing)} already completed queries in {journal.path}")
+    pending = [q for q in queries if q["query_id"] not in existing]
+    print(f"{len(pending)} queries to stream from {provider.name} ({provider.model})")
+    query_order = [q["query_id"] for q in queries]
+
+    def on_result(row):
+        if "mentions" not in row:   # cached answers and errors were not streamed
+            row["mentions"] = _flag_string(matcher.find(row["response_text"]), len(matcher.brands))
+            row["brand_version"] = matcher.version
+        journal.append(row)
+
+    kwargs = {
+        "max_in_flight": provider.max_in_flight,
+        "requests_per_minute": provider.requests_per_minute,
+        "tokens_per_minute": provider.tokens_per_minute,
+    }
+    kwargs.update({k: v for k, v in runner_kwargs.items() if v is not None})
+    cache = ResponseCache()
+    rows = []
+    try:
+        if pending:
+            provider.preflight()
+            rows = run_queries(
+                pending, streaming_call(provider, matcher), provider.is_rate_limit, provider.is_auth_error,
+                on_result=on_result,
+                previously_completed=len(existing),
+                cache=cache,
+                provider=provider.name,
+                model=provider.model,
+                params=provider.params,
+                **kwargs,
+            )
+    finally:
+        journal.close()
+        print(cache.summary())
+        cache.close()
+        with timed(runner_kwargs.get("metrics"), "write_outputs"):
+            write_outputs(journal.ordered_rows(query_order), matcher, output_file, mentions_file)
+
+    streamed = [row for row in rows if row.get("latency_s")]
+    if streamed:
+        print(f"\nStreamed {len(streamed)} calls (seconds, p50 / p95):")
+        for field, label in (("ttft_s", "first token"), ("first_mention_s", "first brand mention"),
+                             ("latency_s", "full answer")):
+            values = [float(row[field]) for row in streamed if row[field]]
+            if values:
+                print(f"  {label:<20} {quantile(values, 0.5):.3f} / {quantile(values, 0.95):.3f}"
+                      f"  ({len(values)} calls)")
+    print(f"\n✓ Saved {output_file}, {mentions_file} and {latency_path(output_file)}")
+    return output_file
@@ -0,0 +1,30 @@
+import asyncio
+import os
+import sys
+
+import pytest
+
+# The scripts import each other as top-level modules, as when run from their directory
+SCRIPTS_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "data_gathering_scripts")
+sys.path.insert(0, SCRIPTS_DIR)
+
+
+@pytest.fixture
+def workdir(tmp_path, monkeypatch):
+    """Run the test from an empty directory (caches, journals and data/ land there)"""
+    monkeypatch.chdir(tmp_path)
+    return tmp_path
+
+
+@pytest.fixture
+def sleeps(monkeypatch):
+    """Record the delays passed to asyncio.sleep instead of waiting them out"""
+    requested = []
+    real_sleep = asyncio.sleep
+
+    async def fake_sleep(delay, result=None):
+        requested.append(delay)
+        return await real_sleep(0, result)
+
+    monkeypatch.setattr(asyncio, "sleep", fake_sleep)
+    return requested
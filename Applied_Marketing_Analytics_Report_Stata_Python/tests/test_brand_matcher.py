@@ -0,0 +1,51 @@
+import random
+import re
+
+import pytest
+
+from brand_matcher import DEFAULT_BRANDS, BrandMatcher
+
+# Overlapping names, shared prefixes, character classes and a non-literal alias
+BRANDS = {
+    **DEFAULT_BRANDS,
+    "Pass": [r"pass"],
+    "Proton Pass": [r"proton[- ]?pass"],
+    "Apple Keychain": [r"i?cloud keychain", r"apple passwords?"],
+    "Zoho Vault": [r"zoho vault(?!s)"],
+    "Keeper Security": [r"keeper security"],
+}
+
+TOKENS = ["1password", "1 Password", "1PASSWORD", "bit warden", "Bitwarden", "lastpass", "LAST PASS",
+          "dashlane", "keeper", "Keeper Security", "keepers", "nordpass", "roboform", "pass", "passes",
+          "proton-pass", "Proton Pass", "protonpass", "icloud keychain", "cloud keychain", "apple password",
+          "apple passwords", "zoho vault", "zoho vaults", "password", "the", "best", "manager", "and",
+          "_", "-", ".", ",", "'s", "2", "x", "\n", " ", " ", " ", "",
+          # Case-insensitive matches that str.lower() gets wrong: dotted capital I, long s, Kelvin sign
+          "ß", "é", "İ", "İcloud keychain", "BİTWARDEN", "laſtpaſs", "\u212aeeper"]
+
+
+def reference_flags(brands, text):
+    """The original per-brand search: \\b(?:alias)\\b, case-insensitive, one regex per alias"""
+    return [int(any(re.search(rf"\b(?:{alias})\b", text, re.IGNORECASE) for alias in aliases))
+            for aliases in brands.values()]
+
+
+def random_texts(n, seed=0):
+    rng = random.Random(seed)
+    for _ in range(n):
+        # Tokens are glued without separators now and then, to exercise word boundaries
+        yield "".join(rng.choice(TOKENS) + rng.choice([" ", " ", "", "_", "."]) for _ in range(rng.randint(0, 25)))
+
+
+@pytest.mark.parametrize("brands", [DEFAULT_BRANDS, BRANDS], ids=["default", "extended"])
+def test_find_equals_the_per_brand_regexes(brands):
+    matcher = BrandMatcher(brands)
+    for text in random_texts(3000):
+        assert matcher.mention_flags(text) == reference_flags(brands, text), text
+
+
+def test_version_changes_with_the_brand_list():
+    assert BrandMatcher(DEFAULT_BRANDS).version == BrandMatcher(dict(DEFAULT_BRANDS)).version
+    assert BrandMatcher(DEFAULT_BRANDS).version != BrandMatcher(BRANDS).version
+    reordered = dict(reversed(list(DEFAULT_BRANDS.items())))
+    assert BrandMatcher(DEFAULT_BRANDS).version != BrandMatcher(reordered).version
@@ -0,0 +1,82 @@
+import csv
+import json
+
+from checkpoint_journal import FIELDNAMES, Journal, journal_path, open_journal
+from collect_responses import run_collection
+from fake_client import FakeClient, FakeProvider
+
+
+def row(qid, text="answer"):
+    return {"query_id": qid, "query_text": f"q{qid}", "topic": "Fit/Use", "response_text": text}
+
+
+def test_replay_later_records_win(workdir):
+    journal = Journal("j.jsonl")
+    journal.append(row("1", "first"))
+    journal.append_many([row("2"), row("1", "second")])
+    journal.close()
+
+    rows = Journal("j.jsonl").replay()
+    assert list(rows) == ["1", "2"]
+    assert rows["1"]["response_text"] == "second"
+
+
+def test_torn_tail_is_dropped_and_truncated(workdir):
+    journal = Journal("j.jsonl")
+    journal.append_many([row("1"), row("2")])
+    journal.close()
+    intact = (workdir / "j.jsonl").stat().st_size
+    with open("j.jsonl", "ab") as f:
+        f.write(json.dumps(row("3")).encode()[:20])   # crash in the middle of a write
+
+    journal = Journal("j.jsonl")
+    assert list(journal.replay()) == ["1", "2"]
+    assert (workdir / "j.jsonl").stat().st_size == intact
+    # The next record starts on a clean line
+    journal.append(row("3"))
+    journal.close()
+    assert list(Journal("j.jsonl").replay()) == ["1", "2", "3"]
+
+
+def test_compact_orders_by_query_order(workdir):
+    journal = Journal("j.jsonl")
+    journal.append_many([row("2"), row("3"), row("1")])
+    journal.close()
+    assert journal.compact("out.csv", ["1", "2", "3"]) == 3
+    with open("out.csv", newline="", encoding="utf-8") as f:
+        assert [r["query_id"] for r in csv.DictReader(f)] == ["1", "2", "3"]
+
+
+def test_legacy_csv_is_imported_once(workdir):
+    with open("responses.csv", "w", newline="", encoding="utf-8") as f:
+        writer = csv.DictWriter(f, fieldnames=FIELDNAMES)
+        writer.writeheader()
+        writer.writerows([row("1"), row("2")])
+
+    journal, existing = open_journal("responses.csv")
+    journal.close()
+    assert set(existing) == {"1", "2"}
+    assert len((workdir / journal_path("responses.csv")).read_text().splitlines()) == 2
+    journal, existing = open_journal("responses.csv")
+    journal.close()
+    assert len((workdir / journal_path("responses.csv")).read_text().splitlines()) == 2
+
+
+def test_collection_resumes_from_the_journal(workdir, sleeps):
+    with open("queries.csv", "w", newline="", encoding="utf-8") as f:
+        writer = csv.DictWriter(f, fieldnames=["query_id", "query_text", "topic"])
+        writer.writeheader()
+        writer.writerows({"query_id": str(i), "query_text": f"Best password manager #{i}?", "topic": "Fit/Use"}
+                         for i in range(1, 6))
+    journal = Journal(journal_path("responses.csv"))
+    journal.append_many([row("2", "from an earlier run"), row("4", "from an earlier run")])
+    journal.close()
+
+    client = FakeClient(latency=0, jitter=0, error_prob=0, server_rpm=0)
+    run_collection(FakeProvider(client=client), "queries.csv", "responses.csv")
+
+    assert client.quota.calls == 3
+    with open("responses.csv", newline="", encoding="utf-8") as f:
+        rows = list(csv.DictReader(f))
+    assert [r["query_id"] for r in rows] == ["1", "2", "3", "4", "5"]
+    assert rows[1]["response_text"] == "from an earlier run"
@@ -0,0 +1,77 @@
+import csv
+import json
+import os
+
+import pytest
+
+from collect_responses import run_collection
+from fake_client import FakeBatchServer, FakeProvider
+from response_cache import ResponseCache
+
+
+class RecordingProvider(FakeProvider):
+    """Fake provider that counts submitted jobs and can drop the connection while polling"""
+
+    def __init__(self, fail_polls=0):
+        super().__init__(batch_server=FakeBatchServer(polls_to_finish=2))
+        self.submitted = []
+        self.fail_polls = fail_polls
+
+    def submit_batch(self, jsonl_path):
+        job_id = super().submit_batch(jsonl_path)
+        self.submitted.append(job_id)
+        return job_id
+
+    def batch_status(self, job_id):
+        if self.fail_polls:
+            self.fail_polls -= 1
+            raise ConnectionError("connection dropped while polling")
+        return super().batch_status(job_id)
+
+
+def write_queries(texts):
+    with open("queries.csv", "w", newline="", encoding="utf-8") as f:
+        writer = csv.DictWriter(f, fieldnames=["query_id", "query_text", "topic"])
+        writer.writeheader()
+        writer.writerows({"query_id": str(i), "query_text": text, "topic": "Fit/Use"}
+                         for i, text in enumerate(texts, 1))
+
+
+def read_responses(path="responses.csv"):
+    with open(path, newline="", encoding="utf-8") as f:
+        return {r["query_id"]: r["response_text"] for r in csv.DictReader(f)}
+
+
+def test_interrupted_batch_reattaches_to_the_saved_job(workdir):
+    write_queries([f"Best password manager #{i}?" for i in range(1, 5)])
+
+    first = RecordingProvider(fail_polls=1)
+    with pytest.raises(ConnectionError):
+        run_collection(first, "queries.csv", "responses.csv", batch=True, poll_seconds=0)
+    assert len(first.submitted) == 1
+    with open("responses.csv.batch.json", encoding="utf-8") as f:
+        assert json.load(f)["job_id"] == first.submitted[0]
+
+    second = RecordingProvider()
+    run_collection(second, "queries.csv", "responses.csv", batch=True, poll_seconds=0)
+    assert second.submitted == []   # no second (paid) job
+    assert not os.path.exists("responses.csv.batch.json")
+    rows = read_responses()
+    assert list(rows) == ["1", "2", "3", "4"]
+    assert not any(text.startswith("ERROR:") for text in rows.values())
+
+
+def test_cache_hits_skip_the_batch_and_failures_become_error_rows(workdir):
+    write_queries(["Best password manager?", "Please FAIL this one"])
+    cache = ResponseCache()
+    cache.put("fake", "fake-model", "Best password manager?", "Bitwarden is popular.", 5)
+    cache.close()
+
+    provider = RecordingProvider()
+    run_collection(provider, "queries.csv", "responses.csv", batch=True, poll_seconds=0)
+
+    with open(os.path.join(provider.batch_server.root, f"{provider.submitted[0]}.json"), encoding="utf-8") as f:
+        assert [r["custom_id"] for r in json.load(f)["requests"]] == ["2"]
+    rows = read_responses()
+    assert rows["1"] == "Bitwarden is popular."
+    assert rows["2"].startswith("ERROR:")
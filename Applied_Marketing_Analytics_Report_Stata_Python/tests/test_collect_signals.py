@@ -0,0 +1,111 @@
+import csv
+import filecmp
+import os
+import shutil
+
+import pytest
+
+import collect_signals
+from fake_signals import FakeSignalBackend
+from signal_backends import MissingSignal
+
+BRANDS = {"Bitwarden": [r"bitwarden"], "Keeper": [r"keeper"], "Vaultly": [r"vaultly"]}
+ALL_FAKE = {kind: "fake" for kind in FakeSignalBackend.kinds}
+
+
+class InstantSignals(FakeSignalBackend):
+    """The fake signal services without latency, errors or a rate budget"""
+
+    requests_per_minute = 10 ** 6
+    fetched = 0
+
+    def __init__(self):
+        super().__init__(latency=0, error_prob=0, server_rpm=0)
+
+    async def fetch(self, kind, request, etag=None):
+        InstantSignals.fetched += 1
+        return await super().fetch(kind, request, etag)
+
+
+class NoSeoScore(InstantSignals):
+    """PageSpeed answering with a null score: Lighthouse could not audit the page"""
+
+    async def fetch(self, kind, request, etag=None):
+        if kind == "seo":
+            InstantSignals.fetched += 1
+            raise MissingSignal(f"PageSpeed has no SEO score for {request['url']}: NO_FCP")
+        return await super().fetch(kind, request, etag)
+
+
+@pytest.fixture
+def signals_dir(workdir, monkeypatch):
+    os.makedirs("data")
+    with open("brands.csv", "w", newline="", encoding="utf-8") as f:
+        csv.writer(f).writerows([("brand", "alias")] + [(b, a[0]) for b, a in BRANDS.items()])
+    with open("domains.csv", "w", newline="", encoding="utf-8") as f:
+        f.write("brand,domain\nVaultly,vaultly.example\n")
+    with open("data/queries.csv", "w", newline="", encoding="utf-8") as f:
+        writer = csv.writer(f)
+        writer.writerow(["query_id", "query_text", "topic"])
+        writer.writerows([(1, "Cheapest password manager?", "Price"), (2, "Most secure one?", "Security")])
+    monkeypatch.setattr(collect_signals, "backend_class", lambda name: InstantSignals)
+    InstantSignals.fetched = 0
+    return workdir
+
+
+def collect(capsys, *args, backends=ALL_FAKE):
+    collect_signals.main(["--brands", "brands.csv", "--domains", "domains.csv",
+                          "--topic-hits", "data/topic_brand_hits.csv", "--brand-features", "data/brand_features.csv",
+                          *args], backends=backends)
+    return capsys.readouterr().out
+
+
+def stale_counts(out):
+    return {line.split()[0]: int(line.split()[1]) for line in out.splitlines() if " stale (" in line}
+
+
+def test_second_run_finds_nothing_stale(signals_dir, capsys):
+    first = collect(capsys)
+    # 3 brands x 2 topics x 5 channels, 3 brands x 2 review sites, 3 domains
+    assert stale_counts(first) == {"hits": 30, "rating": 6, "seo": 3}
+    assert InstantSignals.fetched == 39
+    shutil.copy("data/topic_brand_hits.csv", "hits.csv")
+    shutil.copy("data/brand_features.csv", "features.csv")
+
+    second = collect(capsys)
+    assert stale_counts(second) == {"hits": 0, "rating": 0, "seo": 0}
+    assert "Refreshed" not in second
+    assert InstantSignals.fetched == 39
+    assert filecmp.cmp("data/topic_brand_hits.csv", "hits.csv", shallow=False)
+    assert filecmp.cmp("data/brand_features.csv", "features.csv", shallow=False)
+
+
+def test_expired_values_are_revalidated_as_not_modified(signals_dir, capsys):
+    collect(capsys)
+    out = collect(capsys, "--max-age-days", "0")
+    assert stale_counts(out) == {"hits": 30, "rating": 6, "seo": 3}
+    assert "0 fetched, 39 not modified" in out
+    assert stale_counts(collect(capsys)) == {"hits": 0, "rating": 0, "seo": 0}
+
+
+def test_missing_seo_score_keeps_the_current_value(signals_dir, capsys, sleeps, monkeypatch):
+    collect(capsys)
+    with open("data/brand_features.csv", newline="", encoding="utf-8") as f:
+        before = {row["brand"]: row["lighthouse_seo_b"] for row in csv.DictReader(f)}
+
+    monkeypatch.setattr(collect_signals, "backend_class", lambda name: NoSeoScore)
+    InstantSignals.fetched = 0
+    out = collect(capsys, "--max-age-days", "0")
+    assert "3 without a value, 0 failed" in out
+    assert InstantSignals.fetched == 39   # a null score is not retried
+    assert not any(sleeps)   # no backoff
+    with open("data/brand_features.csv", newline="", encoding="utf-8") as f:
+        assert {row["brand"]: row["lighthouse_seo_b"] for row in csv.DictReader(f)} == before
+
+
+def test_nothing_is_written_while_cells_have_no_value(signals_dir, capsys, monkeypatch):
+    monkeypatch.setattr(collect_signals, "backend_class", lambda name: NoSeoScore)
+    with pytest.raises(SystemExit):
+        collect(capsys)
+    assert "cells have no value yet" in capsys.readouterr().out
+    assert not os.path.exists("data/brand_features.csv")
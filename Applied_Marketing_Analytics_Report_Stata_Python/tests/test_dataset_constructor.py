@@ -0,0 +1,79 @@
+import csv
+import filecmp
+import glob
+import os
+import shutil
+
+import pandas as pd
+import pytest
+
+import dataset_constructor
+from benchmark_pipeline import SOURCES, generate
+from brand_matcher import load_brands
+from dataset_files import OUT_FILE, OUT_PARQUET_FILE, OUT_TEXTS_FILE, SOURCES_FILE
+from extract_mentions import extract_mentions
+
+
+@pytest.fixture
+def corpus(workdir):
+    generate(".", n_queries=60, n_brands=8, seed=5)
+    # Texts the CSV writers have to quote: commas, quotes, line breaks and non-ASCII
+    path = f"data/responses_{SOURCES[0]}.csv"
+    with open(path, newline="", encoding="utf-8") as f:
+        rows = list(csv.reader(f))
+    rows[1][3] = 'Try "Bitwarden", then 1Password;\nor İcloud keychain — ß, é\r'
+    rows[2][3] = ""
+    with open(path, "w", newline="", encoding="utf-8") as f:
+        csv.writer(f).writerows(rows)
+
+    brands = load_brands("data/brands.csv")
+    for source in SOURCES:
+        extract_mentions(f"data/responses_{source}.csv", f"data/mentions_{source}.csv", brands,
+                         workers=1, full=True)
+
+
+def build(engine, out_format="csv", partition=False):
+    dataset_constructor.main(out_format, engine, SOURCES_FILE, partition)
+
+
+def snapshot(path, name):
+    """Move a build output aside so that the other engine starts from a clean tree"""
+    shutil.move(path, name)
+    return name
+
+
+def test_duckdb_csv_is_byte_identical_to_pandas(corpus):
+    build("pandas")
+    expected = snapshot(OUT_FILE, "pandas.csv")
+    build("duckdb")
+    assert filecmp.cmp(OUT_FILE, expected, shallow=False)
+
+
+def csv_files(root):
+    return sorted(os.path.relpath(p, root) for p in glob.glob(f"{root}/**/*.csv", recursive=True))
+
+
+def test_partitioned_csv_is_byte_identical_to_pandas(corpus):
+    build("pandas", partition=True)
+    expected = snapshot(dataset_constructor.OUT_CSV_PARTITION_DIR, "pandas")
+    build("duckdb", partition=True)
+
+    files = csv_files(expected)
+    assert files == [f"source={s}/data_0.csv" for s in sorted(SOURCES)]
+    assert csv_files(dataset_constructor.OUT_CSV_PARTITION_DIR) == files
+    for f in files:
+        assert filecmp.cmp(os.path.join(dataset_constructor.OUT_CSV_PARTITION_DIR, f),
+                           os.path.join(expected, f), shallow=False), f
+
+
+def loaded(*paths):
+    # pandas stores the labels as categoricals, DuckDB as dictionary-encoded strings
+    df = dataset_constructor.load_dataset(*paths, with_text=True)
+    return df.astype({col: "str" for col in df.select_dtypes("category").columns})
+
+
+def test_duckdb_parquet_loads_like_pandas(corpus):
+    build("pandas", "parquet")
+    expected = loaded(snapshot(OUT_PARQUET_FILE, "pandas.parquet"), snapshot(OUT_TEXTS_FILE, "pandas_texts.parquet"))
+    build("duckdb", "parquet")
+    pd.testing.assert_frame_equal(loaded(), expected)
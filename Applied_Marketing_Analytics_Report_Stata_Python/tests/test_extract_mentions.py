@@ -0,0 +1,75 @@
+import csv
+import filecmp
+import json
+import random
+
+from brand_matcher import DEFAULT_BRANDS
+from extract_mentions import extract_mentions, manifest_path, response_hash
+
+BRANDS = list(DEFAULT_BRANDS)
+
+
+def write_responses(rows, path="responses.csv"):
+    with open(path, "w", newline="", encoding="utf-8") as f:
+        writer = csv.writer(f)
+        writer.writerow(["query_id", "response_text"])
+        writer.writerows(rows)
+
+
+def sampled_responses(n, seed=0):
+    """Repeated samples of five queries, each answer naming a couple of brands"""
+    rng = random.Random(seed)
+    return [(str(i % 5), " and ".join(rng.sample(BRANDS, 2)) + f" (sample {i})") for i in range(n)]
+
+
+def full_run():
+    extract_mentions("responses.csv", "full.csv", workers=1, full=True)
+    return "full.csv"
+
+
+def test_incremental_run_with_repeated_query_ids_equals_a_full_run(workdir):
+    rows = sampled_responses(40)
+    write_responses(rows)
+    assert extract_mentions("responses.csv", "mentions.csv", workers=1, chunk_size=7)["computed"] == 40
+
+    rows[3] = (rows[3][0], "no brand at all")
+    rows[12] = (rows[12][0], "Keeper only")
+    rows.insert(20, ("2", "a new sample naming NordPass"))
+    del rows[30]
+    write_responses(rows)
+    stats = extract_mentions("responses.csv", "mentions.csv", workers=1, chunk_size=7)
+
+    assert 0 < stats["computed"] < 40
+    assert filecmp.cmp("mentions.csv", full_run(), shallow=False)
+
+
+def test_manifest_tracks_every_occurrence(workdir):
+    rows = [("1", "Bitwarden"), ("1", "LastPass"), ("2", "Keeper")]
+    write_responses(rows)
+    extract_mentions("responses.csv", "mentions.csv", workers=1)
+
+    with open(manifest_path("mentions.csv"), encoding="utf-8") as f:
+        assert json.load(f)["responses"] == {"1": [response_hash("Bitwarden"), response_hash("LastPass")],
+                                             "2": [response_hash("Keeper")]}
+    # Swapping two samples of one query changes both occurrences
+    write_responses([("1", "LastPass"), ("1", "Bitwarden"), ("2", "Keeper")])
+    assert extract_mentions("responses.csv", "mentions.csv", workers=1) == {"reused": 1, "computed": 2}
+    assert filecmp.cmp("mentions.csv", full_run(), shallow=False)
+
+
+def test_manifest_with_one_hash_per_query_id_is_still_read(workdir):
+    write_responses([("1", "Bitwarden"), ("2", "Keeper")])
+    extract_mentions("responses.csv", "mentions.csv", workers=1)
+    with open(manifest_path("mentions.csv"), encoding="utf-8") as f:
+        manifest = json.load(f)
+    manifest["responses"] = {qid: hashes[0] for qid, hashes in manifest["responses"].items()}
+    with open(manifest_path("mentions.csv"), "w", encoding="utf-8") as f:
+        json.dump(manifest, f)
+
+    assert extract_mentions("responses.csv", "mentions.csv", workers=1) == {"reused": 2, "computed": 0}
+
+
+def test_worker_processes_write_the_same_table(workdir):
+    write_responses(sampled_responses(200, seed=1))
+    extract_mentions("responses.csv", "mentions.csv", workers=3, chunk_size=9, full=True)
+    assert filecmp.cmp("mentions.csv", full_run(), shallow=False)
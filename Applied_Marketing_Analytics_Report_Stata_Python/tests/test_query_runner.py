@@ -0,0 +1,84 @@
+import asyncio
+
+import pytest
+
+from fake_client import FakeClient, FakeProvider, FakeRateLimitError
+from query_runner import QueryRunner
+
+
+class AuthError(Exception):
+    pass
+
+
+def scripted(client, failures):
+    """call_model that raises the given exceptions first, then answers through the fake client"""
+    calls = []
+
+    async def call(prompt):
+        calls.append(prompt)
+        if len(calls) <= len(failures):
+            raise failures[len(calls) - 1]
+        return await client.complete(prompt)
+
+    call.calls = calls
+    return call
+
+
+def run(call_model, provider, queries, **kwargs):
+    runner = QueryRunner(call_model, provider.is_rate_limit, lambda e: isinstance(e, AuthError),
+                         requests_per_minute=600, tokens_per_minute=10 ** 6, **kwargs)
+    return runner, asyncio.run(runner.run(queries))
+
+
+@pytest.fixture
+def provider():
+    return FakeProvider(client=FakeClient(latency=0, jitter=0, error_prob=0, server_rpm=0))
+
+
+def query(qid="1"):
+    return {"query_id": qid, "query_text": f"Which password manager is best? #{qid}", "topic": "Fit/Use"}
+
+
+def test_rate_limit_backs_off_and_retries(provider, sleeps):
+    call = scripted(provider.client, [FakeRateLimitError("429"), FakeRateLimitError("429")])
+    runner, rows = run(call, provider, [query()])
+
+    assert len(call.calls) == 3
+    assert not rows[0]["response_text"].startswith("ERROR:")
+    # Linear waits (10s, then 20s) enforced through the shared limiter cooldown
+    cooldowns = [d for d in sleeps if d > 1]
+    assert cooldowns[0] == pytest.approx(10, abs=0.5)
+    assert cooldowns[1] == pytest.approx(20, abs=0.5)
+    # The rate was halved once (429s during a cooldown don't halve it again), then recovers
+    assert runner.limiter.scale == pytest.approx(0.55)
+
+
+def test_rate_limit_gives_up_after_max_retries(provider, sleeps):
+    call = scripted(provider.client, [FakeRateLimitError("429")] * 3)
+    with pytest.raises(FakeRateLimitError):
+        run(call, provider, [query()], max_retries=3)
+    assert len(call.calls) == 3
+
+
+def test_other_errors_back_off_exponentially_then_record_an_error_row(provider, sleeps):
+    call = scripted(provider.client, [RuntimeError("boom")] * 3)
+    _, rows = run(call, provider, [query()])
+
+    assert [d for d in sleeps if d >= 1] == [2, 4]
+    assert rows[0]["response_text"] == "ERROR: boom"
+
+
+def test_auth_error_before_any_success_is_fatal(provider, sleeps):
+    call = scripted(provider.client, [AuthError("invalid api key")])
+    with pytest.raises(AuthError):
+        run(call, provider, [query(str(i)) for i in range(1, 6)], max_in_flight=1)
+    # The run stopped at the first call instead of failing every query
+    assert len(call.calls) == 1
+
+
+def test_auth_error_after_earlier_successes_is_retried(provider, sleeps):
+    call = scripted(provider.client, [AuthError("invalid api key")])
+    _, rows = run(call, provider, [query()], previously_completed=1)
+
+    assert len(call.calls) == 2
+    assert not rows[0]["response_text"].startswith("ERROR:")
@@ -0,0 +1,66 @@
+import csv
+
+import pytest
+
+from collect_responses import run_collection
+from fake_client import FakeClient, FakeProvider
+from response_cache import ResponseCache
+
+
+@pytest.fixture
+def cache(workdir):
+    cache = ResponseCache()
+    yield cache
+    cache.close()
+
+
+def test_hit_needs_the_same_provider_model_prompt_and_params(cache):
+    cache.put("fake", "m1", "prompt", "answer", 12, {"temperature": 0.2, "top_p": 1})
+
+    assert cache.get("fake", "m1", "prompt", {"top_p": 1, "temperature": 0.2}) == ("answer", 12)
+    assert cache.get("fake", "m1", "prompt", {"temperature": 0.7, "top_p": 1}) is None
+    assert cache.get("fake", "m1", "prompt") is None
+    assert cache.get("fake", "m2", "prompt", {"temperature": 0.2, "top_p": 1}) is None
+    assert cache.get("other", "m1", "prompt", {"temperature": 0.2, "top_p": 1}) is None
+    assert (cache.hits, cache.misses) == (1, 4)
+
+
+def test_least_recently_used_entries_are_evicted_over_the_size_limit(workdir):
+    cache = ResponseCache(max_mb=0.001)   # ~1 KB
+    for i in range(3):
+        cache.put("fake", "m", f"prompt {i}", "x" * 400)
+    cache.get("fake", "m", "prompt 0")
+    cache.evict()
+    assert cache.get("fake", "m", "prompt 0") is not None
+    assert cache.get("fake", "m", "prompt 1") is None
+    cache.close()
+
+
+def write_queries(n=4):
+    with open("queries.csv", "w", newline="", encoding="utf-8") as f:
+        writer = csv.DictWriter(f, fieldnames=["query_id", "query_text", "topic"])
+        writer.writeheader()
+        writer.writerows({"query_id": str(i), "query_text": f"Best password manager #{i}?", "topic": "Fit/Use"}
+                         for i in range(1, n + 1))
+
+
+def collect(output_file, params=None):
+    client = FakeClient(latency=0, jitter=0, error_prob=0, server_rpm=0)
+    run_collection(FakeProvider(client=client, params=params), "queries.csv", output_file)
+    with open(output_file, newline="", encoding="utf-8") as f:
+        return client.quota.calls, [r["response_text"] for r in csv.DictReader(f)]
+
+
+def test_collections_reuse_cached_answers_until_params_change(workdir, sleeps):
+    write_queries()
+    calls, first = collect("a.csv", {"temperature": 0.2})
+    assert calls == 4
+
+    # Another output file, same requests: answered from the cache
+    calls, second = collect("b.csv", {"temperature": 0.2})
+    assert calls == 0
+    assert second == first
+
+    # Different generation parameters are different requests
+    calls, _ = collect("c.csv", {"temperature": 0.9})
+    assert calls == 4
@@ -0,0 +1,68 @@
+import csv
+import random
+
+import pytest
+
+from brand_matcher import DEFAULT_BRANDS
+from dataset_constructor import load_sources
+from extract_mentions import extract_mentions
+from response_index import ResponseIndex
+from test_brand_matcher import BRANDS, random_texts
+
+TOPICS = ["Fit/Use", "Security", "Price"]
+
+
+def write_source(name, texts):
+    path = f"responses_{name}.csv"
+    with open(path, "w", newline="", encoding="utf-8") as f:
+        writer = csv.writer(f)
+        writer.writerow(["query_id", "query_text", "topic", "response_text"])
+        writer.writerows((i, f"query {i}", TOPICS[i % 3], text) for i, text in enumerate(texts, 1))
+    return path
+
+
+def extracted(name, brands):
+    extract_mentions(f"responses_{name}.csv", f"mentions_{name}.csv", brands, workers=1, full=True)
+    with open(f"mentions_{name}.csv", newline="", encoding="utf-8") as f:
+        return list(csv.DictReader(f))
+
+
+def indexed(index, name, brands):
+    return [{k: str(v) for k, v in row.items()} for row in index.mention_rows(brands, {"source": name})]
+
+
+@pytest.fixture
+def corpus(workdir):
+    texts = {"a": list(random_texts(600, seed=2)), "b": list(random_texts(400, seed=3))}
+    for name, source_texts in texts.items():
+        write_source(name, source_texts)
+        extracted(name, DEFAULT_BRANDS)
+    with open("sources.csv", "w", newline="", encoding="utf-8") as f:
+        f.write("source,responses_file,mentions_file\n")
+        f.writelines(f"{name},responses_{name}.csv,mentions_{name}.csv\n" for name in texts)
+    return texts
+
+
+@pytest.mark.parametrize("brands", [DEFAULT_BRANDS, BRANDS], ids=["default", "extended"])
+def test_mention_rows_equal_extract_mentions(corpus, brands):
+    expected = {name: extracted(name, brands) for name in corpus}
+    index = ResponseIndex("index")
+    index.update(load_sources("sources.csv"))
+    for name in corpus:
+        assert indexed(index, name, brands) == expected[name]
+
+
+def test_mention_rows_follow_incremental_updates(corpus):
+    index = ResponseIndex("index")
+    index.update(load_sources("sources.csv"))
+
+    rng = random.Random(4)
+    texts = corpus["a"]
+    for i in rng.sample(range(len(texts)), 150):
+        texts[i] = "Now it says Bitwarden and İcloud keychain" if i % 2 else "nothing"
+    write_source("a", texts[:550])   # the last 50 responses are removed
+    stats = ResponseIndex("index").update(load_sources("sources.csv"))
+    assert stats["removed"] == 50 and stats["skipped_sources"] == 1
+
+    index = ResponseIndex("index")
+    assert indexed(index, "a", BRANDS) == extracted("a", BRANDS)
@@ -0,0 +1,49 @@
+import csv
+import filecmp
+import random
+
+import pytest
+
+from brand_matcher import DEFAULT_BRANDS, BrandMatcher
+from extract_mentions import extract_mentions
+from fake_client import FakeClient, FakeProvider
+from streaming import run_streaming
+from test_brand_matcher import BRANDS, random_texts, reference_flags
+
+
+def pieces(text, rng):
+    """text cut at random points, including empty pieces and single characters"""
+    cuts = sorted(rng.randint(0, len(text)) for _ in range(rng.randint(0, 12)))
+    return [text[a:b] for a, b in zip([0] + cuts, cuts + [len(text)])]
+
+
+@pytest.mark.parametrize("brands", [DEFAULT_BRANDS, BRANDS], ids=["default", "extended"])
+def test_stream_scan_equals_find_on_the_whole_text(brands):
+    matcher = BrandMatcher(brands)
+    rng = random.Random(1)
+    for text in random_texts(3000, seed=1):
+        scan = matcher.scanner()
+        early = set()
+        for piece in pieces(text, rng):
+            new = scan.feed(piece)
+            assert not new & early   # each brand is reported once
+            early |= new
+        found = scan.finish()
+        expected = {i for i, flag in enumerate(reference_flags(brands, text)) if flag}
+        assert found == matcher.find(text) == expected, text
+        assert early <= found   # feed() never reports a brand that is not there
+
+
+def test_streamed_mentions_equal_extract_mentions(workdir, sleeps):
+    with open("queries.csv", "w", newline="", encoding="utf-8") as f:
+        writer = csv.DictWriter(f, fieldnames=["query_id", "query_text", "topic"])
+        writer.writeheader()
+        writer.writerows({"query_id": str(i), "query_text": f"Best password manager #{i}?", "topic": "Fit/Use"}
+                         for i in range(1, 31))
+    client = FakeClient(latency=0, jitter=0, error_prob=0, server_rpm=0)
+    run_streaming(FakeProvider(client=client), "queries.csv", "responses.csv", "mentions.csv")
+
+    extract_mentions("responses.csv", "full.csv", workers=1, full=True)
+    assert filecmp.cmp("mentions.csv", "full.csv", shallow=False)
+    # The manifest written alongside leaves nothing for a later extraction to scan
+    assert extract_mentions("responses.csv", "mentions.csv", workers=1) == {"reused": 30, "computed": 0}